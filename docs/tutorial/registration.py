@@ -5,6 +5,7 @@
 
 # +
 import matplotlib.pyplot as plt
+import numpy as np
 
 import hoa_tools.dataset
 import hoa_tools.registration
@@ -173,3 +174,54 @@ resampled_overview.isel(z=zslice, y=yslice).plot(ax=ax2, color="tab:red")
 ax2.set_title("")
 
 ax.set_title("Zoom (blue) and resampled overview (red) comparison")
+
+# ## Refining a registration in one step
+#
+# The same kind of registration is available as a single function,
+# `hoa_tools.registration.refine_registration`.
+# This runs the optimisation on the coarsest downsample levels of the data first,
+# and only fetches full resolution data for the last few iterations.
+
+refined_transform = hoa_tools.registration.refine_registration(zoom_voi, overview_voi)
+
+# Resample the overview VOI to the zoom VOI with the refined transform, and with the
+# original transform from the registration inventory.
+
+# +
+refined_overview = overview_voi.get_data_array_on_voi(
+    zoom_voi, interpolator=sitk.sitkLinear, transform=refined_transform.GetInverse()
+)
+inventory_overview = overview_voi.get_data_array_on_voi(
+    zoom_voi, interpolator=sitk.sitkLinear
+)
+# -
+
+# A simple measure of how well two images are aligned is the correlation between them.
+# The closer the correlation is to 1, the better the overview data matches the zoom data.
+
+
+# +
+def correlation(resampled):
+    """Correlation between the zoom data and resampled overview data."""
+    return np.corrcoef(zoom_array.values.ravel(), resampled.values.ravel())[0, 1]
+
+
+{
+    "Registration inventory": correlation(inventory_overview),
+    "SimpleITK registration": correlation(resampled_overview),
+    "refine_registration": correlation(refined_overview),
+}
+# -
+
+# And plot the same line through the data as above, resampled with the refined transform.
+
+# +
+fig, ax = plt.subplots()
+
+zoom_array.isel(z=zslice, y=yslice).plot(ax=ax, color="tab:blue")
+
+ax2 = ax.twinx()
+refined_overview.isel(z=zslice, y=yslice).plot(ax=ax2, color="tab:red")
+ax2.set_title("")
+
+ax.set_title("Zoom (blue) and refined overview (red) comparison")
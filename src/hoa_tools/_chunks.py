@@ -0,0 +1,506 @@
+"""
+Helpers for working with the chunk grid of remote arrays.
+
+Remote arrays are stored either in (z, y, x) order (N5 datasets) or in (x, y, z)
+order (OME-Zarr datasets). `LevelArray` hides this difference, so that all shapes,
+chunk indices and regions are given in (z, y, x) order, matching the dimensions of
+`Dataset.data_array`.
+"""
+
+import asyncio
+import concurrent.futures
+import itertools
+import threading
+from collections import OrderedDict
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from math import floor, prod
+from typing import Any, TypeVar
+
+import dask.array.core
+import dask.base
+import numpy as np
+import numpy.typing as npt
+import zarr
+from zarr.core.sync import sync
+
+ChunkIndex = tuple[int, int, int]
+Region = tuple[slice, slice, slice]
+T = TypeVar("T")
+
+# Default maximum size of the decoded chunks cached by all level arrays
+_CHUNK_CACHE_BYTES = 2**26
+
+
+class LevelArray:
+    """
+    A single downsample level of a remote array, indexed in (z, y, x) order.
+    """
+
+    def __init__(self, array: zarr.Array[Any], *, transposed: bool) -> None:
+        """
+        Create a level array.
+
+        Parameters
+        ----------
+        array :
+            Remote array.
+        transposed :
+            If True, the remote array is stored in (x, y, z) order.
+
+        """
+        self._array = array
+        self._transposed = transposed
+
+    def _to_zyx(self, value: Sequence[int]) -> tuple[int, int, int]:
+        value = tuple(value)
+        if self._transposed:
+            value = value[::-1]
+        return value  # type: ignore[return-value]
+
+    @property
+    def shape(self) -> tuple[int, int, int]:
+        """
+        Shape of the array.
+        """
+        return self._to_zyx(self._array.shape)
+
+    @property
+    def chunks(self) -> tuple[int, int, int]:
+        """
+        Shape of a single storage chunk.
+        """
+        return self._to_zyx(self._array.chunks)
+
+    @property
+    def dtype(self) -> np.dtype[Any]:
+        """
+        Data type of the array.
+        """
+        return self._array.dtype
+
+    def clip(self, lower: Sequence[int], upper: Sequence[int]) -> Region:
+        """
+        Get the region between two corners, clipped to the bounds of the array.
+        """
+        return tuple(  # type: ignore[return-value]
+            slice(min(max(lo, 0), s), min(max(up, 0), s))
+            for lo, up, s in zip(lower, upper, self.shape, strict=True)
+        )
+
+    def chunk_indices(self, region: Region) -> list[ChunkIndex]:
+        """
+        Get the indices of all chunks that intersect a region.
+
+        The region must already be clipped to the bounds of the array.
+        """
+        ranges = [
+            range(sl.start // c, -(-sl.stop // c)) if sl.stop > sl.start else range(0)
+            for sl, c in zip(region, self.chunks, strict=True)
+        ]
+        return list(itertools.product(*ranges))  # type: ignore[arg-type]
+
+    def chunk_region(self, index: ChunkIndex) -> Region:
+        """
+        Get the region covered by a single chunk, clipped to the bounds of the array.
+        """
+        return tuple(  # type: ignore[return-value]
+            slice(i * c, min((i + 1) * c, s))
+            for i, c, s in zip(index, self.chunks, self.shape, strict=True)
+        )
+
+    def read(self, region: Region) -> npt.NDArray[np.generic]:
+        """
+        Read a region of the array.
+        """
+        if self._transposed:
+            return self._array[region[::-1]].T  # type: ignore[union-attr, return-value]
+        return self._array[region]  # type: ignore[return-value]
+
+    async def read_async(self, region: Region) -> npt.NDArray[np.generic]:
+        """
+        Read a region of the array, without blocking the running event loop.
+
+        The remote store must have been opened in the running event loop.
+        """
+        array = self._array.async_array
+        if self._transposed:
+            return (await array.getitem(region[::-1])).T  # type: ignore[union-attr, return-value]
+        return await array.getitem(region)  # type: ignore[return-value]
+
+    def read_cached(
+        self, region: Region, *, max_workers: int
+    ) -> npt.NDArray[np.generic]:
+        """
+        Read a region of the array, re-using recently decoded chunks.
+
+        Whole chunks that intersect the region and are not in the cache are
+        fetched and decoded concurrently, with at most ``2 * max_workers`` in
+        memory at once. Each chunk is copied into the result as soon as it
+        arrives.
+
+        Fetched chunks are only added to the cache if all the chunks that
+        intersect the region fit in it together. Otherwise reading the region
+        would evict its own chunks before they could be re-used.
+        """
+        indices = self.chunk_indices(region)
+        data = np.empty([sl.stop - sl.start for sl in region], dtype=self.dtype)
+
+        def paste(index: ChunkIndex, chunk: npt.NDArray[np.generic]) -> None:
+            chunk_region = self.chunk_region(index)
+            overlap = intersect(region, chunk_region)
+            data[_relative_to(overlap, region)] = chunk[
+                _relative_to(overlap, chunk_region)
+            ]
+
+        # Chunks are cached for all level arrays together, so keys include the array
+        array_key = (str(self._array.store_path), self._transposed)
+        missing = []
+        for index in indices:
+            chunk = _CHUNK_CACHE.get((*array_key, index))
+            if chunk is None:
+                missing.append(index)
+            else:
+                paste(index, chunk)
+
+        chunk_bytes = prod(self.chunks) * self.dtype.itemsize
+        cache = len(indices) * chunk_bytes <= _CHUNK_CACHE.max_bytes
+        for index, chunk in self.map_chunks(
+            lambda chunk: chunk, missing, max_workers=max_workers
+        ):
+            paste(index, chunk)
+            if cache:
+                _CHUNK_CACHE.put((*array_key, index), chunk)
+        return data
+
+    def task_shape(
+        self,
+        *,
+        storage_chunks_per_task: int | Sequence[int] = 1,
+        task_bytes: int | None = None,
+    ) -> tuple[int, int, int]:
+        """
+        Get the shape of a single dask task.
+
+        Task shapes are always a whole number of storage chunks along each axis,
+        so no storage chunk is fetched by more than one task.
+
+        Parameters
+        ----------
+        storage_chunks_per_task :
+            Number of storage chunks along each axis in a single task.
+            Either a single number for all axes, or one number per axis.
+        task_bytes :
+            Maximum (uncompressed) size of a single task in bytes. Each task
+            contains at least one storage chunk, even if that is bigger.
+            If given, ``storage_chunks_per_task`` must not be given.
+
+        """
+        if task_bytes is None:
+            if isinstance(storage_chunks_per_task, int):
+                storage_chunks_per_task = (storage_chunks_per_task,) * len(self.chunks)
+            if (
+                len(storage_chunks_per_task) != len(self.chunks)
+                or min(storage_chunks_per_task) < 1
+            ):
+                msg = (
+                    "storage_chunks_per_task must be a positive integer, "
+                    "or three positive integers"
+                )
+                raise ValueError(msg)
+            return tuple(  # type: ignore[return-value]
+                n * c for n, c in zip(storage_chunks_per_task, self.chunks, strict=True)
+            )
+
+        if storage_chunks_per_task != 1:
+            msg = "Only one of storage_chunks_per_task and task_bytes can be given"
+            raise ValueError(msg)
+        if task_bytes < 1:
+            msg = "task_bytes must be positive"
+            raise ValueError(msg)
+        chunk_bytes = prod(self.chunks) * self.dtype.itemsize
+        n_chunks = [-(-s // c) for s, c in zip(self.shape, self.chunks, strict=True)]
+        return tuple(  # type: ignore[return-value]
+            n * c
+            for n, c in zip(
+                _chunks_per_task(task_bytes // chunk_bytes, n_chunks),
+                self.chunks,
+                strict=True,
+            )
+        )
+
+    def to_dask(self, region: Region, *, task_shape: Sequence[int]) -> Any:
+        """
+        Get a lazy dask array of a region of the array.
+
+        The dask graph only contains tasks for the chunks that intersect the region,
+        so creating it does not depend on the size of the whole array.
+
+        Parameters
+        ----------
+        region :
+            Region to read. Must already be clipped to the bounds of the array.
+        task_shape :
+            Shape of a single task. Task boundaries are aligned to multiples of
+            this shape in the whole array, so that tasks line up with storage chunks.
+
+        """
+        chunks = tuple(
+            _task_sizes(sl.start, sl.stop, size)
+            for sl, size in zip(region, task_shape, strict=True)
+        )
+        name = "hoa-" + dask.base.tokenize(
+            str(self._array.store_path), self._transposed, region, chunks
+        )
+        return dask.array.core.from_array(  # type: ignore[no-untyped-call]
+            _RegionView(self, region),
+            chunks=chunks,
+            name=name,
+            meta=np.empty((0, 0, 0), dtype=self.dtype),
+        )
+
+    def read_chunk(self, index: ChunkIndex) -> npt.NDArray[np.generic]:
+        """
+        Read a single chunk of the array.
+        """
+        return self.read(self.chunk_region(index))
+
+    def map_chunks(
+        self,
+        func: Callable[[npt.NDArray[np.generic]], T],
+        indices: Iterable[ChunkIndex],
+        *,
+        max_workers: int,
+    ) -> Iterator[tuple[ChunkIndex, T]]:
+        """
+        Apply a function to chunks of the array, yielding results as they finish.
+
+        Chunks are read and passed to ``func`` in a pool of threads. Only a few
+        chunks are read ahead of the results being used, so memory use does not
+        depend on the number of chunks. Chunks are read in the order of
+        ``indices``, but results may be yielded in a different order.
+
+        Parameters
+        ----------
+        func :
+            Function to call on the data of each chunk.
+        indices :
+            Indices of the chunks.
+        max_workers :
+            Maximum number of chunks to read at once.
+
+        Yields
+        ------
+        index :
+            Index of the chunk.
+        result :
+            Result of calling ``func`` on the data of the chunk.
+
+        """
+        indices = iter(indices)
+        pending: dict[concurrent.futures.Future[T], ChunkIndex] = {}
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            while True:
+                for index in itertools.islice(indices, 2 * max_workers - len(pending)):
+                    future = executor.submit(lambda i: func(self.read_chunk(i)), index)
+                    pending[future] = index
+                if not pending:
+                    return
+                done, _ = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                for future in done:
+                    yield pending.pop(future), future.result()
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+    async def _stored_chunk_size(self, index: ChunkIndex) -> int:
+        if self._transposed:
+            index = index[::-1]
+        store_path = self._array.store_path / self._array.metadata.encode_chunk_key(
+            index
+        )
+        try:
+            return await store_path.store.getsize(store_path.path)
+        except FileNotFoundError:
+            # Chunks that are not stored are filled with the fill value
+            return 0
+
+    def stored_chunk_sizes(self, indices: Sequence[ChunkIndex]) -> list[int]:
+        """
+        Get the number of bytes each chunk takes up in the remote store.
+
+        This does not fetch the chunks, but still makes one request per chunk.
+        """
+
+        async def get_sizes() -> list[int]:
+            return await asyncio.gather(
+                *[self._stored_chunk_size(index) for index in indices]
+            )
+
+        return sync(get_sizes())
+
+
+def intersect(a: Region, b: Region) -> Region:
+    """
+    Get the intersection of two regions.
+
+    The regions must overlap.
+    """
+    return tuple(  # type: ignore[return-value]
+        slice(max(sa.start, sb.start), min(sa.stop, sb.stop))
+        for sa, sb in zip(a, b, strict=True)
+    )
+
+
+def _relative_to(region: Region, origin: Region) -> Region:
+    """
+    Get a region relative to the start of another region.
+    """
+    return tuple(  # type: ignore[return-value]
+        slice(r.start - o.start, r.stop - o.start)
+        for r, o in zip(region, origin, strict=True)
+    )
+
+
+# (store path, transposed, chunk index) of a cached chunk
+_ChunkKey = tuple[str, bool, ChunkIndex]
+
+
+class _ChunkCache:
+    """
+    Least recently used cache of decoded chunks, limited by their total size.
+    """
+
+    def __init__(self, *, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self._chunks: OrderedDict[_ChunkKey, npt.NDArray[np.generic]] = OrderedDict()
+        self._n_bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: _ChunkKey) -> npt.NDArray[np.generic] | None:
+        with self._lock:
+            chunk = self._chunks.get(key)
+            if chunk is not None:
+                self._chunks.move_to_end(key)
+            return chunk
+
+    def put(self, key: _ChunkKey, chunk: npt.NDArray[np.generic]) -> None:
+        if chunk.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._chunks:
+                self._n_bytes -= self._chunks.pop(key).nbytes
+            self._chunks[key] = chunk
+            self._n_bytes += chunk.nbytes
+            self._evict()
+
+    def resize(self, max_bytes: int) -> None:
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._chunks.clear()
+            self._n_bytes = 0
+
+    def _evict(self) -> None:
+        """
+        Remove the least recently used chunks until the cache is small enough.
+        """
+        while self._n_bytes > self.max_bytes:
+            _, old_chunk = self._chunks.popitem(last=False)
+            self._n_bytes -= old_chunk.nbytes
+
+
+_CHUNK_CACHE = _ChunkCache(max_bytes=_CHUNK_CACHE_BYTES)
+
+
+def _chunks_per_task(max_chunks: int, n_chunks: Sequence[int]) -> list[int]:
+    """
+    Get the number of storage chunks along each axis in a single task.
+
+    Tasks are as close to cubes of storage chunks as possible, with at most
+    ``max_chunks`` storage chunks in total. Axes with fewer than ``n_chunks``
+    storage chunks in the whole array are covered by a single task, leaving
+    more chunks for the other axes.
+    """
+    per_task = [1] * len(n_chunks)
+    free = list(range(len(n_chunks)))
+    while free:
+        fixed = prod(per_task[i] for i in range(len(n_chunks)) if i not in free)
+        # Small tolerance so exact roots (e.g. 64 ** (1 / 3)) aren't rounded down
+        k = max(1, floor((max_chunks / fixed) ** (1 / len(free)) + 1e-9))
+        capped = [i for i in free if n_chunks[i] <= k]
+        if not capped:
+            for i in free:
+                per_task[i] = k
+            break
+        for i in capped:
+            per_task[i] = n_chunks[i]
+            free.remove(i)
+    return per_task
+
+
+def _task_sizes(start: int, stop: int, task_size: int) -> tuple[int, ...]:
+    """
+    Get the sizes of tasks covering [start, stop).
+
+    Task boundaries are at multiples of ``task_size``.
+    """
+    if stop <= start:
+        return (0,)
+    first_boundary = (start // task_size + 1) * task_size
+    boundaries = [start, *range(first_boundary, stop, task_size), stop]
+    return tuple(int(b) for b in np.diff(boundaries))
+
+
+class _RegionView:
+    """
+    A region of a level array, that dask can index like an array.
+    """
+
+    def __init__(self, level_array: LevelArray, region: Region) -> None:
+        self._level_array = level_array
+        self._region = region
+        self.shape = tuple(sl.stop - sl.start for sl in region)
+        self.dtype = level_array.dtype
+        self.ndim = 3
+
+    def __getitem__(
+        self, key: tuple[slice | int, ...] | slice | int
+    ) -> npt.NDArray[np.generic]:
+        """
+        Read part of the region.
+
+        Dask may merge indexing of the array into the keys, so integers and
+        slices with steps have to be handled, as well as plain slices.
+        """
+        if not isinstance(key, tuple):
+            key = (key,)
+        key = key + (slice(None),) * (self.ndim - len(key))
+
+        # Region to read, and the indexing applied to the data read from it
+        read_region = []
+        local_key: list[slice | int] = []
+        for sl, k, size in zip(self._region, key, self.shape, strict=True):
+            if isinstance(k, slice):
+                indices = range(*k.indices(size))
+                if len(indices) == 0:
+                    read_region.append(slice(sl.start, sl.start))
+                    local_key.append(slice(None))
+                    continue
+                lower = min(indices[0], indices[-1])
+                upper = max(indices[0], indices[-1]) + 1
+                stop = indices[-1] - lower + indices.step
+                local_key.append(
+                    slice(indices[0] - lower, stop if stop >= 0 else None, indices.step)
+                )
+            else:
+                lower = range(size)[k]
+                upper = lower + 1
+                local_key.append(0)
+            read_region.append(slice(sl.start + lower, sl.start + upper))
+
+        return self._level_array.read(tuple(read_region))[tuple(local_key)]  # type: ignore[arg-type]
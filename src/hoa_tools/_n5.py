@@ -40,16 +40,20 @@ class N5FSStore(FsspecStore):
     ) -> Buffer | None:
         if key.endswith(zarr_group_meta_key):
             key_new = key.replace(zarr_group_meta_key, n5_attrs_key)
-            value = group_metadata_to_zarr(await self._load_n5_attrs(key_new))
+            attrs = await self._load_n5_attrs(key_new)
+            if not attrs:
+                return None
+            value = group_metadata_to_zarr(attrs)
 
             return prototype.buffer.from_bytes(json_dumps(value))
 
         if key.endswith(zarr_array_meta_key):
             key_new = key.replace(zarr_array_meta_key, n5_attrs_key)
+            attrs = await self._load_n5_attrs(key_new)
+            if "dimensions" not in attrs:
+                return None
             top_level = key == zarr_array_meta_key
-            value = array_metadata_to_zarr(
-                await self._load_n5_attrs(key_new), top_level=top_level
-            )
+            value = array_metadata_to_zarr(attrs, top_level=top_level)
             return prototype.buffer.from_bytes(json_dumps(value))
 
         if key.endswith(zarr_attrs_key):
@@ -61,6 +65,10 @@ class N5FSStore(FsspecStore):
 
         return await super().get(key_new, prototype=prototype, byte_range=byte_range)
 
+    async def getsize(self, key: str) -> int:
+        key_new = invert_chunk_coords(key) if is_chunk_key(key) else key
+        return await super().getsize(key_new)
+
     async def get_partial_values(
         self,
         prototype: BufferPrototype,
@@ -128,7 +136,7 @@ class N5FSStore(FsspecStore):
         try:
             s = await super().get(path, prototype=default_buffer_prototype())
             if s is None:
-                raise RuntimeError(f"No N5 attributes at path {path}")
+                return {}
             return json_loads(s.to_bytes())
         except KeyError:
             return {}
@@ -379,19 +387,19 @@ class N5ChunkWrapper(Codec):  # type: ignore[misc]
         if self._compressor:
             chunk = self._compressor.decode(chunk)
 
-        # more expensive byteswap
-        chunk = self._from_big_endian(chunk)  # type: ignore[assignment]
-
         # read partial chunk
         if chunk_shape != self.chunk_shape:
-            chunk = np.frombuffer(chunk, dtype=self.dtype)  # type: ignore[assignment]
-            chunk = chunk.reshape(chunk_shape)  # type: ignore[attr-defined]
+            # Byteswap while copying into the padded chunk, to only copy once
+            partial_chunk = np.frombuffer(
+                chunk, dtype=self.dtype.newbyteorder(">")
+            ).reshape(chunk_shape)
             complete_chunk = np.zeros(self.chunk_shape, dtype=self.dtype)
             target_slices = tuple(slice(0, s) for s in chunk_shape)
-            complete_chunk[target_slices] = chunk
-            chunk = complete_chunk  # type: ignore[assignment]
+            complete_chunk[target_slices] = partial_chunk
+            return complete_chunk
 
-        return chunk  # type: ignore[return-value]
+        # more expensive byteswap
+        return self._from_big_endian(chunk)
 
     @staticmethod
     def _create_header(chunk: npt.NDArray[Any]) -> bytes:
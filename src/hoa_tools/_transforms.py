@@ -0,0 +1,73 @@
+"""
+Helpers for applying SimpleITK transforms to many points at once.
+
+Points are given as (N, 3) arrays, with columns in (z, y, x) order. This is the
+order that transforms in the registration inventory act on.
+"""
+
+import itertools
+
+import numpy as np
+import numpy.typing as npt
+import SimpleITK as sitk
+
+# Selects the lower (False) or upper (True) value along each axis for
+# each of the 8 corners of a box
+CORNER_MASKS = np.array(list(itertools.product([False, True], repeat=3)))
+
+
+def affine_matrix(transform: sitk.Transform) -> npt.NDArray[np.float64] | None:
+    """
+    Get the 4x4 homogeneous matrix of a transform.
+
+    Returns `None` if the transform is not affine.
+    """
+    if type(transform) is sitk.Transform:
+        transform = transform.Downcast()  # type: ignore[no-untyped-call]
+
+    if isinstance(transform, sitk.CompositeTransform):
+        # Composite transforms apply the last transform added first
+        matrix = np.eye(4)
+        for i in range(transform.GetNumberOfTransforms()):  # type: ignore[no-untyped-call]
+            component = affine_matrix(transform.GetNthTransform(i))  # type: ignore[no-untyped-call]
+            if component is None:
+                return None
+            matrix = matrix @ component
+        return matrix
+
+    if isinstance(transform, sitk.TranslationTransform):
+        matrix = np.eye(4)
+        matrix[:3, 3] = transform.GetOffset()  # type: ignore[no-untyped-call]
+        return matrix
+
+    if hasattr(transform, "GetMatrix"):
+        # Transforms derived from itk::MatrixOffsetTransformBase map
+        # x -> M (x - c) + c + t
+        linear = np.array(transform.GetMatrix()).reshape(3, 3)
+        center = np.array(transform.GetCenter())  # type: ignore[attr-defined]
+        translation = np.array(transform.GetTranslation())  # type: ignore[attr-defined]
+        matrix = np.eye(4)
+        matrix[:3, :3] = linear
+        matrix[:3, 3] = translation + center - linear @ center
+        return matrix
+
+    return None
+
+
+def transform_points(
+    transform: sitk.Transform, points: npt.ArrayLike
+) -> npt.NDArray[np.float64]:
+    """
+    Apply a transform to an (N, 3) array of points.
+
+    Affine transforms (including composites of affine transforms) are applied as
+    a single matrix multiplication. Other transforms are applied point by point.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    matrix = affine_matrix(transform)
+    if matrix is None:
+        return np.array(
+            [transform.TransformPoint(p) for p in points.tolist()],  # type: ignore[no-untyped-call]
+            dtype=np.float64,
+        ).reshape(points.shape)
+    return points @ matrix[:3, :3].T + matrix[:3, 3]
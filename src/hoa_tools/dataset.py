@@ -11,25 +11,31 @@ To get a [`Dataset`][hoa_tools.dataset.Dataset], use the
 """
 
 import warnings
+import weakref
 from functools import cached_property
 from pathlib import Path
-from typing import Literal
-
-import dask.array.core
-import gcsfs
-import networkx as nx
-import numpy as np
-import xarray as xr
-import zarr.abc.store
-import zarr.storage
+from typing import TYPE_CHECKING, Literal
+
 from pydantic import ValidationError
 
-from hoa_tools._n5 import N5FSStore
 from hoa_tools.metadata import HOAMetadata
-from hoa_tools.types import PhysicalCoordinate
+
+if TYPE_CHECKING:
+    # Heavy dependencies are imported where they are first used, to keep
+    # importing this module (and looking up dataset metadata) fast
+    import asyncio
+
+    import xarray as xr
+    import zarr
+    import zarr.abc.store
+
+    from hoa_tools._chunks import LevelArray
 
 __all__ = ["Dataset", "get_dataset"]
 
+# Number of downsample levels to look for in the remote store at once
+_LEVEL_BATCH_SIZE = 8
+
 
 _DATASETS: dict[str, "Dataset"]
 
@@ -124,10 +130,7 @@ class Dataset(HOAMetadata):
         """
         import hoa_tools.registration  # noqa: PLC0415
 
-        dataset_names = nx.node_connected_component(
-            hoa_tools.registration.Inventory._graph.to_undirected(),  # noqa: SLF001
-            self.name,
-        )
+        dataset_names = hoa_tools.registration.Inventory._get_component(self.name)  # noqa: SLF001
         return {get_dataset(name) for name in dataset_names}
 
     @property
@@ -139,30 +142,101 @@ class Dataset(HOAMetadata):
         raise RuntimeError("URL must start with n5:// or zarr://")
 
     @cached_property
-    def _remote_store(self) -> zarr.Group:
+    def _remote_store(self) -> "zarr.Group":
         """
         Remote data store.
         """
-        gcs_url = self.data.gcs_url
-        gcs_path = gcs_url.removeprefix("n5://gs://").removeprefix("zarr://gs://")
+        import zarr  # noqa: PLC0415
 
-        # n5://gs://ucl-hip-ct-35a68e99feaae8932b1d44da0358940b/S-20-29/heart/2.5um_VOI-01_bm05/
-        bucket, path = gcs_path.split("/", maxsplit=1)
-        fs = gcsfs.GCSFileSystem(
-            project="ucl-hip-ct",
-            token="anon",  # noqa: S106
-            access="read_only",
-            asynchronous=True,
-        )
+        return zarr.open_group(self._new_remote_store(), mode="r", zarr_format=2)
+
+    def _new_remote_store(self, *, cached: bool = True) -> "zarr.abc.store.Store":
+        """
+        Open a new connection to the remote data store.
+
+        If a mirror containing a copy of this dataset has been added with
+        [`add_mirror`][hoa_tools.storage.add_mirror], the copy is opened instead.
+        Metadata is read from the local metadata cache where possible.
+
+        Parameters
+        ----------
+        cached :
+            If True, re-use a cached connection from the same thread. Cached
+            connections may be bound to another event loop in the same thread,
+            so this should be False for connections used in a user event loop.
+
+        """
+        import zarr.abc.store  # noqa: PLC0415
+        import zarr.storage  # noqa: PLC0415
+
+        from hoa_tools._n5 import N5FSStore  # noqa: PLC0415
+        from hoa_tools.storage import _cache_metadata, _open_url  # noqa: PLC0415
+
+        # e.g. n5://gs://ucl-hip-ct-35a68e99feaae8932b1d44da0358940b/S-20-29/heart/2.5um_VOI-01_bm05/
+        url = self.data.gcs_url.removeprefix(f"{self._remote_fmt}://")
+        fs, path = _open_url(url, cached=cached)
         store: zarr.abc.store.Store
         if self._remote_fmt == "n5":
-            store = N5FSStore(fs=fs, path=f"/{bucket}", read_only=True)
+            store = N5FSStore(fs=fs, path=path, read_only=True)
         elif self._remote_fmt == "zarr":
-            store = zarr.storage.FsspecStore(fs=fs, path=f"/{bucket}", read_only=True)
+            store = zarr.storage.FsspecStore(fs=fs, path=path, read_only=True)
+
+        return _cache_metadata(store, name=self.name, url=self.data.gcs_url)
+
+    @cached_property
+    def _async_levels(
+        self,
+    ) -> "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[int, LevelArray]]":
+        """
+        Downsample levels opened in each event loop, by downsample level.
+        """
+        return weakref.WeakKeyDictionary()
+
+    @cached_property
+    def _async_groups(
+        self,
+    ) -> "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, zarr.AsyncGroup]":
+        """
+        Remote data store opened in each event loop.
+        """
+        return weakref.WeakKeyDictionary()
 
-        return zarr.open_group(store, mode="r", path=path, zarr_format=2)
+    async def _async_level_array(self, *, downsample_level: int) -> "LevelArray":
+        """
+        Get the remote array at a given level, for reading in the running event loop.
 
-    def _remote_array(self, *, downsample_level: int) -> zarr.Array:
+        Connections to the remote store are bound to the event loop they are
+        created in, so each event loop gets its own connection to the store.
+        Only the async methods of the returned array can be used.
+        """
+        import asyncio  # noqa: PLC0415
+
+        import zarr  # noqa: PLC0415
+        import zarr.api.asynchronous  # noqa: PLC0415
+
+        from hoa_tools._chunks import LevelArray  # noqa: PLC0415
+
+        if not downsample_level >= 0:
+            msg = "level must be >= 0"
+            raise ValueError(msg)
+
+        loop = asyncio.get_running_loop()
+        levels = self._async_levels.setdefault(loop, {})
+        if downsample_level not in levels:
+            if loop not in self._async_groups:
+                self._async_groups[loop] = await zarr.api.asynchronous.open_group(
+                    self._new_remote_store(cached=False), mode="r", zarr_format=2
+                )
+            array = await self._async_groups[loop].getitem(
+                self._level_key(downsample_level)
+            )
+            levels[downsample_level] = LevelArray(
+                zarr.Array(array),  # type: ignore[arg-type]
+                transposed=self._remote_fmt == "zarr",
+            )
+        return levels[downsample_level]
+
+    def _remote_array(self, *, downsample_level: int) -> "zarr.Array":
         """
         Get an object representing the data array in the remote Google Cloud Store.
         """
@@ -170,48 +244,275 @@ class Dataset(HOAMetadata):
             msg = "level must be >= 0"
             raise ValueError(msg)
 
+        return self._remote_store[self._level_key(downsample_level)]  # type: ignore[return-value]
+
+    def _level_key(self, downsample_level: int) -> str:
+        """
+        Key of a downsample level in the remote store.
+        """
         if self._remote_fmt == "n5":
-            key = f"s{downsample_level}"
-        else:
-            key = f"{downsample_level}"
-        return self._remote_store[key]  # type: ignore[return-value]
+            return f"s{downsample_level}"
+        return f"{downsample_level}"
+
+    @cached_property
+    def _levels(self) -> dict[int, "LevelArray"]:
+        """
+        All downsample levels available in the remote store.
+
+        The metadata for several levels is fetched concurrently, so most
+        datasets only need a single batch of requests.
+        """
+        from concurrent.futures import ThreadPoolExecutor  # noqa: PLC0415
+
+        from hoa_tools._chunks import LevelArray  # noqa: PLC0415
+        from hoa_tools.storage import _flush_metadata_cache  # noqa: PLC0415
+
+        def open_level(downsample_level: int) -> LevelArray | None:
+            try:
+                array = self._remote_array(downsample_level=downsample_level)
+            except KeyError:
+                return None
+            return LevelArray(array, transposed=self._remote_fmt == "zarr")
+
+        # Open the store before any threads use it
+        store = self._remote_store.store
+        levels: dict[int, LevelArray] = {}
+        try:
+            with ThreadPoolExecutor(max_workers=_LEVEL_BATCH_SIZE) as executor:
+                while True:
+                    start = len(levels)
+                    batch = executor.map(
+                        open_level, range(start, start + _LEVEL_BATCH_SIZE)
+                    )
+                    for downsample_level, level_array in enumerate(batch, start):
+                        if level_array is None:
+                            return levels
+                        levels[downsample_level] = level_array
+        finally:
+            # Write the metadata of all the levels to the cache at once
+            _flush_metadata_cache(store)
 
-    def data_array(self, *, downsample_level: int) -> xr.DataArray:
+    @property
+    def downsample_levels(self) -> list[int]:
+        """
+        Downsample levels available in the remote store.
+        """
+        return list(self._levels)
+
+    def data_array(
+        self,
+        *,
+        downsample_level: int,
+        storage_chunks_per_task: int | tuple[int, int, int] = 1,
+        task_bytes: int | None = None,
+    ) -> "xr.DataArray":
         """
         Get a DataArray representing the array for this image.
+
+        The DataArray is backed by a lazy dask array. By default each dask task
+        reads a single storage chunk, which gives very large task graphs for
+        large arrays. Several storage chunks can be read by each task by setting
+        either ``storage_chunks_per_task`` or ``task_bytes``.
+
+        Parameters
+        ----------
+        downsample_level :
+            Downsample level of the array.
+        storage_chunks_per_task :
+            Number of storage chunks along each axis read by a single dask task.
+            Either a single number for all axes, or one number per (z, y, x) axis.
+        task_bytes :
+            Maximum (uncompressed) size of a single dask task in bytes.
+            Tasks are always a whole number of storage chunks along each axis,
+            so each task reads at least one storage chunk.
+            If given, ``storage_chunks_per_task`` must not be given.
+
         """
-        remote_array = self._remote_array(downsample_level=downsample_level)
-        dask_array = dask.array.core.from_array(  # type: ignore[no-untyped-call]
-            remote_array, chunks=remote_array.chunks
+        level_array = self._level_array(downsample_level=downsample_level)
+        return self._to_data_array(
+            level_array,
+            downsample_level=downsample_level,
+            task_shape=level_array.task_shape(
+                storage_chunks_per_task=storage_chunks_per_task, task_bytes=task_bytes
+            ),
         )
-        if self._remote_fmt == "zarr":
-            dask_array = dask_array.T
 
+    def data_tree(
+        self,
+        *,
+        storage_chunks_per_task: int | tuple[int, int, int] = 1,
+        task_bytes: int | None = None,
+    ) -> "xr.DataTree":
+        """
+        Get a DataTree representing all the downsample levels of this image.
+
+        The tree has one child node per downsample level, named after the level
+        (``"0"``, ``"1"``, ...). Each node contains the same DataArray as
+        [`data_array`][hoa_tools.dataset.Dataset.data_array] for that level,
+        along with the ``downsample_level`` and ``voxel_size_um`` as attributes.
+
+        Metadata for all the levels is fetched when this is called,
+        but no data is fetched until it is accessed.
+
+        Parameters
+        ----------
+        storage_chunks_per_task, task_bytes :
+            How many storage chunks are read by a single dask task.
+            See [`data_array`][hoa_tools.dataset.Dataset.data_array].
+
+        """
+        import xarray as xr  # noqa: PLC0415
+
+        return xr.DataTree.from_dict(
+            {
+                f"{downsample_level}": xr.Dataset(
+                    {
+                        self.name: self._to_data_array(
+                            level_array,
+                            downsample_level=downsample_level,
+                            task_shape=level_array.task_shape(
+                                storage_chunks_per_task=storage_chunks_per_task,
+                                task_bytes=task_bytes,
+                            ),
+                        )
+                    },
+                    attrs={
+                        "downsample_level": downsample_level,
+                        "voxel_size_um": self.data.voxel_size_um * 2**downsample_level,
+                    },
+                )
+                for downsample_level, level_array in self._levels.items()
+            },
+            name=self.name,
+        )
+
+    def get_slice(
+        self,
+        *,
+        axis: Literal["z", "y", "x"],
+        index: int,
+        downsample_level: int,
+        max_workers: int = 8,
+    ) -> "xr.DataArray":
+        """
+        Get a single plane of the array for this image.
+
+        This gives the same result as
+        ``data_array(downsample_level=downsample_level).isel({axis: index})``,
+        but is much faster. Only the storage chunks that intersect the plane are
+        fetched, and they are fetched and decoded concurrently. Each chunk is
+        copied into the plane as soon as it arrives, so only a few whole chunks
+        are in memory at once.
+
+        Decoded chunks are kept in an in-memory cache shared by all datasets, so
+        getting neighbouring planes that intersect the same chunks doesn't fetch
+        them again. This only happens if all the chunks that intersect a plane fit
+        in the cache together, which is usually not the case for whole planes at
+        fine downsample levels with the default cache size. The cache size is set
+        with [`set_chunk_cache_bytes`][hoa_tools.storage.set_chunk_cache_bytes].
+
+        Parameters
+        ----------
+        axis :
+            Axis perpendicular to the plane.
+        index :
+            Index of the plane along ``axis``. Negative indices count back from
+            the end of the axis.
+        downsample_level :
+            Downsample level of the array.
+        max_workers :
+            Maximum number of chunks to fetch at once.
+
+        Returns
+        -------
+        data_array :
+            In-memory 2D data array.
+
+        """
+        import xarray as xr  # noqa: PLC0415
+
+        if axis not in ("z", "y", "x"):
+            msg = f"axis must be 'z', 'y' or 'x', not {axis!r}"
+            raise ValueError(msg)
+        if downsample_level not in self._levels:
+            msg = (
+                f"Downsample level {downsample_level} is not available for {self.name}"
+            )
+            raise ValueError(msg)
+        level_array = self._levels[downsample_level]
+        axis_index = "zyx".index(axis)
+        size = level_array.shape[axis_index]
+        if not -size <= index < size:
+            msg = f"index {index} is out of bounds for axis {axis} with size {size}"
+            raise IndexError(msg)
+        # Negative indices count back from the end, as with isel
+        index %= size
+
+        region = list(level_array.clip((0, 0, 0), level_array.shape))
+        region[axis_index] = slice(index, index + 1)
         spacing = self.data.voxel_size_um * 2**downsample_level
         return xr.DataArray(
-            dask_array,
+            level_array.read_cached(tuple(region), max_workers=max_workers),  # type: ignore[arg-type]
             name=self.name,
             dims=["z", "y", "x"],
             coords={
-                "z": xr.DataArray(
-                    data=(np.arange(dask_array.shape[0]) * spacing),
-                    dims=["z"],
-                    attrs={"units": "μm"},
-                ),
-                "y": xr.DataArray(
-                    data=(np.arange(dask_array.shape[1]) * spacing),
-                    dims=["y"],
-                    attrs={"units": "μm"},
-                ),
-                "x": xr.DataArray(
-                    data=(np.arange(dask_array.shape[2]) * spacing),
-                    dims=["x"],
-                    attrs={"units": "μm"},
-                ),
+                dim: _coordinate(
+                    dim, start=sl.start, size=sl.stop - sl.start, spacing=spacing
+                )
+                for dim, sl in zip(["z", "y", "x"], region, strict=True)
             },
+        ).isel({axis: 0})
+
+    def _to_data_array(
+        self,
+        level_array: "LevelArray",
+        *,
+        downsample_level: int,
+        task_shape: tuple[int, int, int],
+    ) -> "xr.DataArray":
+        """
+        Wrap a whole remote array in a DataArray.
+        """
+        import xarray as xr  # noqa: PLC0415
+
+        region = level_array.clip((0, 0, 0), level_array.shape)
+        spacing = self.data.voxel_size_um * 2**downsample_level
+        return xr.DataArray(
+            level_array.to_dask(region, task_shape=task_shape),
+            name=self.name,
+            dims=["z", "y", "x"],
+            coords={
+                dim: _coordinate(dim, start=0, size=size, spacing=spacing)
+                for dim, size in zip(["z", "y", "x"], level_array.shape, strict=True)
+            },
+        )
+
+    def _level_array(self, *, downsample_level: int) -> "LevelArray":
+        """
+        Get the remote array at a given level, indexed in (z, y, x) order.
+        """
+        from hoa_tools._chunks import LevelArray  # noqa: PLC0415
+
+        return LevelArray(
+            self._remote_array(downsample_level=downsample_level),
+            transposed=self._remote_fmt == "zarr",
         )
 
 
+def _coordinate(dim: str, *, start: int, size: int, spacing: float) -> "xr.DataArray":
+    """
+    Get physical coordinates along one dimension of an array.
+    """
+    import numpy as np  # noqa: PLC0415
+    import xarray as xr  # noqa: PLC0415
+
+    return xr.DataArray(
+        data=(np.arange(start, start + size) * spacing),
+        dims=[dim],
+        attrs={"units": "μm"},
+    )
+
+
 def _load_datasets_from_files(
     data_dir: Path, *, skip_invalid_meta: bool = False
 ) -> dict[str, Dataset]:
@@ -266,51 +567,10 @@ def change_metadata_directory(data_dir: Path, *, skip_invalid_meta: bool=False)
         Path to directory of metadata files.
     skip_invalid_meta : bool
         If True, skip metadata files that fail validation.
+
     """
     global _DATASETS  # noqa: PLW0603
     _DATASETS = _load_datasets_from_files(data_dir, skip_invalid_meta=skip_invalid_meta)
-    _populate_registrations_from_metadata(_DATASETS)
-
-
-def _populate_registrations_from_metadata(datasets: dict[str, Dataset]) -> None:
-    from hoa_tools.registration import Inventory, build_transform  # noqa: PLC0415
-
-    Inventory._clear()  # noqa: SLF001
-    for dataset_name in datasets:
-        dataset = _DATASETS[dataset_name]
-        if (registration := dataset.registration) is not None:
-            source_dataset = _DATASETS[registration.source_dataset]
-            if registration.target_dataset not in _DATASETS:
-                # Some datasets don't have their parent datasets release yet - only warn
-                # if we're expecting a parent dataset
-                if registration.source_dataset not in [
-                    "A129_lung_VOI-02_2.0um_bm18"
-                ] and not registration.source_dataset.startswith("LADAF-2021-17_brain"):
-                    warnings.warn(
-                        f"Did not find target dataset {registration.target_dataset} "
-                        f"in dataset inventory. "
-                        f"Not adding {registration.source_dataset} "
-                        "to registration inventory.",
-                        stacklevel=1,
-                    )
-                continue
-            target_dataset = _DATASETS[registration.target_dataset]
-            transform = build_transform(
-                translation=PhysicalCoordinate(
-                    x=registration.translation[0] * target_dataset.data.voxel_size_um,
-                    y=registration.translation[1] * target_dataset.data.voxel_size_um,
-                    z=registration.translation[2] * target_dataset.data.voxel_size_um,
-                ),
-                rotation_deg=registration.rotation,
-                scale=registration.scale
-                * target_dataset.data.voxel_size_um
-                / source_dataset.data.voxel_size_um,
-            )
-            Inventory.add_registration(
-                source_dataset=_DATASETS[registration.source_dataset],
-                target_dataset=_DATASETS[registration.target_dataset],
-                transform=transform,
-            )
 
 
 _META_DIR = Path(__file__).parent / "data" / "metadata" / "metadata"
@@ -2,12 +2,15 @@
 Tools for working with the dataset inventory.
 """
 
-import pandas as pd
+from typing import TYPE_CHECKING
 
 from hoa_tools.dataset import _DATASETS
 
+if TYPE_CHECKING:
+    import pandas as pd
 
-def load_inventory() -> pd.DataFrame:
+
+def load_inventory() -> "pd.DataFrame":
     """
     Load the dataset inventory.
 
@@ -17,6 +20,8 @@ def load_inventory() -> pd.DataFrame:
         Dataset inventory.
 
     """
+    import pandas as pd  # noqa: PLC0415
+
     data = [
         {
             "donor": d.donor.id,
@@ -9,15 +9,29 @@ Transforms are defined using the `SimpleITK` library.
 """
 
 import itertools
-from typing import Any
+import threading
+import warnings
+from collections.abc import Mapping
+from math import floor, log2
+from os import PathLike
+from typing import TYPE_CHECKING, Any, Literal, Self
 
 import networkx as nx
 import numpy as np
+import numpy.typing as npt
 import SimpleITK as sitk
 
+import hoa_tools.dataset
+from hoa_tools._transforms import affine_matrix
 from hoa_tools.dataset import Dataset
 from hoa_tools.types import PhysicalCoordinate
 
+if TYPE_CHECKING:
+    from hoa_tools.voi import VOI
+
+# Smallest size (in voxels) along any axis of VOIs used for refining registrations
+_MIN_REFINEMENT_SIZE = 8
+
 
 class RegistrationInventory:
     """
@@ -28,52 +42,395 @@ class RegistrationInventory:
     signatures.
     """
 
-    def __init__(self) -> None:
+    def __init__(self, *, from_metadata: bool = False) -> None:
         """
         Create registration inventory.
+
+        Parameters
+        ----------
+        from_metadata :
+            If True, populate the inventory with the registrations defined in the
+            metadata of all available datasets. This is done the first time the
+            inventory is used, and again if the available datasets change.
+
         """
+        self._from_metadata = from_metadata
+        # Datasets the inventory was last populated from. Only set once the
+        # inventory is completely populated
+        self._populated_from: dict[str, Dataset] | None = None
+        # Held while populating the inventory, so other threads wait for it
+        self._populate_lock = threading.Lock()
         self._graph: nx.DiGraph[Any] = nx.DiGraph()
+        # Label of the connected component each dataset is in,
+        # and the names of the datasets in each component
+        self._component_labels: dict[str, int] = {}
+        self._components: dict[int, set[str]] = {}
+        self._new_labels = itertools.count()
+        # Composed transforms (and their inverses),
+        # keyed by (source name, target name, flatten)
+        self._transforms: dict[tuple[str, str, bool], sitk.Transform] = {}
+        self._inverse_transforms: dict[tuple[str, str, bool], sitk.Transform] = {}
 
     def __contains__(self, item: tuple[Dataset, Dataset]) -> bool:
         """
         Check for existence of registration between two datasets.
         """
-        try:
-            nx.shortest_path(self._graph, item[0].name, item[1].name)
-        except nx.exception.NetworkXNoPath:
-            return False
-        else:
-            return True
+        self._ensure_populated()
+        label = self._component_labels.get(item[0].name)
+        return label is not None and label == self._component_labels.get(item[1].name)
+
+    def _get_component(self, dataset_name: str) -> set[str]:
+        """
+        Get the names of all datasets registered (even indirectly) to a dataset.
+
+        The returned set includes the dataset itself.
+        """
+        self._ensure_populated()
+        if dataset_name not in self._component_labels:
+            return {dataset_name}
+        return set(self._components[self._component_labels[dataset_name]])
 
     def get_registration(
-        self, *, source_dataset: Dataset, target_dataset: Dataset
+        self,
+        *,
+        source_dataset: Dataset,
+        target_dataset: Dataset,
+        flatten: bool = False,
     ) -> sitk.Transform:
         """
         Get a registration.
+
+        Parameters
+        ----------
+        source_dataset :
+            Dataset to map from.
+        target_dataset :
+            Dataset to map to.
+        flatten :
+            If True, and all the registrations on the path between the two datasets
+            are affine, return a single `SimpleITK.AffineTransform` that is
+            equivalent to applying each registration in turn. Mapping points with
+            this costs the same as mapping them through a single registration.
+
+        Notes
+        -----
+        Transforms are cached, so the returned transform should not be modified.
+
         """
+        self._ensure_populated()
+        key = (source_dataset.name, target_dataset.name, flatten)
+        if key in self._transforms:
+            return self._transforms[key]
+
+        if flatten:
+            t = self.get_registration(
+                source_dataset=source_dataset, target_dataset=target_dataset
+            )
+            matrix = affine_matrix(t)
+            if matrix is not None:
+                t = sitk.AffineTransform(  # type: ignore[no-untyped-call]
+                    matrix[:3, :3].flatten().tolist(),
+                    matrix[:3, 3].tolist(),
+                    (0, 0, 0),
+                )
+            self._transforms[key] = t
+            return t
+
         try:
             path = nx.shortest_path(
                 self._graph, source_dataset.name, target_dataset.name
             )
-        except nx.exception.NetworkXNoPath:
+        except (nx.exception.NetworkXNoPath, nx.exception.NodeNotFound):
             msg = (
                 f"No registration path between {source_dataset.name} and "
                 f"{target_dataset.name}"
             )
             raise ValueError(msg) from None
 
-        transforms: list[sitk.Transform] = [
-            self._graph[p1][p2]["transform"] for p1, p2 in itertools.pairwise(path)
+        transforms = [
+            self._edge_transform(p1, p2) for p1, p2 in itertools.pairwise(path)
         ]
         if len(transforms) == 1:
-            return transforms[0]
+            t = transforms[0]
+        else:
+            ndim = 3
+            t = sitk.CompositeTransform(ndim)  # type: ignore[no-untyped-call]
+            # Composite transforms apply the last transform added first
+            for transform in reversed(transforms):
+                t.AddTransform(transform)  # type: ignore[no-untyped-call]
 
-        ndim = 3
-        t = sitk.CompositeTransform(ndim)  # type: ignore[no-untyped-call]
-        for transform in transforms:
-            t.AddTransform(transform)  # type: ignore[no-untyped-call]
+        self._transforms[key] = t
         return t
 
+    def get_inverse_registration(
+        self,
+        *,
+        source_dataset: Dataset,
+        target_dataset: Dataset,
+        flatten: bool = False,
+    ) -> sitk.Transform:
+        """
+        Get the inverse of a registration.
+
+        This is the transform that maps points in ``target_dataset`` back
+        on to ``source_dataset``, which is needed when resampling data from
+        ``source_dataset`` on to the grid of ``target_dataset``.
+        See `get_registration` for a description of the parameters.
+
+        Notes
+        -----
+        Transforms are cached, so the returned transform should not be modified.
+
+        """
+        self._ensure_populated()
+        key = (source_dataset.name, target_dataset.name, flatten)
+        if key not in self._inverse_transforms:
+            self._inverse_transforms[key] = self.get_registration(
+                source_dataset=source_dataset,
+                target_dataset=target_dataset,
+                flatten=flatten,
+            ).GetInverse()  # type: ignore[no-untyped-call]
+        return self._inverse_transforms[key]
+
+    def get_affine_matrix(
+        self, *, source_dataset: Dataset, target_dataset: Dataset
+    ) -> npt.NDArray[np.float64]:
+        """
+        Get a registration as a single 4x4 affine matrix.
+
+        The matrix acts on homogeneous coordinates in (z, y, x, 1) order.
+
+        Raises
+        ------
+        ValueError
+            If any of the registrations on the path between the two datasets
+            are not affine.
+
+        """
+        matrix = affine_matrix(
+            self.get_registration(
+                source_dataset=source_dataset,
+                target_dataset=target_dataset,
+                flatten=True,
+            )
+        )
+        if matrix is None:
+            msg = (
+                f"Registration between {source_dataset.name} and "
+                f"{target_dataset.name} is not affine"
+            )
+            raise ValueError(msg)
+        return matrix
+
+    def transform_points(
+        self,
+        points: npt.ArrayLike,
+        *,
+        source_dataset: Dataset,
+        target_dataset: Dataset,
+        space: Literal["physical", "array"] = "physical",
+        chunk_size: int | None = None,
+        out: npt.NDArray[np.float64] | None = None,
+    ) -> npt.NDArray[np.float64]:
+        """
+        Transform many points from one dataset to another.
+
+        All the registrations on the path between the two datasets must be affine.
+        The points are transformed with a single matrix multiplication.
+
+        Parameters
+        ----------
+        points :
+            (N, 3) array of points, with columns in (z, y, x) order.
+        source_dataset :
+            Dataset the points are in.
+        target_dataset :
+            Dataset to transform the points to.
+        space :
+            If "physical", points are given and returned in micrometers.
+            If "array", points are given and returned in array coordinates
+            at downsample level 0 of each dataset. Returned array coordinates are
+            not rounded.
+        chunk_size :
+            If given, transform at most this many points at a time.
+            Together with memory-mapped ``points`` and ``out`` arrays, this can be
+            used to transform more points than fit in memory.
+        out :
+            If given, array to write the transformed points to.
+            Must have the same shape as ``points``, and dtype float64.
+
+        Returns
+        -------
+        transformed_points :
+            (N, 3) array of transformed points.
+
+        """
+        points = np.asanyarray(points)
+        if points.ndim != 2 or points.shape[1] != 3:  # noqa: PLR2004
+            msg = f"points must have shape (N, 3), got {points.shape}"
+            raise ValueError(msg)
+        if chunk_size is not None and chunk_size < 1:
+            msg = f"chunk_size must be >= 1, got {chunk_size}"
+            raise ValueError(msg)
+        if out is not None and (out.shape != points.shape or out.dtype != np.float64):
+            msg = (
+                f"out must have shape {points.shape} and dtype float64, "
+                f"got shape {out.shape} and dtype {out.dtype}"
+            )
+            raise ValueError(msg)
+
+        matrix = self.get_affine_matrix(
+            source_dataset=source_dataset, target_dataset=target_dataset
+        )
+        linear = matrix[:3, :3]
+        offset = matrix[:3, 3]
+        if space == "array":
+            source_voxel_size = source_dataset.data.voxel_size_um
+            target_voxel_size = target_dataset.data.voxel_size_um
+            linear = linear * source_voxel_size / target_voxel_size
+            offset = offset / target_voxel_size
+
+        if out is None:
+            out = np.empty(points.shape, dtype=np.float64)
+        if chunk_size is None:
+            chunk_size = max(len(points), 1)
+        for start in range(0, len(points), chunk_size):
+            chunk = slice(start, start + chunk_size)
+            np.matmul(points[chunk], linear.T, out=out[chunk])
+            out[chunk] += offset
+        return out
+
+    def to_arrays(self) -> dict[str, npt.NDArray[Any]]:
+        """
+        Export all registrations to a set of flat arrays.
+
+        Only the registrations that were added are exported, not their inverses.
+        Use `from_arrays` to create an inventory from the exported arrays.
+
+        Returns
+        -------
+        arrays :
+            Dictionary with the following arrays, each with one entry per
+            registration unless otherwise noted:
+
+            - ``datasets``: names of all registered datasets. Has one entry per
+              dataset.
+            - ``source``, ``target``: indices of the source and target datasets
+              in ``datasets``.
+            - ``transform_type``: SimpleITK transform type
+              (``SimpleITK.Transform.GetTransformEnum()``).
+            - ``parameters``, ``fixed_parameters``: parameters of all transforms,
+              concatenated.
+            - ``parameter_offsets``, ``fixed_parameter_offsets``: offsets into the
+              parameter arrays, with one more entry than there are registrations.
+
+        Raises
+        ------
+        ValueError
+            If any of the registrations is a composite transform.
+
+        """
+        self._ensure_populated()
+        edges = [
+            (source, target, data["transform"])
+            for source, target, data in self._graph.edges(data=True)
+            if not data["inverse"]
+        ]
+        for source, target, transform in edges:
+            if transform.GetTransformEnum() == sitk.sitkComposite:
+                msg = f"Cannot export composite transform between {source} and {target}"
+                raise ValueError(msg)
+
+        parameters = [t.GetParameters() for _, _, t in edges]
+        fixed_parameters = [t.GetFixedParameters() for _, _, t in edges]
+        names = sorted(self._component_labels)
+        indices = {name: i for i, name in enumerate(names)}
+        return {
+            "datasets": np.array(names, dtype=np.str_),
+            "source": np.array([indices[e[0]] for e in edges], dtype=np.int64),
+            "target": np.array([indices[e[1]] for e in edges], dtype=np.int64),
+            "transform_type": np.array(
+                [t.GetTransformEnum() for _, _, t in edges], dtype=np.int64
+            ),
+            "parameters": np.array(
+                list(itertools.chain.from_iterable(parameters)), dtype=np.float64
+            ),
+            "parameter_offsets": _offsets(parameters),
+            "fixed_parameters": np.array(
+                list(itertools.chain.from_iterable(fixed_parameters)),
+                dtype=np.float64,
+            ),
+            "fixed_parameter_offsets": _offsets(fixed_parameters),
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays: Mapping[str, npt.ArrayLike]) -> Self:
+        """
+        Create an inventory from arrays exported by `to_arrays`.
+
+        The inventory is not populated from dataset metadata.
+        """
+        inventory = cls()
+        names = np.asarray(arrays["datasets"]).tolist()
+        parameters = np.asarray(arrays["parameters"], dtype=np.float64)
+        offsets = np.asarray(arrays["parameter_offsets"])
+        fixed_parameters = np.asarray(arrays["fixed_parameters"], dtype=np.float64)
+        fixed_offsets = np.asarray(arrays["fixed_parameter_offsets"])
+        for i, (source, target, transform_type) in enumerate(
+            zip(
+                np.asarray(arrays["source"]).tolist(),
+                np.asarray(arrays["target"]).tolist(),
+                np.asarray(arrays["transform_type"]).tolist(),
+                strict=True,
+            )
+        ):
+            ndim = 3
+            transform = sitk.Transform(ndim, transform_type)  # type: ignore[no-untyped-call]
+            transform.SetFixedParameters(  # type: ignore[no-untyped-call]
+                fixed_parameters[fixed_offsets[i] : fixed_offsets[i + 1]].tolist()
+            )
+            transform.SetParameters(  # type: ignore[no-untyped-call]
+                parameters[offsets[i] : offsets[i + 1]].tolist()
+            )
+            inventory._add_edges(
+                names[source],
+                names[target],
+                transform.Downcast(),  # type: ignore[no-untyped-call]
+            )
+        return inventory
+
+    def save(self, path: str | PathLike[str]) -> None:
+        """
+        Save all registrations to a NumPy ``.npz`` file.
+
+        Use `load` to load the saved registrations.
+        """
+        np.savez(path, **self.to_arrays())  # type: ignore[arg-type]
+
+    @classmethod
+    def load(cls, path: str | PathLike[str]) -> Self:
+        """
+        Load registrations saved with `save`.
+
+        The inventory is not populated from dataset metadata.
+        """
+        with np.load(path) as arrays:
+            return cls.from_arrays(arrays)
+
+    def __getstate__(self) -> dict[str, npt.NDArray[Any]]:
+        """
+        Get the state of the inventory for pickling.
+
+        Only the registrations are pickled, as flat arrays.
+        """
+        return self.to_arrays()
+
+    def __setstate__(self, state: dict[str, npt.NDArray[Any]]) -> None:
+        """
+        Restore the state of the inventory after unpickling.
+        """
+        self.__dict__.update(self.from_arrays(state).__dict__)
+
     def add_registration(
         self,
         *,
@@ -88,21 +445,141 @@ class RegistrationInventory:
         -----
         This will override any already defined transforms for these two datasets.
 
+        """
+        self._ensure_populated()
+        self._add_edges(source_dataset.name, target_dataset.name, transform)
+        self._clear_cache()
+
+    def _add_edges(
+        self, source_name: str, target_name: str, transform: sitk.Transform
+    ) -> None:
+        """
+        Add a transform, and a placeholder for its inverse, to the graph.
         """
         self._graph.add_edge(
-            source_dataset.name, target_dataset.name, transform=transform
+            source_name, target_name, transform=transform, inverse=False
         )
-        self._graph.add_edge(
-            target_dataset.name,
-            source_dataset.name,
-            transform=transform.GetInverse(),  # type: ignore[no-untyped-call]
+        self._graph.add_edge(target_name, source_name, transform=None, inverse=True)
+        self._merge_components(source_name, target_name)
+
+    def _edge_transform(self, source_name: str, target_name: str) -> sitk.Transform:
+        """
+        Get the transform stored on a single edge of the graph.
+        """
+        edge = self._graph[source_name][target_name]
+        if edge["transform"] is None:
+            # Inverses are only built the first time an edge is traversed backwards
+            edge["transform"] = self._graph[target_name][source_name][
+                "transform"
+            ].GetInverse()
+        return edge["transform"]  # type: ignore[no-any-return]
+
+    def _ensure_populated(self) -> None:
+        """
+        Populate the inventory from dataset metadata, if it is out of date.
+        """
+        datasets = hoa_tools.dataset._DATASETS  # noqa: SLF001
+        if not self._from_metadata or self._populated_from is datasets:
+            return
+
+        with self._populate_lock:
+            # Another thread may have populated the inventory while waiting
+            if self._populated_from is datasets:
+                return
+            self._populated_from = None
+            self._reset()
+            self._populate(datasets)
+            self._populated_from = datasets
+
+    def _populate(self, datasets: dict[str, Dataset]) -> None:
+        """
+        Add the registrations defined in the metadata of some datasets.
+        """
+        for dataset in datasets.values():
+            if (registration := dataset.registration) is None:
+                continue
+            if registration.target_dataset not in datasets:
+                # Some datasets don't have their parent datasets release yet - only warn
+                # if we're expecting a parent dataset
+                if registration.source_dataset not in [
+                    "A129_lung_VOI-02_2.0um_bm18"
+                ] and not registration.source_dataset.startswith("LADAF-2021-17_brain"):
+                    warnings.warn(
+                        f"Did not find target dataset {registration.target_dataset} "
+                        f"in dataset inventory. "
+                        f"Not adding {registration.source_dataset} "
+                        "to registration inventory.",
+                        stacklevel=1,
+                    )
+                continue
+            source_dataset = datasets[registration.source_dataset]
+            target_dataset = datasets[registration.target_dataset]
+            transform = build_transform(
+                translation=PhysicalCoordinate(
+                    x=registration.translation[0] * target_dataset.data.voxel_size_um,
+                    y=registration.translation[1] * target_dataset.data.voxel_size_um,
+                    z=registration.translation[2] * target_dataset.data.voxel_size_um,
+                ),
+                rotation_deg=registration.rotation,
+                scale=registration.scale
+                * target_dataset.data.voxel_size_um
+                / source_dataset.data.voxel_size_um,
+            )
+            self._add_edges(source_dataset.name, target_dataset.name, transform)
+
+    def _merge_components(self, name_1: str, name_2: str) -> None:
+        """
+        Update connected components after adding a registration between two datasets.
+        """
+        for name in (name_1, name_2):
+            if name not in self._component_labels:
+                label = next(self._new_labels)
+                self._component_labels[name] = label
+                self._components[label] = {name}
+
+        label_1 = self._component_labels[name_1]
+        label_2 = self._component_labels[name_2]
+        if label_1 == label_2:
+            return
+        # Relabel the smaller component
+        small, large = sorted(
+            (label_1, label_2), key=lambda label: len(self._components[label])
         )
+        for name in self._components.pop(small):
+            self._component_labels[name] = large
+            self._components[large].add(name)
 
     def _clear(self) -> None:
         """
         Remove all registrations.
         """
+        with self._populate_lock:
+            # Don't re-populate from metadata after being cleared
+            self._populated_from = hoa_tools.dataset._DATASETS  # noqa: SLF001
+            self._reset()
+
+    def _reset(self) -> None:
+        """
+        Remove all registrations, without changing when the inventory is populated.
+        """
         self._graph = nx.DiGraph()
+        self._component_labels = {}
+        self._components = {}
+        self._clear_cache()
+
+    def _clear_cache(self) -> None:
+        """
+        Remove all cached transforms.
+        """
+        self._transforms.clear()
+        self._inverse_transforms.clear()
+
+
+def _offsets(values: list[tuple[float, ...]]) -> npt.NDArray[np.int64]:
+    """
+    Get the offsets of each item in a list of tuples once they are concatenated.
+    """
+    return np.concatenate([[0], np.cumsum([len(v) for v in values])]).astype(np.int64)
 
 
 def build_transform(
@@ -122,4 +599,138 @@ def build_transform(
     )
 
 
-Inventory = RegistrationInventory()
+def refine_registration(
+    source_voi: "VOI",
+    target_voi: "VOI",
+    *,
+    initial_transform: sitk.Transform | None = None,
+    coarsest_level: int = 4,
+    finest_level: int = 0,
+    number_of_iterations: int = 100,
+) -> sitk.Similarity3DTransform:
+    """
+    Refine the registration between two VOIs, working from coarse to fine data.
+
+    The registration is optimised at each downsample level of ``source_voi`` in
+    turn, from ``coarsest_level`` to ``finest_level``, starting from the result at
+    the previous level. At each level ``target_voi`` is fetched at the coarsest of
+    its own downsample levels that is at least as fine as ``source_voi``.
+    This means most iterations only need coarse data.
+
+    Parameters
+    ----------
+    source_voi :
+        VOI to map from.
+    target_voi :
+        VOI to map to. This should contain ``source_voi`` once it has been
+        transformed, for example by using `hoa_tools.voi.VOI.transform_to`.
+    initial_transform :
+        Transform to start from. Must be affine.
+        If not given, the registration in the registration inventory is used.
+    coarsest_level, finest_level :
+        Downsample levels of ``source_voi`` to start and finish at.
+        Levels that aren't available, or where either VOI is smaller than
+        8 voxels along any axis, are skipped.
+    number_of_iterations :
+        Maximum number of optimiser iterations at each level.
+
+    Returns
+    -------
+    transform :
+        Transform from ``source_voi`` to ``target_voi``. This can be added to
+        the registration inventory with
+        `RegistrationInventory.add_registration`.
+
+    """
+    if initial_transform is None:
+        initial_transform = Inventory.get_registration(
+            source_dataset=source_voi.dataset,
+            target_dataset=target_voi.dataset,
+            flatten=True,
+        )
+    matrix = affine_matrix(initial_transform)
+    if matrix is None:
+        msg = "initial_transform must be affine"
+        raise ValueError(msg)
+
+    source_levels = source_voi.dataset._levels  # noqa: SLF001
+    target_levels = target_voi.dataset._levels  # noqa: SLF001
+    levels = [
+        level
+        for level in range(coarsest_level, finest_level - 1, -1)
+        if level in source_levels
+    ]
+
+    transform: sitk.Similarity3DTransform | None = None
+    for level in levels:
+        source_level_voi = source_voi.change_downsample_level(
+            new_downsample_level=level
+        )
+        # Coarsest target level that is at least as fine as the source level
+        target_level = floor(
+            log2(source_level_voi.voxel_size_um / target_voi.dataset.data.voxel_size_um)
+        )
+        target_level = min(max(target_level, 0), max(target_levels))
+        target_level_voi = target_voi.change_downsample_level(
+            new_downsample_level=target_level
+        )
+        if any(
+            getattr(voi.size, dim) < _MIN_REFINEMENT_SIZE
+            for voi in (source_level_voi, target_level_voi)
+            for dim in "xyz"
+        ):
+            continue
+
+        fixed = sitk.Cast(source_level_voi.get_sitk_image(), sitk.sitkFloat32)  # type: ignore[no-untyped-call]
+        moving = sitk.Cast(target_level_voi.get_sitk_image(), sitk.sitkFloat32)  # type: ignore[no-untyped-call]
+        if transform is None:
+            transform = _similarity_transform(
+                matrix,
+                center=fixed.TransformContinuousIndexToPhysicalPoint(
+                    [(s - 1) / 2 for s in fixed.GetSize()]
+                ),
+            )
+
+        registration_method = sitk.ImageRegistrationMethod()  # type: ignore[no-untyped-call]
+        registration_method.SetMetricAsMattesMutualInformation(numberOfHistogramBins=50)  # type: ignore[no-untyped-call]
+        registration_method.SetMetricSamplingStrategy(registration_method.RANDOM)  # type: ignore[no-untyped-call]
+        registration_method.SetMetricSamplingPercentage(0.1, seed=level)  # type: ignore[no-untyped-call]
+        registration_method.SetInterpolator(sitk.sitkLinear)  # type: ignore[no-untyped-call]
+        registration_method.SetOptimizerAsRegularStepGradientDescent(  # type: ignore[no-untyped-call]
+            learningRate=source_level_voi.voxel_size_um,
+            minStep=source_level_voi.voxel_size_um / 100,
+            numberOfIterations=number_of_iterations,
+        )
+        registration_method.SetOptimizerScalesFromPhysicalShift()  # type: ignore[no-untyped-call]
+        registration_method.SetInitialTransform(transform, inPlace=False)  # type: ignore[no-untyped-call]
+        result = registration_method.Execute(fixed, moving)  # type: ignore[no-untyped-call]
+        # The result is a composite transform wrapping a single transform
+        transform = result.GetNthTransform(0).Downcast()
+
+    if transform is None:
+        msg = "VOIs are too small to refine the registration at any downsample level"
+        raise ValueError(msg)
+    return transform
+
+
+def _similarity_transform(
+    matrix: npt.NDArray[np.float64], *, center: tuple[float, float, float]
+) -> sitk.Similarity3DTransform:
+    """
+    Convert a 4x4 affine matrix to a similarity transform with a given centre.
+
+    The matrix must be a rotation and isotropic scaling, followed by a translation.
+    """
+    linear = matrix[:3, :3]
+    center_array = np.asarray(center)
+    transform = sitk.Similarity3DTransform()  # type: ignore[no-untyped-call]
+    transform.SetMatrix(linear.flatten().tolist())  # type: ignore[no-untyped-call]
+    transform.SetCenter(center)  # type: ignore[no-untyped-call]
+    # Keep the mapping the same with the new centre of rotation
+    transform.SetTranslation(  # type: ignore[no-untyped-call]
+        (matrix[:3, 3] + linear @ center_array - center_array).tolist()
+    )
+    return transform
+
+
+Inventory = RegistrationInventory(from_metadata=True)
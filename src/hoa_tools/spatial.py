@@ -0,0 +1,256 @@
+"""
+Spatial index of dataset extents.
+
+The [`SpatialIndex`][hoa_tools.spatial.SpatialIndex] class answers questions like
+"which datasets contain this point?" or "which datasets overlap this region?",
+for points and regions given in the physical space of any dataset.
+
+All datasets that are registered (even indirectly) to each other share a
+common physical reference frame. The extent of each dataset is stored as an
+axis-aligned bounding box in this frame, so only datasets whose bounding
+boxes intersect a query need to be checked in their own frame.
+"""
+
+from collections.abc import Iterable
+
+import numpy as np
+import numpy.typing as npt
+
+import hoa_tools.dataset
+from hoa_tools._transforms import CORNER_MASKS
+from hoa_tools.dataset import Dataset
+from hoa_tools.registration import Inventory, RegistrationInventory
+from hoa_tools.types import PhysicalCoordinate
+
+__all__ = ["SpatialIndex"]
+
+
+def _physical_extent(dataset: Dataset) -> npt.NDArray[np.float64]:
+    """
+    Get the physical size of a dataset, in (z, y, x) order.
+    """
+    # Dataset shapes are stored in the metadata in (y, x, z) order
+    y, x, z = dataset.data.shape
+    return np.array([z, y, x], dtype=np.float64) * dataset.data.voxel_size_um
+
+
+def _box_corners(
+    lower: npt.NDArray[np.float64], upper: npt.NDArray[np.float64]
+) -> npt.NDArray[np.float64]:
+    """
+    Get the 8 corners of boxes, in homogeneous coordinates.
+
+    Parameters
+    ----------
+    lower, upper :
+        (..., 3) arrays of the lower and upper corners of the boxes.
+
+    Returns
+    -------
+    corners :
+        (..., 8, 4) array of corners.
+
+    """
+    corners = np.where(
+        CORNER_MASKS, upper[..., np.newaxis, :], lower[..., np.newaxis, :]
+    )
+    ones = np.ones((*corners.shape[:-1], 1))
+    return np.concatenate([corners, ones], axis=-1)
+
+
+def _bounds(
+    corners: npt.NDArray[np.float64],
+) -> tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]]:
+    """
+    Get the lower and upper bounds of a (..., 8, 4) array of transformed corners.
+    """
+    return corners[..., :3].min(axis=-2), corners[..., :3].max(axis=-2)
+
+
+class SpatialIndex:
+    """
+    Index of the physical extents of datasets, in frames shared by registered datasets.
+
+    Each group of datasets that are registered (even indirectly) to each other
+    is indexed in the physical space of one of the datasets in that group.
+    All registrations between datasets in a group must be affine.
+
+    Notes
+    -----
+    Building the index gets the transform between every dataset and the reference
+    dataset of its group, so should be done once and re-used for many queries.
+    The index is not updated if new registrations are added to the inventory.
+
+    """
+
+    def __init__(
+        self,
+        datasets: Iterable[Dataset] | None = None,
+        *,
+        inventory: RegistrationInventory | None = None,
+    ) -> None:
+        """
+        Create a spatial index.
+
+        Parameters
+        ----------
+        datasets :
+            Datasets to index. Defaults to all available datasets.
+        inventory :
+            Registration inventory to use. Defaults to the inventory of
+            registrations defined in the dataset metadata.
+
+        """
+        if datasets is None:
+            datasets = hoa_tools.dataset._DATASETS.values()  # noqa: SLF001
+        if inventory is None:
+            inventory = Inventory
+
+        # Group datasets by connected component in the registration graph,
+        # using the first dataset name in each component as the reference
+        groups: dict[str, list[Dataset]] = {}
+        for dataset in datasets:
+            reference = min(inventory._get_component(dataset.name))  # noqa: SLF001
+            groups.setdefault(reference, []).append(dataset)
+
+        # Name of the reference dataset of each dataset
+        self._references: dict[str, str] = {}
+        # Datasets in each group, keyed by reference dataset name
+        self._datasets: dict[str, list[Dataset]] = {}
+        # Matrices from each dataset to its reference frame
+        self._to_reference: dict[str, npt.NDArray[np.float64]] = {}
+        # Per group (N, 3) arrays of bounding boxes in the reference frame,
+        # (N, 3) arrays of extents in each dataset's own frame,
+        # and (N, 4, 4) matrices from the reference frame to each dataset
+        self._lower: dict[str, npt.NDArray[np.float64]] = {}
+        self._upper: dict[str, npt.NDArray[np.float64]] = {}
+        self._extents: dict[str, npt.NDArray[np.float64]] = {}
+        self._from_reference: dict[str, npt.NDArray[np.float64]] = {}
+
+        for reference, group in groups.items():
+            reference_dataset = hoa_tools.dataset.get_dataset(reference)
+            to_reference = np.stack(
+                [
+                    np.eye(4)
+                    if dataset.name == reference
+                    else inventory.get_affine_matrix(
+                        source_dataset=dataset, target_dataset=reference_dataset
+                    )
+                    for dataset in group
+                ]
+            )
+            extents = np.stack([_physical_extent(dataset) for dataset in group])
+            corners = _box_corners(np.zeros_like(extents), extents)
+            lower, upper = _bounds(corners @ to_reference.transpose(0, 2, 1))
+
+            self._datasets[reference] = group
+            self._lower[reference] = lower
+            self._upper[reference] = upper
+            self._extents[reference] = extents
+            self._from_reference[reference] = np.linalg.inv(to_reference)  # type: ignore[assignment]
+            for dataset, matrix in zip(group, to_reference, strict=True):
+                self._references[dataset.name] = reference
+                self._to_reference[dataset.name] = matrix
+
+    def _reference(self, dataset: Dataset) -> str:
+        if dataset.name not in self._references:
+            msg = f"Dataset {dataset.name} is not in the spatial index"
+            raise ValueError(msg)
+        return self._references[dataset.name]
+
+    def query_point(
+        self, point: PhysicalCoordinate, *, dataset: Dataset
+    ) -> list[Dataset]:
+        """
+        Get all datasets that contain a point.
+
+        Parameters
+        ----------
+        point :
+            Point in the physical space of ``dataset``.
+        dataset :
+            Dataset the point is defined in.
+
+        Returns
+        -------
+        datasets :
+            Datasets containing the point, sorted from smallest to largest voxel size.
+            Includes ``dataset`` itself if the point is within it.
+
+        """
+        reference = self._reference(dataset)
+        p = self._to_reference[dataset.name] @ [point.z, point.y, point.x, 1]
+
+        candidates = np.flatnonzero(
+            np.all(
+                (self._lower[reference] <= p[:3]) & (p[:3] <= self._upper[reference]),
+                axis=1,
+            )
+        )
+        # Check candidates in their own frames
+        local = self._from_reference[reference][candidates] @ p
+        inside = np.all(
+            (local[:, :3] >= 0)
+            & (local[:, :3] <= self._extents[reference][candidates]),
+            axis=1,
+        )
+        return self._sorted(reference, candidates[inside])
+
+    def query_box(
+        self,
+        lower: PhysicalCoordinate,
+        upper: PhysicalCoordinate,
+        *,
+        dataset: Dataset,
+    ) -> list[Dataset]:
+        """
+        Get all datasets that overlap a box.
+
+        Parameters
+        ----------
+        lower, upper :
+            Lower and upper corners of the box, in the physical space of ``dataset``.
+        dataset :
+            Dataset the box is defined in.
+
+        Returns
+        -------
+        datasets :
+            Datasets overlapping the box, sorted from smallest to largest voxel size.
+
+        Notes
+        -----
+        A dataset is returned if the bounding box of the query box overlaps it in
+        its own frame, and the query box overlaps its bounding box in the
+        reference frame. For datasets rotated with respect to each other this
+        can include datasets that are close to, but don't overlap, the box.
+
+        """
+        reference = self._reference(dataset)
+        corners = _box_corners(
+            np.array([lower.z, lower.y, lower.x], dtype=np.float64),
+            np.array([upper.z, upper.y, upper.x], dtype=np.float64),
+        )
+        corners = corners @ self._to_reference[dataset.name].T
+        box_lower, box_upper = _bounds(corners)
+
+        candidates = np.flatnonzero(
+            np.all(
+                (self._lower[reference] <= box_upper)
+                & (box_lower <= self._upper[reference]),
+                axis=1,
+            )
+        )
+        # Check candidates in their own frames
+        local_lower, local_upper = _bounds(
+            corners @ self._from_reference[reference][candidates].transpose(0, 2, 1)
+        )
+        overlaps = np.all(
+            (local_upper >= 0) & (local_lower <= self._extents[reference][candidates]),
+            axis=1,
+        )
+        return self._sorted(reference, candidates[overlaps])
+
+    def _sorted(self, reference: str, indices: npt.NDArray[np.intp]) -> list[Dataset]:
+        datasets = [self._datasets[reference][i] for i in indices]
+        return sorted(datasets, key=lambda d: (d.data.voxel_size_um, d.name))
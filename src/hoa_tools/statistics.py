@@ -0,0 +1,463 @@
+"""
+Statistics of the values in whole downsample levels of datasets.
+
+Statistics are computed by streaming over the storage chunks of a level, so
+only a few chunks are held in memory at once, however large the level is.
+The statistics of each chunk are merged together to give the statistics
+of the whole level.
+
+Computing statistics for a whole level is expensive, so the results of
+[`get_statistics`][hoa_tools.statistics.get_statistics] are saved to a local
+cache, and only computed once for each dataset and downsample level.
+"""
+
+from math import floor
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import numpy.typing as npt
+from pydantic import BaseModel, ConfigDict
+
+from hoa_tools.dataset import Dataset
+from hoa_tools.storage import _user_cache_dir, _write_text_atomic
+
+__all__ = [
+    "Histogram",
+    "LevelStatistics",
+    "Statistics",
+    "get_statistics",
+    "get_statistics_cache_dir",
+    "set_statistics_cache_dir",
+]
+
+# Number of histogram bins used if a value range is given without a number of bins
+_DEFAULT_N_BINS = 1024
+# Largest integer types that get one histogram bin per value by default
+_MAX_ITEMSIZE_PER_VALUE_BINS = 2
+
+
+class Histogram(BaseModel):
+    """
+    Histogram of values, with equal width bins.
+    """
+
+    model_config = ConfigDict(frozen=True)
+
+    bin_range: tuple[float, float]
+    """Lower edge of the first bin, and upper edge of the last bin."""
+    counts: list[int]
+    """Number of values in each bin. Bins include their lower edge only."""
+    n_below: int = 0
+    """Number of values below the lower edge of the first bin."""
+    n_above: int = 0
+    """Number of values at or above the upper edge of the last bin."""
+
+    @property
+    def bin_edges(self) -> npt.NDArray[np.float64]:
+        """
+        Edges of all the bins.
+        """
+        return np.linspace(*self.bin_range, len(self.counts) + 1)
+
+
+class Statistics(BaseModel):
+    """
+    Summary statistics of some values.
+
+    Statistics of different sets of values can be combined using
+    [`merge`][hoa_tools.statistics.Statistics.merge].
+    """
+
+    model_config = ConfigDict(frozen=True)
+
+    count: int
+    """Number of values."""
+    min: float | None
+    """Smallest value, or None if there are no values."""
+    max: float | None
+    """Largest value, or None if there are no values."""
+    mean: float
+    """Mean of the values."""
+    m2: float
+    """Sum of the squared differences between the values and their mean."""
+    histogram: Histogram
+    """Histogram of the values."""
+
+    @classmethod
+    def from_array(
+        cls,
+        data: npt.NDArray[Any],
+        *,
+        bin_range: tuple[float, float],
+        n_bins: int,
+    ) -> "Statistics":
+        """
+        Compute statistics of all the values in an array.
+
+        NaN and infinite values are ignored.
+
+        Parameters
+        ----------
+        data :
+            Array of values.
+        bin_range :
+            Lower edge of the first histogram bin, and upper edge of the last bin.
+        n_bins :
+            Number of histogram bins.
+
+        """
+        return _Accumulator.from_array(
+            data, bin_range=bin_range, n_bins=n_bins
+        ).to_statistics()
+
+    @property
+    def variance(self) -> float:
+        """
+        Variance of the values.
+        """
+        return self.m2 / self.count if self.count else 0.0
+
+    @property
+    def std(self) -> float:
+        """
+        Standard deviation of the values.
+        """
+        return float(np.sqrt(self.variance))
+
+    def quantile(self, q: float) -> float:
+        """
+        Get an approximate quantile of the values.
+
+        The quantile is interpolated linearly within the histogram bin that
+        contains it, so is accurate to within the width of a bin. Quantiles
+        of values outside the range of the histogram are given as the
+        smallest or largest value.
+
+        For example, ``(stats.quantile(0.01), stats.quantile(0.99))`` is a
+        contrast window that ignores the 1% darkest and brightest values.
+
+        Parameters
+        ----------
+        q :
+            Quantile, between 0 and 1.
+
+        """
+        if not 0 <= q <= 1:
+            msg = "q must be between 0 and 1"
+            raise ValueError(msg)
+        if self.count == 0 or self.min is None or self.max is None:
+            msg = "Can't compute a quantile with no values"
+            raise ValueError(msg)
+
+        counts = np.asarray(self.histogram.counts)
+        target = q * self.count - self.histogram.n_below
+        if target <= 0:
+            return self.min
+        cumulative = np.cumsum(counts)
+        if target >= cumulative[-1]:
+            return self.max
+        i = int(np.searchsorted(cumulative, target))
+        before = cumulative[i - 1] if i > 0 else 0
+        edges = self.histogram.bin_edges
+        value = edges[i] + (target - before) / counts[i] * (edges[i + 1] - edges[i])
+        return float(np.clip(value, self.min, self.max))
+
+    def merge(self, other: "Statistics") -> "Statistics":
+        """
+        Get the statistics of the values in these statistics and another.
+
+        Both statistics must have histograms with the same bins.
+        """
+        accumulator = _Accumulator.from_statistics(self)
+        accumulator.update(_Accumulator.from_statistics(other))
+        return accumulator.to_statistics()
+
+
+class LevelStatistics(Statistics):
+    """
+    Summary statistics of all the values in a downsample level of a dataset.
+    """
+
+    dataset: str
+    """Name of the dataset."""
+    url: str
+    """URL of the dataset that the statistics were computed from."""
+    downsample_level: int
+    """Downsample level of the dataset."""
+
+
+class _Accumulator:
+    """
+    Statistics of some values, that can be merged in place.
+    """
+
+    def __init__(
+        self,
+        *,
+        count: int,
+        min_: float | None,
+        max_: float | None,
+        mean: float,
+        m2: float,
+        bin_range: tuple[float, float],
+        counts: npt.NDArray[np.int64],
+        n_below: int,
+        n_above: int,
+    ) -> None:
+        self.count = count
+        self.min = min_
+        self.max = max_
+        self.mean = mean
+        self.m2 = m2
+        self.bin_range = bin_range
+        self.counts = counts
+        self.n_below = n_below
+        self.n_above = n_above
+
+    @classmethod
+    def empty(cls, *, bin_range: tuple[float, float], n_bins: int) -> "_Accumulator":
+        return cls(
+            count=0,
+            min_=None,
+            max_=None,
+            mean=0.0,
+            m2=0.0,
+            bin_range=bin_range,
+            counts=np.zeros(n_bins, dtype=np.int64),
+            n_below=0,
+            n_above=0,
+        )
+
+    @classmethod
+    def from_array(
+        cls,
+        data: npt.NDArray[Any],
+        *,
+        bin_range: tuple[float, float],
+        n_bins: int,
+    ) -> "_Accumulator":
+        values = np.ravel(data)
+        if not np.issubdtype(values.dtype, np.integer):
+            values = values[np.isfinite(values)]
+        if values.size == 0:
+            return cls.empty(bin_range=bin_range, n_bins=n_bins)
+
+        lower, upper = bin_range
+        if (
+            np.issubdtype(values.dtype, np.integer)
+            and lower == floor(lower)
+            and upper - lower == n_bins
+        ):
+            # One bin per integer value
+            bins = values.astype(np.int64) - int(lower)
+        else:
+            bins = np.floor(
+                (values - lower) * (n_bins / (upper - lower)), dtype=np.float64
+            ).astype(np.int64)
+        n_below = int(np.count_nonzero(bins < 0))
+        n_above = int(np.count_nonzero(bins >= n_bins))
+        if n_below or n_above:
+            bins = bins[(bins >= 0) & (bins < n_bins)]
+
+        mean = float(values.mean(dtype=np.float64))
+        return cls(
+            count=values.size,
+            min_=float(values.min()),
+            max_=float(values.max()),
+            mean=mean,
+            m2=float(np.sum((values - mean) ** 2, dtype=np.float64)),
+            bin_range=bin_range,
+            counts=np.bincount(bins, minlength=n_bins),
+            n_below=n_below,
+            n_above=n_above,
+        )
+
+    @classmethod
+    def from_statistics(cls, statistics: Statistics) -> "_Accumulator":
+        histogram = statistics.histogram
+        return cls(
+            count=statistics.count,
+            min_=statistics.min,
+            max_=statistics.max,
+            mean=statistics.mean,
+            m2=statistics.m2,
+            bin_range=histogram.bin_range,
+            counts=np.array(histogram.counts, dtype=np.int64),
+            n_below=histogram.n_below,
+            n_above=histogram.n_above,
+        )
+
+    def update(self, other: "_Accumulator") -> None:
+        """
+        Add the values of another accumulator to this one.
+        """
+        if (
+            tuple(self.bin_range) != tuple(other.bin_range)
+            or self.counts.shape != other.counts.shape
+        ):
+            msg = "Can't merge statistics with different histogram bins"
+            raise ValueError(msg)
+        if other.count == 0:
+            return
+
+        # Combine moments using the method of Chan et al.
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta**2 * self.count * other.count / count
+        self.count = count
+        self.min = other.min if self.min is None else min(self.min, other.min)  # type: ignore[type-var]
+        self.max = other.max if self.max is None else max(self.max, other.max)  # type: ignore[type-var]
+        self.counts += other.counts
+        self.n_below += other.n_below
+        self.n_above += other.n_above
+
+    def to_statistics(self) -> Statistics:
+        return Statistics(
+            count=self.count,
+            min=self.min,
+            max=self.max,
+            mean=self.mean,
+            m2=self.m2,
+            histogram=Histogram(
+                bin_range=self.bin_range,
+                counts=self.counts.tolist(),
+                n_below=self.n_below,
+                n_above=self.n_above,
+            ),
+        )
+
+
+_CACHE_DIR: Path | None = _user_cache_dir() / "statistics"
+
+
+def get_statistics_cache_dir() -> Path | None:
+    """
+    Get the directory that statistics are cached in, or None if they aren't cached.
+    """
+    return _CACHE_DIR
+
+
+def set_statistics_cache_dir(path: Path | None) -> None:
+    """
+    Set the directory that statistics are cached in.
+
+    Defaults to ``hoa-tools/statistics`` in the user cache directory
+    (``$XDG_CACHE_HOME``, or ``~/.cache`` if that isn't set).
+
+    Parameters
+    ----------
+    path :
+        Directory to cache statistics in. If None, statistics are not cached.
+
+    """
+    global _CACHE_DIR  # noqa: PLW0603
+    _CACHE_DIR = path
+
+
+def get_statistics(
+    dataset: Dataset,
+    *,
+    downsample_level: int,
+    value_range: tuple[float, float] | None = None,
+    n_bins: int | None = None,
+    max_workers: int = 8,
+    recompute: bool = False,
+) -> LevelStatistics:
+    """
+    Get statistics of all the values in a downsample level of a dataset.
+
+    If the statistics have been computed before with the same histogram bins,
+    the cached statistics are returned. Otherwise every chunk of the level is
+    fetched, which can take a long time for fine levels of large datasets.
+
+    Parameters
+    ----------
+    dataset :
+        Dataset to get statistics for.
+    downsample_level :
+        Downsample level of the dataset.
+    value_range :
+        Lower edge of the first histogram bin, and upper edge of the last bin.
+        Can only be left out for 8 and 16 bit integer data, in which case
+        the range covers every possible value.
+    n_bins :
+        Number of histogram bins. Defaults to one bin per value if
+        ``value_range`` isn't given, and 1024 bins if it is.
+    max_workers :
+        Maximum number of chunks to fetch concurrently.
+    recompute :
+        If True, compute the statistics even if they are cached.
+
+    """
+    level_array = dataset._level_array(downsample_level=downsample_level)  # noqa: SLF001
+    bin_range, n_bins = _histogram_bins(
+        level_array.dtype, value_range=value_range, n_bins=n_bins
+    )
+
+    path = (
+        None
+        if _CACHE_DIR is None
+        else _CACHE_DIR / dataset.name / f"{downsample_level}.json"
+    )
+    if path is not None and path.exists() and not recompute:
+        cached = LevelStatistics.model_validate_json(path.read_text())
+        if (
+            cached.url == dataset.data.gcs_url
+            and cached.histogram.bin_range == bin_range
+            and len(cached.histogram.counts) == n_bins
+        ):
+            return cached
+
+    accumulator = _Accumulator.empty(bin_range=bin_range, n_bins=n_bins)
+    region = level_array.clip((0, 0, 0), level_array.shape)
+    for _, chunk in level_array.map_chunks(
+        lambda data: _Accumulator.from_array(data, bin_range=bin_range, n_bins=n_bins),
+        level_array.chunk_indices(region),
+        max_workers=max_workers,
+    ):
+        accumulator.update(chunk)
+
+    statistics = LevelStatistics(
+        **dict(accumulator.to_statistics()),
+        dataset=dataset.name,
+        url=dataset.data.gcs_url,
+        downsample_level=downsample_level,
+    )
+    if path is not None:
+        _write_text_atomic(path, statistics.model_dump_json())
+    return statistics
+
+
+def _histogram_bins(
+    dtype: np.dtype[Any],
+    *,
+    value_range: tuple[float, float] | None,
+    n_bins: int | None,
+) -> tuple[tuple[float, float], int]:
+    """
+    Get the range and number of histogram bins to use for data of a given type.
+    """
+    if value_range is None:
+        if not (
+            np.issubdtype(dtype, np.integer)
+            and dtype.itemsize <= _MAX_ITEMSIZE_PER_VALUE_BINS
+        ):
+            msg = f"value_range must be given for data of type {dtype}"
+            raise ValueError(msg)
+        info = np.iinfo(dtype)
+        value_range = (info.min, info.max + 1)
+        if n_bins is None:
+            n_bins = info.max + 1 - info.min
+    elif n_bins is None:
+        n_bins = _DEFAULT_N_BINS
+
+    lower, upper = value_range
+    if not lower < upper:
+        msg = "The lower end of value_range must be less than the upper end"
+        raise ValueError(msg)
+    if n_bins <= 0:
+        msg = "n_bins must be positive"
+        raise ValueError(msg)
+    return (float(lower), float(upper)), n_bins
@@ -0,0 +1,735 @@
+"""
+Control of the requests made to remote stores.
+
+All data is fetched from remote object stores. Requests to these stores
+occasionally fail, or take much longer than usual. The
+[`ManagedFileSystem`][hoa_tools.storage.ManagedFileSystem] class wraps the
+filesystem used to access a remote store, and
+
+- limits the number of requests in flight at once,
+- retries failed requests, with exponential backoff, and
+- optionally sends a duplicate "hedged" request if a request takes much
+  longer than usual, using whichever response arrives first.
+
+How requests are made is set by a [`RequestPolicy`][hoa_tools.storage.RequestPolicy].
+The policy used for all remote datasets can be changed with
+[`set_request_policy`][hoa_tools.storage.set_request_policy].
+
+Copies of datasets stored somewhere else (e.g. on a local disk, or in another
+object store) can be used instead of the original remote store by adding a
+mirror with [`add_mirror`][hoa_tools.storage.add_mirror].
+
+The metadata of published datasets never changes, so it is saved to a local
+cache the first time each dataset is opened. Opening a dataset again, even
+in another process, then doesn't need any requests to the remote store.
+The cache can be filled for all datasets at once with
+[`prefill_metadata_cache`][hoa_tools.storage.prefill_metadata_cache].
+
+Recently decoded chunks of all datasets are kept in a single in-memory
+cache, so reading nearby planes with
+[`Dataset.get_slice`][hoa_tools.dataset.Dataset.get_slice] doesn't need
+any requests. Its size is set with
+[`set_chunk_cache_bytes`][hoa_tools.storage.set_chunk_cache_bytes].
+"""
+
+import asyncio
+import atexit
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import weakref
+from collections import deque
+from collections.abc import Awaitable, Callable, Iterable
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, TypeVar
+
+import aiohttp
+import fsspec.core
+import numpy as np
+from fsspec.asyn import AsyncFileSystem
+from fsspec.implementations.asyn_wrapper import AsyncFileSystemWrapper
+from gcsfs.retry import HttpError
+from pydantic import BaseModel, ConfigDict, Field
+from zarr.abc.store import ByteRequest, Store
+from zarr.core.buffer import Buffer, BufferPrototype, default_buffer_prototype
+from zarr.storage import WrapperStore
+
+if TYPE_CHECKING:
+    from hoa_tools.dataset import Dataset
+
+__all__ = [
+    "ManagedFileSystem",
+    "Mirror",
+    "RequestPolicy",
+    "add_mirror",
+    "clear_chunk_cache",
+    "clear_metadata_cache",
+    "clear_mirrors",
+    "get_chunk_cache_bytes",
+    "get_metadata_cache_dir",
+    "get_mirrors",
+    "get_request_policy",
+    "prefill_metadata_cache",
+    "resolve_url",
+    "set_chunk_cache_bytes",
+    "set_metadata_cache_dir",
+    "set_request_policy",
+]
+
+T = TypeVar("T")
+
+# Errors that will not go away if a request is retried
+_PERMANENT_ERRORS = (
+    FileNotFoundError,
+    IsADirectoryError,
+    NotADirectoryError,
+    PermissionError,
+)
+# HTTP status codes of errors that might go away if a request is retried
+_TRANSIENT_HTTP_CODES = (408, 429)
+_SERVER_ERROR_CODE = 500
+# Number of recent request latencies used to decide when to hedge
+_N_LATENCY_SAMPLES = 1000
+# Options used to open filesystems for each protocol, unless a mirror sets them
+_DEFAULT_STORAGE_OPTIONS: dict[str, dict[str, Any]] = {
+    "gs": {"project": "ucl-hip-ct", "token": "anon", "access": "read_only"},
+}
+# Keys of zarr metadata documents, which are saved in the metadata cache
+_METADATA_KEYS = (".zgroup", ".zarray", ".zattrs", ".zmetadata")
+
+
+class RequestPolicy(BaseModel):
+    """
+    How requests are made to remote stores.
+    """
+
+    model_config = ConfigDict(frozen=True)
+
+    max_concurrency: int = Field(default=64, gt=0)
+    """
+    Maximum number of requests in flight at once in each event loop.
+
+    The limit is shared by all filesystems using the same policy.
+    """
+    max_attempts: int = Field(default=4, gt=0)
+    """Maximum number of times a request is tried before giving up."""
+    backoff_initial_s: float = Field(default=0.2, gt=0)
+    """Maximum wait before the first retry, in seconds."""
+    backoff_max_s: float = Field(default=10, gt=0)
+    """Maximum wait before any retry, in seconds."""
+    hedge_quantile: float | None = Field(default=None, gt=0, lt=1)
+    """
+    Quantile of recent request latencies after which a duplicate request is sent.
+
+    For example, 0.95 sends a duplicate request if no response has arrived after
+    the 95th percentile of recent latencies. `None` never sends duplicate requests.
+    """
+    hedge_min_samples: int = Field(default=50, gt=0)
+    """Minimum number of recent latencies needed before sending duplicate requests."""
+
+    def backoff_s(self, attempt: int) -> float:
+        """
+        Get a random wait before retrying a request that failed.
+
+        Parameters
+        ----------
+        attempt :
+            Number of attempts that have failed so far.
+
+        """
+        max_wait = min(self.backoff_max_s, self.backoff_initial_s * 2 ** (attempt - 1))
+        return random.uniform(0, max_wait)  # noqa: S311
+
+
+_POLICY = RequestPolicy()
+
+
+def get_request_policy() -> RequestPolicy:
+    """
+    Get the policy used for requests to remote datasets.
+    """
+    return _POLICY
+
+
+def set_request_policy(policy: RequestPolicy) -> None:
+    """
+    Set the policy used for requests to remote datasets.
+
+    This applies to all requests made after it is called, including
+    requests for datasets that have already been opened.
+    """
+    global _POLICY  # noqa: PLW0603
+    _POLICY = policy
+
+
+class Mirror(BaseModel):
+    """
+    A copy of remote data stored somewhere else.
+    """
+
+    model_config = ConfigDict(frozen=True)
+
+    prefix: str
+    """Start of the URLs of the original data, e.g. ``"gs://bucket/"``."""
+    root: str
+    """
+    URL that replaces ``prefix`` to get the URL of the copy.
+
+    Can be any URL understood by `fsspec`, e.g. ``"/data/hoa/"``,
+    ``"s3://other-bucket/hoa/"`` or ``"memory://hoa/"``.
+    """
+    storage_options: dict[str, Any] = Field(default_factory=dict)
+    """Options used to open the filesystem of the copy."""
+
+    def map_url(self, url: str) -> str | None:
+        """
+        Get the URL of the copy of some data, or None if this mirror doesn't cover it.
+        """
+        if not url.startswith(self.prefix):
+            return None
+        return self.root + url.removeprefix(self.prefix)
+
+
+_MIRRORS: list[Mirror] = []
+
+
+def add_mirror(prefix: str, root: str, **storage_options: Any) -> None:
+    """
+    Add a mirror of remote data.
+
+    Each time a dataset is opened, the mirrors are checked in the order they were
+    added, and data is read from the first mirror that contains a copy of the
+    dataset. If no mirror contains a copy, data is read from the original store.
+    Mirrors should therefore be added from fastest to slowest.
+
+    Mirrors are not checked again for datasets that have already been opened.
+
+    Parameters
+    ----------
+    prefix :
+        Start of the URLs of the original data, e.g. ``"gs://bucket/"``.
+    root :
+        URL that replaces ``prefix`` to get the URL of the copy.
+    **storage_options :
+        Options used to open the filesystem of the copy.
+
+    For example, to read datasets from a local copy of the Human Organ Atlas
+    bucket when there is one, use
+    ``add_mirror("gs://ucl-hip-ct-35a68e99feaae8932b1d44da0358940b/", "/data/hoa/")``.
+
+    """
+    _MIRRORS.append(Mirror(prefix=prefix, root=root, storage_options=storage_options))
+
+
+def get_mirrors() -> list[Mirror]:
+    """
+    Get all the mirrors of remote data, in the order they are checked.
+    """
+    return list(_MIRRORS)
+
+
+def clear_mirrors() -> None:
+    """
+    Remove all the mirrors of remote data.
+    """
+    _MIRRORS.clear()
+
+
+def resolve_url(url: str) -> tuple[str, dict[str, Any]]:
+    """
+    Get the URL to read some data from, taking into account any mirrors.
+
+    Parameters
+    ----------
+    url :
+        URL of the original data.
+
+    Returns
+    -------
+    url :
+        URL of the first mirror that contains a copy of the data, or the
+        original URL if there are no copies.
+    storage_options :
+        Options used to open the filesystem at the URL.
+
+    """
+    for mirror in _MIRRORS:
+        mirror_url = mirror.map_url(url)
+        if mirror_url is None:
+            continue
+        fs, path = fsspec.core.url_to_fs(mirror_url, **mirror.storage_options)
+        if fs.exists(path):
+            return mirror_url, mirror.storage_options
+    protocol = fsspec.core.split_protocol(url)[0]
+    return url, _DEFAULT_STORAGE_OPTIONS.get(protocol or "file", {})
+
+
+def _open_url(url: str, *, cached: bool = True) -> tuple["ManagedFileSystem", str]:
+    """
+    Open the filesystem to read some data from, taking into account any mirrors.
+
+    Parameters
+    ----------
+    url :
+        URL of the original data.
+    cached :
+        If True, re-use a cached filesystem from the same thread, if possible.
+
+    Returns
+    -------
+    fs :
+        Managed async filesystem.
+    path :
+        Path to the data within the filesystem.
+
+    """
+    url, storage_options = resolve_url(url)
+    fs, path = fsspec.core.url_to_fs(
+        url, asynchronous=True, skip_instance_cache=not cached, **storage_options
+    )
+    if not fs.async_impl:
+        fs = AsyncFileSystemWrapper(fs, asynchronous=True)
+    return ManagedFileSystem(fs), path
+
+
+def _user_cache_dir() -> Path:
+    """
+    Directory that hoa-tools caches data in by default.
+    """
+    cache_home = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(cache_home) / "hoa-tools"
+
+
+def _write_text_atomic(path: Path, text: str) -> None:
+    """
+    Write a text file, so that readers never see a partially written file.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(
+        "w", dir=path.parent, suffix=".tmp", delete=False
+    ) as f:
+        f.write(text)
+    Path(f.name).replace(path)
+
+
+_METADATA_CACHE_DIR: Path | None = _user_cache_dir() / "metadata"
+
+
+def get_metadata_cache_dir() -> Path | None:
+    """
+    Get the directory that dataset metadata is cached in, or None if it isn't cached.
+    """
+    return _METADATA_CACHE_DIR
+
+
+def set_metadata_cache_dir(path: Path | None) -> None:
+    """
+    Set the directory that dataset metadata is cached in.
+
+    Defaults to ``hoa-tools/metadata`` in the user cache directory
+    (``$XDG_CACHE_HOME``, or ``~/.cache`` if that isn't set).
+    This applies to datasets opened after it is called.
+
+    Parameters
+    ----------
+    path :
+        Directory to cache metadata in. If None, metadata is not cached.
+
+    """
+    global _METADATA_CACHE_DIR  # noqa: PLW0603
+    _METADATA_CACHE_DIR = path
+
+
+def clear_metadata_cache() -> None:
+    """
+    Remove all the metadata in the metadata cache directory.
+    """
+    with _METADATA_CACHES_LOCK:
+        _METADATA_CACHES.clear()
+    if _METADATA_CACHE_DIR is not None:
+        for path in _METADATA_CACHE_DIR.glob("*.json"):
+            path.unlink()
+
+
+def prefill_metadata_cache(
+    datasets: Iterable["Dataset"] | None = None, *, max_workers: int = 8
+) -> None:
+    """
+    Fetch and cache the metadata of many datasets.
+
+    After this, opening any level of the datasets doesn't need any requests
+    to the remote store until the first chunk of data is read.
+
+    Parameters
+    ----------
+    datasets :
+        Datasets to fetch the metadata of. Defaults to all the datasets.
+    max_workers :
+        Maximum number of datasets to fetch the metadata of at once.
+
+    """
+    import hoa_tools.dataset  # noqa: PLC0415
+
+    if _METADATA_CACHE_DIR is None:
+        msg = "Metadata cache is disabled. Set a directory with set_metadata_cache_dir"
+        raise RuntimeError(msg)
+    if datasets is None:
+        datasets = hoa_tools.dataset._DATASETS.values()  # noqa: SLF001
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # Finding the downsample levels opens the metadata of every level
+        list(executor.map(lambda dataset: dataset.downsample_levels, datasets))
+    _flush_metadata_caches()
+
+
+def get_chunk_cache_bytes() -> int:
+    """
+    Get the maximum total size of the decoded chunks cached in memory.
+    """
+    from hoa_tools._chunks import _CHUNK_CACHE  # noqa: PLC0415
+
+    return _CHUNK_CACHE.max_bytes
+
+
+def set_chunk_cache_bytes(max_bytes: int) -> None:
+    """
+    Set the maximum total size of the decoded chunks cached in memory.
+
+    The cache is shared by all datasets and downsample levels, and defaults
+    to 64 MiB. The least recently used chunks are removed when it is full.
+    Chunks read for a plane are only cached if all the chunks that intersect
+    the plane fit in the cache, so re-using chunks of whole planes at fine
+    downsample levels needs a bigger cache.
+
+    Parameters
+    ----------
+    max_bytes :
+        Maximum total size of the cached chunks, in bytes. If 0, no chunks
+        are cached.
+
+    """
+    from hoa_tools._chunks import _CHUNK_CACHE  # noqa: PLC0415
+
+    if max_bytes < 0:
+        msg = f"max_bytes must be >= 0, got {max_bytes}"
+        raise ValueError(msg)
+    _CHUNK_CACHE.resize(max_bytes)
+
+
+def clear_chunk_cache() -> None:
+    """
+    Remove all the decoded chunks cached in memory.
+    """
+    from hoa_tools._chunks import _CHUNK_CACHE  # noqa: PLC0415
+
+    _CHUNK_CACHE.clear()
+
+
+class _MetadataCache:
+    """
+    Metadata documents of a single dataset, saved in a JSON file.
+
+    Documents that don't exist are saved too, so looking for them again
+    doesn't need a request. New documents are only written to the file
+    when the cache is flushed.
+    """
+
+    def __init__(self, path: Path, *, url: str) -> None:
+        self.path = path
+        self.url = url
+        self._lock = threading.Lock()
+        self._documents: dict[str, str | None] = {}
+        # If there are documents that haven't been written to the file yet
+        self._dirty = False
+        try:
+            saved = json.loads(path.read_text())
+        except (OSError, ValueError):
+            return
+        # The cache is only valid for the URL it was saved from
+        if isinstance(saved, dict) and saved.get("url") == url:
+            self._documents = saved.get("documents", {})
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._documents
+
+    def __getitem__(self, key: str) -> bytes | None:
+        document = self._documents[key]
+        return None if document is None else document.encode()
+
+    def __setitem__(self, key: str, value: bytes | None) -> None:
+        with self._lock:
+            self._documents[key] = None if value is None else value.decode()
+            self._dirty = True
+
+    def flush(self) -> None:
+        """
+        Write any new documents to the file.
+        """
+        with self._lock:
+            if not self._dirty:
+                return
+            _write_text_atomic(
+                self.path, json.dumps({"url": self.url, "documents": self._documents})
+            )
+            self._dirty = False
+
+
+_METADATA_CACHES: dict[Path, _MetadataCache] = {}
+_METADATA_CACHES_LOCK = threading.Lock()
+
+
+def _flush_metadata_cache(store: Store) -> None:
+    """
+    Write new metadata read through a store to the metadata cache.
+
+    Does nothing if the store doesn't cache metadata.
+    """
+    if isinstance(store, _MetadataCacheStore):
+        store._cache.flush()  # noqa: SLF001
+
+
+@atexit.register
+def _flush_metadata_caches() -> None:
+    """
+    Write new metadata in all the metadata caches.
+    """
+    with _METADATA_CACHES_LOCK:
+        caches = list(_METADATA_CACHES.values())
+    for cache in caches:
+        cache.flush()
+
+
+def _cache_metadata(store: Store, *, name: str, url: str) -> Store:
+    """
+    Wrap the store of a dataset so its metadata is cached.
+
+    Returns the store unchanged if the metadata cache is disabled.
+
+    Parameters
+    ----------
+    store :
+        Store containing the dataset.
+    name :
+        Name of the dataset.
+    url :
+        URL of the original dataset.
+
+    """
+    if _METADATA_CACHE_DIR is None:
+        return store
+    path = _METADATA_CACHE_DIR / f"{name}.json"
+    with _METADATA_CACHES_LOCK:
+        if path not in _METADATA_CACHES or _METADATA_CACHES[path].url != url:
+            _METADATA_CACHES[path] = _MetadataCache(path, url=url)
+        return _MetadataCacheStore(store, cache=_METADATA_CACHES[path])
+
+
+class _MetadataCacheStore(WrapperStore[Store]):
+    """
+    Read-only store that caches the metadata documents of another store.
+    """
+
+    def __init__(self, store: Store, *, cache: _MetadataCache) -> None:
+        super().__init__(store)
+        self._cache = cache
+
+    def _with_store(self, store: Store) -> "_MetadataCacheStore":
+        return type(self)(store, cache=self._cache)
+
+    async def get(
+        self,
+        key: str,
+        prototype: BufferPrototype,
+        byte_range: ByteRequest | None = None,
+    ) -> Buffer | None:
+        if byte_range is not None or not key.endswith(_METADATA_KEYS):
+            return await self._store.get(key, prototype, byte_range)
+        if key not in self._cache:
+            buffer = await self._store.get(key, prototype)
+            self._cache[key] = None if buffer is None else buffer.to_bytes()
+        value = self._cache[key]
+        return None if value is None else prototype.buffer.from_bytes(value)
+
+    async def exists(self, key: str) -> bool:
+        if not key.endswith(_METADATA_KEYS):
+            return await self._store.exists(key)
+        return await self.get(key, default_buffer_prototype()) is not None
+
+
+class _Limiter:
+    """
+    Concurrency limit and latency statistics shared by requests in one event loop.
+    """
+
+    def __init__(self, policy: RequestPolicy) -> None:
+        self.semaphore = asyncio.Semaphore(policy.max_concurrency)
+        self.latencies: deque[float] = deque(maxlen=_N_LATENCY_SAMPLES)
+
+    def hedge_delay(self, policy: RequestPolicy) -> float | None:
+        """
+        Time after which to send a duplicate request, or None to not send one.
+        """
+        if (
+            policy.hedge_quantile is None
+            or len(self.latencies) < policy.hedge_min_samples
+        ):
+            return None
+        return float(np.quantile(self.latencies, policy.hedge_quantile))
+
+
+_LIMITERS: weakref.WeakKeyDictionary[
+    asyncio.AbstractEventLoop, dict[RequestPolicy, _Limiter]
+] = weakref.WeakKeyDictionary()
+
+
+def _get_limiter(policy: RequestPolicy) -> _Limiter:
+    limiters = _LIMITERS.setdefault(asyncio.get_running_loop(), {})
+    if policy not in limiters:
+        limiters[policy] = _Limiter(policy)
+    return limiters[policy]
+
+
+def _is_transient(error: BaseException) -> bool:
+    """
+    Whether a request that raised an error might succeed if retried.
+    """
+    if isinstance(error, _PERMANENT_ERRORS):
+        return False
+    if isinstance(error, HttpError):
+        return error.code is not None and (
+            error.code in _TRANSIENT_HTTP_CODES or error.code >= _SERVER_ERROR_CODE
+        )
+    return isinstance(error, OSError | TimeoutError | aiohttp.ClientError)
+
+
+class ManagedFileSystem(AsyncFileSystem):  # type: ignore[misc]
+    """
+    Read-only async filesystem that controls the requests made to another filesystem.
+
+    Only the methods needed to read zarr and N5 stores are implemented.
+    Requests are never merged: every chunk of a dataset is stored in its own
+    object and read whole, so there are no byte ranges of one object to combine.
+    """
+
+    cachable = False
+
+    def __init__(
+        self, fs: AsyncFileSystem, *, policy: RequestPolicy | None = None
+    ) -> None:
+        """
+        Create a managed filesystem.
+
+        Parameters
+        ----------
+        fs :
+            Async filesystem to make requests to.
+        policy :
+            How to make requests. Defaults to the policy set with
+            [`set_request_policy`][hoa_tools.storage.set_request_policy],
+            at the time each request is made.
+
+        """
+        super().__init__(asynchronous=fs.asynchronous)
+        self.fs = fs
+        self._policy = policy
+
+    @property
+    def policy(self) -> RequestPolicy:
+        """
+        How requests are made.
+        """
+        return self._policy if self._policy is not None else _POLICY
+
+    async def _request(
+        self, func: Callable[[], Awaitable[T]], *, hedge: bool = False
+    ) -> T:
+        """
+        Make a request, retrying it if it fails.
+
+        Parameters
+        ----------
+        func :
+            Function that makes the request. May be called more than once.
+        hedge :
+            If True, a duplicate request may be sent if the request is slow.
+            Only use for requests that don't change anything in the store.
+
+        """
+        policy = self.policy
+        limiter = _get_limiter(policy)
+        for attempt in range(1, policy.max_attempts + 1):
+            try:
+                if hedge:
+                    return await self._hedged(func, limiter, policy)
+                return await self._timed(func, limiter)
+            except Exception as e:
+                if attempt == policy.max_attempts or not _is_transient(e):
+                    raise
+            await asyncio.sleep(policy.backoff_s(attempt))
+        raise AssertionError  # pragma: no cover
+
+    @staticmethod
+    async def _timed(func: Callable[[], Awaitable[T]], limiter: _Limiter) -> T:
+        """
+        Make a single request, recording how long it takes if it succeeds.
+        """
+        async with limiter.semaphore:
+            start = time.perf_counter()
+            result = await func()
+            limiter.latencies.append(time.perf_counter() - start)
+        return result
+
+    async def _hedged(
+        self,
+        func: Callable[[], Awaitable[T]],
+        limiter: _Limiter,
+        policy: RequestPolicy,
+    ) -> T:
+        """
+        Make a request, sending a duplicate if it takes longer than usual.
+
+        The first successful response is returned, and the other request cancelled.
+        """
+        delay = limiter.hedge_delay(policy)
+        if delay is None:
+            return await self._timed(func, limiter)
+
+        tasks = {asyncio.ensure_future(self._timed(func, limiter))}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                tasks.add(asyncio.ensure_future(self._timed(func, limiter)))
+            while True:
+                done, tasks = await asyncio.wait(
+                    tasks, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                if not tasks:
+                    # All requests failed
+                    return done.pop().result()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _cat_file(
+        self, path: str, start: int | None = None, end: int | None = None, **kwargs: Any
+    ) -> bytes:
+        return await self._request(
+            lambda: self.fs._cat_file(path, start=start, end=end, **kwargs),  # noqa: SLF001
+            hedge=True,
+        )
+
+    async def _info(self, path: str, **kwargs: Any) -> dict[str, Any]:
+        return await self._request(lambda: self.fs._info(path, **kwargs))  # noqa: SLF001
+
+    async def _exists(self, path: str, **kwargs: Any) -> bool:
+        return await self._request(lambda: self.fs._exists(path, **kwargs))  # noqa: SLF001
+
+    async def _ls(self, path: str, detail: bool = True, **kwargs: Any) -> list[Any]:  # noqa: FBT001, FBT002
+        return await self._request(lambda: self.fs._ls(path, detail=detail, **kwargs))  # noqa: SLF001
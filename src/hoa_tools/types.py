@@ -2,12 +2,38 @@
 Common types used across the library.
 """
 
+from collections.abc import Iterable, Iterator
 from math import floor
-from typing import Self
+from typing import TYPE_CHECKING, Any, Self, TypeVar
 
-import SimpleITK as sitk
+import numpy as np
+import numpy.typing as npt
 from pydantic import BaseModel
 
+if TYPE_CHECKING:
+    import SimpleITK as sitk
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+# Bypass BaseModel.__setattr__, which validates assignments
+_object_new = object.__new__
+_object_setattr = object.__setattr__
+
+
+def _construct(cls: type[ModelT], **values: Any) -> ModelT:
+    """
+    Create a model from values that are already known to be valid.
+
+    This skips validation. All fields must be given.
+    It is faster than ``BaseModel.model_construct``, which also fills in defaults.
+    """
+    model = _object_new(cls)
+    _object_setattr(model, "__dict__", values)
+    _object_setattr(model, "__pydantic_fields_set__", set(values))
+    _object_setattr(model, "__pydantic_extra__", None)
+    _object_setattr(model, "__pydantic_private__", None)
+    return model
+
 
 class PhysicalCoordinate(BaseModel):
     """
@@ -22,13 +48,14 @@ class PhysicalCoordinate(BaseModel):
         """
         Given a voxel size, convert this physical coordinate to an array coordinate.
         """
-        return ArrayCoordinate(
+        return _construct(
+            ArrayCoordinate,
             x=floor(self.x / voxel_size),
             y=floor(self.y / voxel_size),
             z=floor(self.z / voxel_size),
         )
 
-    def transform(self, t: sitk.Transform) -> Self:
+    def transform(self, t: "sitk.Transform") -> Self:
         """
         Transform this coordinate.
 
@@ -57,3 +84,135 @@ class ArrayCoordinate(BaseModel):
         return PhysicalCoordinate(
             x=self.x * voxel_size, y=self.y * voxel_size, z=self.z * voxel_size
         )
+
+
+def _as_points(zyx: npt.ArrayLike, dtype: type[np.generic]) -> npt.NDArray[np.generic]:
+    """
+    Convert to an (N, 3) array of points.
+    """
+    zyx = np.asarray(zyx, dtype=dtype)
+    if zyx.ndim != 2 or zyx.shape[1] != 3:  # noqa: PLR2004
+        msg = f"Coordinates must have shape (N, 3), got {zyx.shape}"
+        raise ValueError(msg)
+    return zyx
+
+
+class PhysicalCoordinates:
+    """
+    Many coordinates in physical space.
+
+    Coordinates are stored in a single (N, 3) array, with columns in (z, y, x) order.
+    """
+
+    def __init__(self, zyx: npt.ArrayLike) -> None:
+        """
+        Create a collection of physical coordinates.
+
+        Parameters
+        ----------
+        zyx :
+            (N, 3) array of coordinates, with columns in (z, y, x) order.
+
+        """
+        self.zyx: npt.NDArray[np.float64] = _as_points(zyx, np.float64)  # type: ignore[assignment]
+
+    @classmethod
+    def from_coordinates(cls, coordinates: Iterable[PhysicalCoordinate]) -> Self:
+        """
+        Create a collection from individual coordinates.
+        """
+        return cls(np.array([[c.z, c.y, c.x] for c in coordinates]).reshape(-1, 3))
+
+    def __len__(self) -> int:
+        """
+        Number of coordinates.
+        """
+        return len(self.zyx)
+
+    def __getitem__(self, index: int) -> PhysicalCoordinate:
+        """
+        Get a single coordinate.
+        """
+        z, y, x = self.zyx[index].tolist()
+        return PhysicalCoordinate(x=x, y=y, z=z)
+
+    def __iter__(self) -> Iterator[PhysicalCoordinate]:
+        """
+        Iterate over individual coordinates.
+        """
+        for z, y, x in self.zyx.tolist():
+            yield PhysicalCoordinate(x=x, y=y, z=z)
+
+    def to_array_coordinates(self, *, voxel_size: float) -> "ArrayCoordinates":
+        """
+        Given a voxel size, convert these physical coordinates to array coordinates.
+        """
+        return ArrayCoordinates(np.floor(self.zyx / voxel_size))
+
+    def transform(self, t: "sitk.Transform") -> Self:
+        """
+        Transform these coordinates.
+
+        Affine transforms are applied with a single matrix multiplication.
+
+        Notes
+        -----
+        The transform is applied in zyx order.
+
+        """
+        from hoa_tools._transforms import transform_points  # noqa: PLC0415
+
+        return self.__class__(transform_points(t, self.zyx))
+
+
+class ArrayCoordinates:
+    """
+    Many coordinates in array space.
+
+    Coordinates are stored in a single (N, 3) array, with columns in (z, y, x) order.
+    """
+
+    def __init__(self, zyx: npt.ArrayLike) -> None:
+        """
+        Create a collection of array coordinates.
+
+        Parameters
+        ----------
+        zyx :
+            (N, 3) array of coordinates, with columns in (z, y, x) order.
+
+        """
+        self.zyx: npt.NDArray[np.int64] = _as_points(zyx, np.int64)  # type: ignore[assignment]
+
+    @classmethod
+    def from_coordinates(cls, coordinates: Iterable[ArrayCoordinate]) -> Self:
+        """
+        Create a collection from individual coordinates.
+        """
+        return cls(np.array([[c.z, c.y, c.x] for c in coordinates]).reshape(-1, 3))
+
+    def __len__(self) -> int:
+        """
+        Number of coordinates.
+        """
+        return len(self.zyx)
+
+    def __getitem__(self, index: int) -> ArrayCoordinate:
+        """
+        Get a single coordinate.
+        """
+        z, y, x = self.zyx[index].tolist()
+        return ArrayCoordinate(x=x, y=y, z=z)
+
+    def __iter__(self) -> Iterator[ArrayCoordinate]:
+        """
+        Iterate over individual coordinates.
+        """
+        for z, y, x in self.zyx.tolist():
+            yield ArrayCoordinate(x=x, y=y, z=z)
+
+    def to_physical_coordinates(self, *, voxel_size: float) -> PhysicalCoordinates:
+        """
+        Given a voxel size, convert these array coordinates to physical coordinates.
+        """
+        return PhysicalCoordinates(self.zyx * voxel_size)
@@ -8,17 +8,55 @@ All coordinates are given in 'array coordinates',
 where 0 is the centre of the first voxel, 1 is the centre of the second voxel etc.
 """
 
+import asyncio
 import itertools
-from math import ceil, floor
-from typing import Any
+from collections.abc import AsyncIterator, Iterator, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from math import ceil, floor, prod
+from typing import Any, Literal
 
+import numpy as np
+import numpy.typing as npt
 import SimpleITK as sitk
 import xarray as xr
 from pydantic import BaseModel
 
-from hoa_tools.dataset import Dataset
+from hoa_tools._chunks import (
+    ChunkIndex,
+    LevelArray,
+    Region,
+    _relative_to,
+    intersect,
+)
+from hoa_tools._transforms import CORNER_MASKS, transform_points
+from hoa_tools.dataset import Dataset, _coordinate
 from hoa_tools.registration import Inventory as RegInventory
-from hoa_tools.types import ArrayCoordinate
+from hoa_tools.types import ArrayCoordinate, PhysicalCoordinate, _construct
+
+
+class ChunkFootprint(BaseModel):
+    """
+    The storage chunks that have to be fetched to read a VOI.
+
+    Chunk shapes and indices are given in (z, y, x) order.
+    """
+
+    chunk_shape: tuple[int, int, int]
+    """Shape of a single storage chunk."""
+    chunk_indices: list[tuple[int, int, int]]
+    """Indices of all the chunks that intersect the VOI."""
+    n_requests: int
+    """Number of requests needed to fetch the chunks."""
+    decompressed_bytes: int
+    """Number of bytes in all the chunks once they have been decompressed."""
+    compressed_bytes: int | None
+    """
+    Estimated number of bytes fetched from the remote store.
+
+    `None` if the compressed size was not estimated.
+    """
+    fraction_used: float
+    """Fraction of the fetched voxels that are inside the VOI."""
 
 
 class VOI(BaseModel):
@@ -35,6 +73,41 @@ class VOI(BaseModel):
     size: ArrayCoordinate
     """Size of VOI in array coordinates."""
 
+    @classmethod
+    def from_physical_region(
+        cls,
+        dataset: Dataset,
+        *,
+        lower_corner: PhysicalCoordinate,
+        upper_corner: PhysicalCoordinate,
+        downsample_level: int = 0,
+    ) -> "VOI":
+        """
+        Create the smallest VOI that contains a region in physical space.
+
+        Parameters
+        ----------
+        dataset :
+            Dataset that the VOI is in.
+        lower_corner, upper_corner :
+            Corners of the region, in micrometers.
+        downsample_level :
+            Downsampling level of the dataset to define the VOI in.
+
+        """
+        voxel_size = dataset.data.voxel_size_um * 2**downsample_level
+        lower = lower_corner.to_array_coordinate(voxel_size=voxel_size)
+        return cls(
+            dataset=dataset,
+            downsample_level=downsample_level,
+            lower_corner=lower,
+            size=ArrayCoordinate(
+                x=ceil(upper_corner.x / voxel_size) - lower.x,
+                y=ceil(upper_corner.y / voxel_size) - lower.y,
+                z=ceil(upper_corner.z / voxel_size) - lower.z,
+            ),
+        )
+
     @property
     def voxel_size_um(self) -> float:
         """
@@ -47,7 +120,8 @@ class VOI(BaseModel):
         """
         Upper corner of the VOI.
         """
-        return ArrayCoordinate(
+        return _construct(
+            ArrayCoordinate,
             x=self.lower_corner.x + self.size.x,
             y=self.lower_corner.y + self.size.y,
             z=self.lower_corner.z + self.size.z,
@@ -58,26 +132,342 @@ class VOI(BaseModel):
         """
         All 8 corners of the VOI.
         """
-        corner_tuples: list[tuple[int, int, int]] = list(
-            itertools.product(  # type: ignore[arg-type]
-                *zip(
-                    [self.lower_corner.x, self.lower_corner.y, self.lower_corner.z],
-                    [self.upper_corner.x, self.upper_corner.y, self.upper_corner.z],
-                    strict=True,
+        lower = self.lower_corner
+        upper = self.upper_corner
+        return [
+            _construct(ArrayCoordinate, x=x, y=y, z=z)
+            for x, y, z in itertools.product(
+                (lower.x, upper.x), (lower.y, upper.y), (lower.z, upper.z)
+            )
+        ]
+
+    def get_data_array(
+        self,
+        *,
+        storage_chunks_per_task: int | tuple[int, int, int] = 1,
+        task_bytes: int | None = None,
+    ) -> xr.DataArray:
+        """
+        Get data array for this VOI.
+
+        The data array is backed by a lazy dask array, with tasks only for the
+        storage chunks that intersect the VOI.
+
+        Parameters
+        ----------
+        storage_chunks_per_task, task_bytes :
+            How many storage chunks are read by a single dask task.
+            See [`Dataset.data_array`][hoa_tools.dataset.Dataset.data_array].
+
+        """
+        level_array = self.dataset._level_array(  # noqa: SLF001
+            downsample_level=self.downsample_level
+        )
+        region = self._region(level_array)
+        task_shape = level_array.task_shape(
+            storage_chunks_per_task=storage_chunks_per_task, task_bytes=task_bytes
+        )
+        return self._to_data_array(
+            level_array.to_dask(region, task_shape=task_shape), region
+        )
+
+    async def get_data_array_async(self) -> xr.DataArray:
+        """
+        Get data for this VOI, without blocking the running event loop.
+
+        Unlike [`get_data_array`][hoa_tools.voi.VOI.get_data_array], this fetches
+        the data straight away and returns an in-memory data array.
+        Chunks are fetched concurrently in the running event loop, so many VOIs
+        can be fetched at once using ``asyncio.gather``, sharing connections to
+        the remote store.
+        """
+        level_array = await self.dataset._async_level_array(  # noqa: SLF001
+            downsample_level=self.downsample_level
+        )
+        region = self._region(level_array)
+        return self._to_data_array(await level_array.read_async(region), region)
+
+    async def iter_chunks_async(
+        self, *, max_concurrency: int = 8
+    ) -> AsyncIterator[xr.DataArray]:
+        """
+        Iterate over the data for this VOI, one storage chunk at a time.
+
+        Each item is the part of this VOI within a single storage chunk, as an
+        in-memory data array. Items are yielded as soon as they are fetched,
+        so are not in any particular order.
+
+        Parameters
+        ----------
+        max_concurrency :
+            Maximum number of chunks to fetch concurrently. At most this many
+            chunks are held in memory waiting to be yielded.
+
+        """
+        level_array = await self.dataset._async_level_array(  # noqa: SLF001
+            downsample_level=self.downsample_level
+        )
+        region = self._region(level_array)
+
+        async def read(chunk: ChunkIndex) -> xr.DataArray:
+            chunk_region = intersect(region, level_array.chunk_region(chunk))
+            data = await level_array.read_async(chunk_region)
+            return self._to_data_array(data, chunk_region)
+
+        chunks = iter(level_array.chunk_indices(region))
+        pending: set[asyncio.Task[xr.DataArray]] = set()
+        try:
+            while True:
+                for chunk in itertools.islice(chunks, max_concurrency - len(pending)):
+                    pending.add(asyncio.ensure_future(read(chunk)))
+                if not pending:
+                    return
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
                 )
+                for task in done:
+                    yield task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def iter_progressive(
+        self, *, coarsest_level: int | None = None
+    ) -> Iterator[tuple["VOI", xr.DataArray]]:
+        """
+        Iterate over the data for this VOI, from the coarsest level to this VOI's level.
+
+        The same region is read at every available downsample level, starting
+        with the coarsest level and finishing with the downsample level of this
+        VOI. Coarse levels are small, so the first item is available quickly,
+        however fine the level of this VOI is.
+
+        While each item is being used, the data for the next level is fetched in
+        the background. Fetching stops when the iterator is closed, or no longer
+        referenced, but a level that is already being fetched is still fetched.
+        Use [`iter_progressive_async`][hoa_tools.voi.VOI.iter_progressive_async]
+        to cancel requests that are in flight.
+
+        Parameters
+        ----------
+        coarsest_level :
+            Coarsest downsample level to read. Defaults to the coarsest level
+            available.
+
+        Yields
+        ------
+        voi :
+            This VOI at the level that was read, created using
+            [`VOI.change_downsample_level`][hoa_tools.voi.VOI.change_downsample_level].
+        data_array :
+            In-memory data array for the VOI at that level.
+
+        """
+        vois = self._progressive_vois(
+            list(self.dataset._levels),  # noqa: SLF001
+            coarsest_level=coarsest_level,
+        )
+        executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            future = executor.submit(vois[0]._read)  # noqa: SLF001
+            for i, voi in enumerate(vois):
+                data_array = future.result()
+                if i + 1 < len(vois):
+                    future = executor.submit(vois[i + 1]._read)  # noqa: SLF001
+                yield voi, data_array
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    async def iter_progressive_async(
+        self, *, coarsest_level: int | None = None
+    ) -> AsyncIterator[tuple["VOI", xr.DataArray]]:
+        """
+        Iterate over the data for this VOI, from the coarsest level to this VOI's level.
+
+        This is the async version of
+        [`iter_progressive`][hoa_tools.voi.VOI.iter_progressive]. Data is fetched
+        in the running event loop. When the iterator is closed, or the task
+        iterating over it is cancelled, requests for the next level that are in
+        flight are cancelled.
+
+        Parameters
+        ----------
+        coarsest_level :
+            Coarsest downsample level to read. Defaults to the coarsest level
+            available.
+
+        Yields
+        ------
+        voi :
+            This VOI at the level that was read.
+        data_array :
+            In-memory data array for the VOI at that level.
+
+        """
+        # Looking up the available levels is blocking, so is done in a thread
+        levels = await asyncio.to_thread(lambda: list(self.dataset._levels))  # noqa: SLF001
+        vois = self._progressive_vois(levels, coarsest_level=coarsest_level)
+        task = asyncio.ensure_future(vois[0].get_data_array_async())
+        try:
+            for i, voi in enumerate(vois):
+                data_array = await task
+                if i + 1 < len(vois):
+                    task = asyncio.ensure_future(vois[i + 1].get_data_array_async())
+                yield voi, data_array
+        finally:
+            task.cancel()
+
+    def _progressive_vois(
+        self, levels: list[int], *, coarsest_level: int | None
+    ) -> list["VOI"]:
+        """
+        Get this VOI at each level read by a progressive read, coarsest first.
+        """
+        if self.downsample_level not in levels:
+            msg = (
+                f"Downsample level {self.downsample_level} is not available "
+                f"for {self.dataset.name}"
             )
+            raise ValueError(msg)
+        return [
+            self.change_downsample_level(new_downsample_level=level)
+            for level in sorted(levels, reverse=True)
+            if self.downsample_level <= level
+            and (coarsest_level is None or level <= coarsest_level)
+        ]
+
+    def _read(self) -> xr.DataArray:
+        """
+        Read the data for this VOI into memory.
+        """
+        level_array = self.dataset._level_array(  # noqa: SLF001
+            downsample_level=self.downsample_level
         )
-        return [ArrayCoordinate(x=i[0], y=i[1], z=i[2]) for i in corner_tuples]
+        region = self._region(level_array)
+        return self._to_data_array(level_array.read(region), region)
 
-    def get_data_array(self) -> xr.DataArray:
+    def _region(self, level_array: LevelArray) -> Region:
         """
-        Get data array for this VOI.
+        Region of the remote array covered by this VOI, in (z, y, x) order.
         """
-        da = self.dataset.data_array(downsample_level=self.downsample_level)
-        return da.isel(
-            x=slice(self.lower_corner.x, self.upper_corner.x),
-            y=slice(self.lower_corner.y, self.upper_corner.y),
-            z=slice(self.lower_corner.z, self.upper_corner.z),
+        return level_array.clip(
+            (self.lower_corner.z, self.lower_corner.y, self.lower_corner.x),
+            (self.upper_corner.z, self.upper_corner.y, self.upper_corner.x),
+        )
+
+    def _to_data_array(self, data: Any, region: Region) -> xr.DataArray:
+        """
+        Wrap data read from a region of the remote array in a DataArray.
+
+        The data can either be a numpy array, or a lazy dask array.
+        """
+        return xr.DataArray(
+            data,
+            name=self.dataset.name,
+            dims=["z", "y", "x"],
+            coords={
+                dim: _coordinate(
+                    dim,
+                    start=sl.start,
+                    size=sl.stop - sl.start,
+                    spacing=self.voxel_size_um,
+                )
+                for dim, sl in zip(["z", "y", "x"], region, strict=True)
+            },
+        )
+
+    def chunk_footprint(self, *, n_samples: int = 8) -> ChunkFootprint:
+        """
+        Get the storage chunks that have to be fetched to read this VOI.
+
+        Parameters
+        ----------
+        n_samples :
+            Number of chunks to look up the stored size of, to estimate the
+            compressed size of all the chunks. Each look up makes a request to the
+            remote store, but does not fetch any data.
+            If 0, the compressed size is not estimated.
+
+        """
+        level_array = self.dataset._level_array(  # noqa: SLF001
+            downsample_level=self.downsample_level
+        )
+        region = self._region(level_array)
+        chunk_indices = level_array.chunk_indices(region)
+        fetched_voxels = len(chunk_indices) * prod(level_array.chunks)
+
+        compressed_bytes = None
+        if n_samples > 0:
+            step = max(len(chunk_indices) // n_samples, 1)
+            samples = chunk_indices[::step][:n_samples]
+            sizes = level_array.stored_chunk_sizes(samples)
+            compressed_bytes = (
+                round(sum(sizes) / len(sizes) * len(chunk_indices)) if sizes else 0
+            )
+
+        return ChunkFootprint(
+            chunk_shape=level_array.chunks,
+            chunk_indices=chunk_indices,
+            n_requests=len(chunk_indices),
+            decompressed_bytes=fetched_voxels * level_array.dtype.itemsize,
+            compressed_bytes=compressed_bytes,
+            fraction_used=(
+                prod(sl.stop - sl.start for sl in region) / fetched_voxels
+                if fetched_voxels
+                else 0.0
+            ),
+        )
+
+    def snap_to_chunks(
+        self, *, direction: Literal["outward", "inward"] = "outward"
+    ) -> "VOI":
+        """
+        Return a new VOI with all faces moved on to storage chunk boundaries.
+
+        Reading a chunk-aligned VOI does not fetch any voxels outside the VOI.
+
+        Parameters
+        ----------
+        direction :
+            If "outward", the new VOI contains this VOI, clipped to the bounds of
+            the dataset.
+            If "inward", the new VOI is contained in this VOI. The bounds of the
+            dataset are treated as chunk boundaries.
+
+        """
+        level_array = self.dataset._level_array(  # noqa: SLF001
+            downsample_level=self.downsample_level
+        )
+        lower = []
+        upper = []
+        for sl, c, s in zip(
+            self._region(level_array),
+            level_array.chunks,
+            level_array.shape,
+            strict=True,
+        ):
+            if direction == "outward":
+                lower.append(sl.start // c * c)
+                upper.append(min(-(-sl.stop // c) * c, s))
+            else:
+                lower.append(min(-(-sl.start // c) * c, s))
+                upper.append(s if sl.stop == s else sl.stop // c * c)
+
+        if any(lo >= up for lo, up in zip(lower, upper, strict=True)):
+            msg = (
+                "VOI does not contain any whole chunks"
+                if direction == "inward"
+                else "VOI is outside the bounds of the dataset"
+            )
+            raise ValueError(msg)
+
+        return VOI(
+            dataset=self.dataset,
+            downsample_level=self.downsample_level,
+            lower_corner=ArrayCoordinate(z=lower[0], y=lower[1], x=lower[2]),
+            size=ArrayCoordinate(
+                z=upper[0] - lower[0], y=upper[1] - lower[1], x=upper[2] - lower[2]
+            ),
         )
 
     def get_sitk_image(self) -> sitk.Image:
@@ -122,14 +512,18 @@ class VOI(BaseModel):
 
         """
         if transform is None:
-            transform = RegInventory.get_registration(
-                source_dataset=self.dataset, target_dataset=target_voi.dataset
+            inverse_transform = RegInventory.get_inverse_registration(
+                source_dataset=self.dataset,
+                target_dataset=target_voi.dataset,
+                flatten=True,
             )
+        else:
+            inverse_transform = transform.GetInverse()  # type: ignore[no-untyped-call]
         default_value = 0
         new_image = sitk.Resample(
             self.get_sitk_image(),
             target_voi.get_sitk_image(),
-            transform.GetInverse(),  # type: ignore[no-untyped-call]
+            inverse_transform,
             interpolator,
             default_value,
         )
@@ -143,17 +537,20 @@ class VOI(BaseModel):
         Return a new VOI at a different downsample level.
         """
         resolution_ratio = (2**self.downsample_level) / (2**new_downsample_level)
-        new_lower_corner = ArrayCoordinate(
+        new_lower_corner = _construct(
+            ArrayCoordinate,
             x=floor(self.lower_corner.x * resolution_ratio),
             y=floor(self.lower_corner.y * resolution_ratio),
             z=floor(self.lower_corner.z * resolution_ratio),
         )
-        new_size = ArrayCoordinate(
+        new_size = _construct(
+            ArrayCoordinate,
             x=ceil(self.size.x * resolution_ratio),
             y=ceil(self.size.y * resolution_ratio),
             z=ceil(self.size.z * resolution_ratio),
         )
-        return VOI(
+        return _construct(
+            VOI,
             dataset=self.dataset,
             downsample_level=new_downsample_level,
             lower_corner=new_lower_corner,
@@ -180,51 +577,249 @@ class VOI(BaseModel):
             If not given, transform is taken from the registration inventory.
 
         """
-        if transform is None:
-            if (self.dataset, dataset) not in RegInventory:
-                msg = (
-                    f"Transform between {self.dataset.name} and {dataset.name} "
-                    "not found in registration inventory."
-                )
-                raise RuntimeError(msg)
+        return transform_vois_to([self], dataset, transform=transform)[0]
 
-            transform = RegInventory.get_registration(
-                source_dataset=self.dataset, target_dataset=dataset
-            )
 
-        old_voi = self.change_downsample_level(new_downsample_level=0)
+def transform_vois_to(
+    vois: Sequence[VOI],
+    dataset: Dataset,
+    *,
+    transform: sitk.Transform | None = None,
+) -> list[VOI]:
+    """
+    Transform many VOIs to another dataset.
 
-        # Convert to physical space
-        physical_corners = [
-            c.to_physical_coordinate(voxel_size=self.dataset.data.voxel_size_um)
-            for c in old_voi.corners
-        ]
-        # Transform
-        physical_corners_transformed = [
-            c.transform(transform) for c in physical_corners
-        ]
-        # Convert back to array space
-        corners_transformed = [
-            c.to_array_coordinate(voxel_size=dataset.data.voxel_size_um)
-            for c in physical_corners_transformed
-        ]
-        lower_corner = ArrayCoordinate(
-            z=min([c.z for c in corners_transformed]),
-            y=min([c.y for c in corners_transformed]),
-            x=min([c.x for c in corners_transformed]),
-        )
-        upper_corner = ArrayCoordinate(
-            z=max([c.z for c in corners_transformed]) + 1,
-            y=max([c.y for c in corners_transformed]) + 1,
-            x=max([c.x for c in corners_transformed]) + 1,
+    This gives the same result as calling
+    [`VOI.transform_to`][hoa_tools.voi.VOI.transform_to] on each VOI, but
+    transforms the corners of all the VOIs together as a single array.
+
+    Parameters
+    ----------
+    vois :
+        VOIs to transform. All VOIs must be in the same dataset, but can be at
+        different downsample levels.
+    dataset :
+        Dataset to transform to.
+    transform :
+        If given, transform used to map the VOIs on to the target dataset.
+        If not given, transform is taken from the registration inventory.
+
+    Returns
+    -------
+    vois :
+        Transformed VOIs, at downsample level 0, in the same order as ``vois``.
+
+    """
+    if len(vois) == 0:
+        return []
+    source_dataset = vois[0].dataset
+    if any(voi.dataset.name != source_dataset.name for voi in vois):
+        msg = "All VOIs must be in the same dataset"
+        raise ValueError(msg)
+
+    if transform is None:
+        if (source_dataset, dataset) not in RegInventory:
+            msg = (
+                f"Transform between {source_dataset.name} and {dataset.name} "
+                "not found in registration inventory."
+            )
+            raise RuntimeError(msg)
+
+        transform = RegInventory.get_registration(
+            source_dataset=source_dataset, target_dataset=dataset, flatten=True
         )
-        return VOI(
+
+    # Lower and upper corners at downsample level 0, in (z, y, x) order
+    scale = np.array([2**voi.downsample_level for voi in vois])[:, np.newaxis]
+    lower = (
+        np.array([[v.lower_corner.z, v.lower_corner.y, v.lower_corner.x] for v in vois])
+        * scale
+    )
+    upper = lower + np.array([[v.size.z, v.size.y, v.size.x] for v in vois]) * scale
+    # All 8 corners of each VOI, with shape (n_vois, 8, 3)
+    corners = np.where(CORNER_MASKS, upper[:, np.newaxis], lower[:, np.newaxis])
+
+    # Convert to physical space, transform, and convert back to array space
+    physical_corners = corners * source_dataset.data.voxel_size_um
+    physical_corners = transform_points(
+        transform, physical_corners.reshape(-1, 3)
+    ).reshape(physical_corners.shape)
+    corners = np.floor(physical_corners / dataset.data.voxel_size_um).astype(int)
+
+    new_lower = corners.min(axis=1)
+    new_size = corners.max(axis=1) + 1 - new_lower
+    return [
+        _construct(
+            VOI,
             dataset=dataset,
             downsample_level=0,
-            lower_corner=lower_corner,
-            size=ArrayCoordinate(
-                x=upper_corner.x - lower_corner.x,
-                y=upper_corner.y - lower_corner.y,
-                z=upper_corner.z - lower_corner.z,
-            ),
+            lower_corner=_construct(ArrayCoordinate, x=lo[2], y=lo[1], z=lo[0]),
+            size=_construct(ArrayCoordinate, x=sz[2], y=sz[1], z=sz[0]),
         )
+        # Convert to lists of Python ints
+        for lo, sz in zip(new_lower.tolist(), new_size.tolist(), strict=True)
+    ]
+
+
+def select_downsample_level(
+    voi: VOI,
+    *,
+    max_bytes: int | None = None,
+    max_voxels: int | None = None,
+    min_voxel_size_um: float | None = None,
+) -> VOI:
+    """
+    Get a VOI covering the same region at the finest level that fits in a budget.
+
+    The size of the VOI at each downsample level is computed using the shapes of
+    the levels in the remote store, so VOIs near the edge of a dataset are
+    not penalised for the parts that lie outside it.
+    To select a level for a whole dataset, pass a VOI that covers the whole
+    dataset.
+
+    Parameters
+    ----------
+    voi :
+        VOI to fit in the budget.
+    max_bytes :
+        Maximum number of bytes in the data for the new VOI.
+    max_voxels :
+        Maximum number of voxels in the new VOI.
+    min_voxel_size_um :
+        Minimum voxel size of the new VOI, in micrometers.
+
+    Returns
+    -------
+    voi :
+        New VOI, created using
+        [`VOI.change_downsample_level`][hoa_tools.voi.VOI.change_downsample_level].
+
+    Raises
+    ------
+    ValueError
+        If the VOI does not fit in the budget at any of the available levels.
+
+    """
+    for downsample_level, level_array in voi.dataset._levels.items():  # noqa: SLF001
+        new_voi = voi.change_downsample_level(new_downsample_level=downsample_level)
+        n_voxels = prod(sl.stop - sl.start for sl in new_voi._region(level_array))  # noqa: SLF001
+        if (
+            (max_voxels is None or n_voxels <= max_voxels)
+            and (
+                max_bytes is None or n_voxels * level_array.dtype.itemsize <= max_bytes
+            )
+            and (
+                min_voxel_size_um is None or new_voi.voxel_size_um >= min_voxel_size_um
+            )
+        ):
+            return new_voi
+
+    msg = f"VOI does not fit within the budget at any level of {voi.dataset.name}"
+    raise ValueError(msg)
+
+
+def get_data_arrays(vois: Sequence[VOI], *, max_workers: int = 8) -> list[xr.DataArray]:
+    """
+    Get data for many VOIs at once.
+
+    This is equivalent to loading ``voi.get_data_array()`` for each VOI, but
+    each chunk touched by one or more of the VOIs is only fetched and decoded once.
+
+    Parameters
+    ----------
+    vois :
+        VOIs to get data for. All VOIs must be in the same dataset and at the
+        same downsample level.
+    max_workers :
+        Maximum number of chunks to fetch concurrently.
+
+    Returns
+    -------
+    data_arrays :
+        In-memory data arrays, in the same order as ``vois``.
+
+    """
+    data_arrays = dict(iter_data_arrays(vois, max_workers=max_workers))
+    return [data_arrays[i] for i in range(len(vois))]
+
+
+def iter_data_arrays(
+    vois: Sequence[VOI], *, max_workers: int = 8
+) -> Iterator[tuple[int, xr.DataArray]]:
+    """
+    Iterate over data for many VOIs, as soon as the data for each one is available.
+
+    Each chunk touched by one or more of the VOIs is only fetched and decoded once,
+    and is kept in memory only until all the VOIs that need it have been yielded.
+    Chunks are requested in the order of the VOIs that need them, so VOIs near
+    the start of ``vois`` tend to be yielded first. At most ``2 * max_workers``
+    chunks are fetched ahead of the VOIs being yielded.
+
+    Parameters
+    ----------
+    vois :
+        VOIs to get data for. All VOIs must be in the same dataset and at the
+        same downsample level.
+    max_workers :
+        Maximum number of chunks to fetch concurrently.
+
+    Yields
+    ------
+    index :
+        Index of the VOI in ``vois``.
+    data_array :
+        In-memory data array for the VOI.
+
+    """
+    if len(vois) == 0:
+        return
+    dataset = vois[0].dataset
+    downsample_level = vois[0].downsample_level
+    if any(
+        voi.dataset.name != dataset.name or voi.downsample_level != downsample_level
+        for voi in vois
+    ):
+        msg = "All VOIs must be in the same dataset and at the same downsample level"
+        raise ValueError(msg)
+
+    level_array = dataset._level_array(downsample_level=downsample_level)  # noqa: SLF001
+    regions = [voi._region(level_array) for voi in vois]  # noqa: SLF001
+    voi_chunks = [level_array.chunk_indices(region) for region in regions]
+
+    # Map each chunk to the VOIs that need it
+    chunk_vois: dict[ChunkIndex, list[int]] = {}
+    for i, chunks in enumerate(voi_chunks):
+        for chunk in chunks:
+            chunk_vois.setdefault(chunk, []).append(i)
+    n_missing = [len(chunks) for chunks in voi_chunks]
+    n_waiting = {chunk: len(i) for chunk, i in chunk_vois.items()}
+    fetched: dict[ChunkIndex, npt.NDArray[np.generic]] = {}
+
+    def assemble(i: int) -> xr.DataArray:
+        region = regions[i]
+        data = np.empty([sl.stop - sl.start for sl in region], dtype=level_array.dtype)
+        for chunk in voi_chunks[i]:
+            chunk_region = level_array.chunk_region(chunk)
+            overlap = intersect(region, chunk_region)
+            data[_relative_to(overlap, region)] = fetched[chunk][
+                _relative_to(overlap, chunk_region)
+            ]
+            n_waiting[chunk] -= 1
+            if n_waiting[chunk] == 0:
+                del fetched[chunk]
+        return vois[i]._to_data_array(data, region)  # noqa: SLF001
+
+    for i, n in enumerate(n_missing):
+        if n == 0:
+            yield i, assemble(i)
+
+    # Only a few chunks are fetched ahead of the VOIs being yielded, so memory use
+    # doesn't depend on the total number of chunks
+    for chunk, data in level_array.map_chunks(
+        lambda data: data, chunk_vois, max_workers=max_workers
+    ):
+        fetched[chunk] = data
+        for i in chunk_vois[chunk]:
+            n_missing[i] -= 1
+            if n_missing[i] == 0:
+                yield i, assemble(i)
@@ -0,0 +1,61 @@
+"""
+Benchmark building models with and without validation.
+
+Run with ``python tests/benchmark_construct.py``.
+"""
+
+import timeit
+from collections.abc import Callable
+from functools import partial
+from typing import Any
+
+from hoa_tools.dataset import get_dataset
+from hoa_tools.types import ArrayCoordinate, PhysicalCoordinate, _construct
+from hoa_tools.voi import VOI
+
+NUMBER = 20_000
+REPEAT = 7
+
+
+def _time_per_call(func: Callable[[], Any]) -> float:
+    """
+    Best time per call, in microseconds.
+    """
+    return min(timeit.repeat(func, number=NUMBER, repeat=REPEAT)) / NUMBER * 1e6
+
+
+def main() -> None:
+    """
+    Print the time per call of validated and unvalidated construction.
+    """
+    dataset = get_dataset("LADAF-2020-27_spleen_complete-organ_25.08um_bm05")
+    lower = ArrayCoordinate(x=1, y=2, z=3)
+    size = ArrayCoordinate(x=30, y=20, z=10)
+    voi_values = {
+        "dataset": dataset,
+        "downsample_level": 2,
+        "lower_corner": lower,
+        "size": size,
+    }
+    cases: dict[str, tuple[type[Any], dict[str, Any]]] = {
+        "ArrayCoordinate": (ArrayCoordinate, {"x": 1, "y": 2, "z": 3}),
+        "PhysicalCoordinate": (PhysicalCoordinate, {"x": 1.5, "y": 2.5, "z": 3.5}),
+        "VOI": (VOI, voi_values),
+    }
+    voi = VOI(**voi_values)
+    print(f"{'':<30}{'validated':>12}{'_construct':>12}")  # noqa: T201
+    for name, (cls, values) in cases.items():
+        validated = _time_per_call(partial(cls, **values))
+        constructed = _time_per_call(partial(_construct, cls, **values))
+        print(f"{name:<30}{validated:>10.2f}us{constructed:>10.2f}us")  # noqa: T201
+    for name, func in {
+        "VOI.corners": lambda: voi.corners,
+        "VOI.change_downsample_level": lambda: voi.change_downsample_level(
+            new_downsample_level=0
+        ),
+    }.items():
+        print(f"{name:<30}{'':>12}{_time_per_call(func):>10.2f}us")  # noqa: T201
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+from collections.abc import Iterator
+from pathlib import Path
+
+import numpy as np
+import pytest
+import zarr
+import zarr.storage
+
+import hoa_tools.statistics
+import hoa_tools.storage
+from hoa_tools.dataset import Dataset, get_dataset
+
+# Shape and chunks of the local arrays at level 0, in (z, y, x) order
+LOCAL_SHAPE = (24, 33, 40)
+LOCAL_CHUNKS = (8, 8, 16)
+LOCAL_LEVELS = 3
+
+
+def local_data(downsample_level: int) -> np.ndarray:
+    """
+    Data stored in the local arrays, in (z, y, x) order.
+    """
+    rng = np.random.default_rng(seed=downsample_level)
+    shape = [-(-s // 2**downsample_level) for s in LOCAL_SHAPE]
+    return rng.integers(0, 2**16, size=shape, dtype=np.uint16)
+
+
+@pytest.fixture(autouse=True)
+def metadata_cache_dir(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> Iterator[Path]:
+    """
+    Cache dataset metadata and statistics in a temporary directory.
+    """
+    path = tmp_path / "metadata_cache"
+    monkeypatch.setattr(hoa_tools.storage, "_METADATA_CACHE_DIR", path)
+    monkeypatch.setattr(hoa_tools.storage, "_METADATA_CACHES", {})
+    monkeypatch.setattr(hoa_tools.statistics, "_CACHE_DIR", tmp_path / "statistics")
+    return path
+
+
+@pytest.fixture(autouse=True)
+def chunk_cache() -> Iterator[None]:
+    """
+    Start each test with an empty chunk cache of the default size.
+    """
+    max_bytes = hoa_tools.storage.get_chunk_cache_bytes()
+    hoa_tools.storage.clear_chunk_cache()
+    yield
+    hoa_tools.storage.set_chunk_cache_bytes(max_bytes)
+    hoa_tools.storage.clear_chunk_cache()
+
+
+@pytest.fixture(params=["n5", "zarr"])
+def local_dataset(request: pytest.FixtureRequest, monkeypatch) -> Iterator[Dataset]:
+    """
+    A dataset with its remote data replaced by small in-memory arrays.
+
+    Parametrized over the two remote formats, because N5 arrays are stored in
+    (z, y, x) order and OME-Zarr arrays are stored in (x, y, z) order.
+    """
+    if request.param == "n5":
+        dataset = get_dataset("LADAF-2020-27_spleen_complete-organ_25.08um_bm05")
+    else:
+        dataset = get_dataset("A186_lung_right_complete-organ_24.132um_bm18")
+    assert dataset._remote_fmt == request.param  # noqa: SLF001
+
+    group = zarr.open_group(zarr.storage.MemoryStore(), mode="w", zarr_format=2)
+    for level in range(LOCAL_LEVELS):
+        data = local_data(level)
+        chunks = LOCAL_CHUNKS
+        if request.param == "n5":
+            key = f"s{level}"
+        else:
+            key = f"{level}"
+            data = data.T
+            chunks = chunks[::-1]
+        array = group.create_array(
+            key, shape=data.shape, chunks=chunks, dtype=data.dtype
+        )
+        array[:] = data
+
+    # Remove any properties cached from the remote arrays by other tests
+    clear_cached_properties(dataset)
+    monkeypatch.setitem(dataset.__dict__, "_new_remote_store", lambda **_: group.store)
+    yield dataset
+    # Remove any properties cached from the local arrays
+    clear_cached_properties(dataset)
+
+
+def clear_cached_properties(dataset: Dataset) -> None:
+    for key in list(dataset.__dict__):
+        if key not in Dataset.model_fields:
+            del dataset.__dict__[key]
@@ -1,8 +1,16 @@
 import re
+import subprocess
+import sys
 from pathlib import Path
 
+import dask.array
+import numpy as np
 import pytest
+import xarray as xr
+from conftest import LOCAL_CHUNKS, LOCAL_LEVELS, local_data
 
+import hoa_tools.storage
+from hoa_tools._chunks import LevelArray
 from hoa_tools.dataset import _META_DIR, Dataset, change_metadata_directory, get_dataset
 
 
@@ -59,6 +67,143 @@ def test_remote_array_zarr() -> None:
     assert data_array.shape == (2391, 2077, 2077)
 
 
+def test_downsample_levels(local_dataset: Dataset) -> None:
+    assert local_dataset.downsample_levels == [0, 1, 2]
+
+
+def test_data_tree(local_dataset: Dataset) -> None:
+    tree = local_dataset.data_tree()
+    assert tree.name == local_dataset.name
+    assert list(tree.children) == ["0", "1", "2"]
+    for level in range(LOCAL_LEVELS):
+        node = tree[f"{level}"]
+        assert node.attrs["downsample_level"] == level
+        assert (
+            node.attrs["voxel_size_um"] == local_dataset.data.voxel_size_um * 2**level
+        )
+
+        data_array = node[local_dataset.name]
+        # Data is only fetched once it is accessed
+        assert isinstance(data_array.data, dask.array.Array)
+        xr.testing.assert_identical(
+            data_array.variable,
+            local_dataset.data_array(downsample_level=level).variable,
+        )
+        np.testing.assert_equal(data_array.values, local_data(level))
+        np.testing.assert_equal(
+            data_array.coords["x"].values,
+            local_dataset.data_array(downsample_level=level).coords["x"].values,
+        )
+
+
+def test_data_array_chunks(local_dataset: Dataset) -> None:
+    # One storage chunk per task by default
+    data_array = local_dataset.data_array(downsample_level=0)
+    assert data_array.chunks == ((8, 8, 8), (8, 8, 8, 8, 1), (16, 16, 8))
+    np.testing.assert_equal(data_array.values, local_data(0))
+
+    data_array = local_dataset.data_array(downsample_level=0, storage_chunks_per_task=2)
+    assert data_array.chunks == ((16, 8), (16, 16, 1), (32, 8))
+    np.testing.assert_equal(data_array.values, local_data(0))
+
+    data_array = local_dataset.data_array(
+        downsample_level=0, storage_chunks_per_task=(1, 2, 3)
+    )
+    assert data_array.chunks == ((8, 8, 8), (16, 16, 1), (40,))
+
+    # Tasks are never smaller than a single storage chunk
+    data_array = local_dataset.data_array(downsample_level=0, task_bytes=1)
+    assert data_array.chunks == ((8, 8, 8), (8, 8, 8, 8, 1), (16, 16, 8))
+
+    # Storage chunks are 2 kB, so up to 8 storage chunks fit in each task
+    data_array = local_dataset.data_array(downsample_level=0, task_bytes=2**14)
+    assert data_array.chunks == ((16, 8), (16, 16, 1), (32, 8))
+    np.testing.assert_equal(data_array.values, local_data(0))
+
+    # Axes that fit in a single task leave more storage chunks for other axes
+    data_array = local_dataset.data_array(downsample_level=0, task_bytes=36 * 2**11)
+    assert data_array.chunks == ((24,), (32, 1), (40,))
+
+
+def test_data_array_indexing(local_dataset: Dataset) -> None:
+    data_array = local_dataset.data_array(downsample_level=0)
+    data = local_data(0)
+    for key in [
+        (3, slice(None), slice(None)),
+        (slice(2, 20, 3), -1, slice(None, None, -2)),
+        (slice(5, 5), slice(None), 0),
+    ]:
+        np.testing.assert_equal(data_array[key].values, data[key])
+
+
+def test_data_array_chunks_invalid(local_dataset: Dataset) -> None:
+    with pytest.raises(ValueError, match="Only one of"):
+        local_dataset.data_array(
+            downsample_level=0, storage_chunks_per_task=2, task_bytes=2**20
+        )
+    with pytest.raises(ValueError, match="must be a positive integer"):
+        local_dataset.data_array(downsample_level=0, storage_chunks_per_task=0)
+
+
+def test_get_slice(local_dataset: Dataset, monkeypatch: pytest.MonkeyPatch) -> None:
+    for axis, index in [("z", 0), ("y", 9), ("x", 19), ("z", -1), ("x", -20)]:
+        xr.testing.assert_identical(
+            local_dataset.get_slice(axis=axis, index=index, downsample_level=1),
+            local_dataset.data_array(downsample_level=1).isel({axis: index}).compute(),
+        )
+
+    # Planes that intersect the same chunks are read from the chunk cache
+    def read_chunk(*args: object) -> None:
+        raise AssertionError
+
+    local_dataset.get_slice(axis="z", index=0, downsample_level=0)
+    with monkeypatch.context() as m:
+        m.setattr(LevelArray, "read_chunk", read_chunk)
+        np.testing.assert_equal(
+            local_dataset.get_slice(axis="z", index=7, downsample_level=0).values,
+            local_data(0)[7],
+        )
+        with pytest.raises(AssertionError):
+            local_dataset.get_slice(axis="z", index=8, downsample_level=0)
+
+        # The cache is shared by level arrays opened again for the same store
+        del local_dataset.__dict__["_levels"]
+        local_dataset.get_slice(axis="z", index=7, downsample_level=0)
+
+    # Chunks of planes that don't all fit in the cache together are not cached.
+    # A z plane at level 0 intersects 15 chunks, and the cache holds 4
+    hoa_tools.storage.set_chunk_cache_bytes(4 * np.prod(LOCAL_CHUNKS) * 2)
+    np.testing.assert_equal(
+        local_dataset.get_slice(
+            axis="z", index=0, downsample_level=0, max_workers=1
+        ).values,
+        local_data(0)[0],
+    )
+    with monkeypatch.context() as m:
+        m.setattr(LevelArray, "read_chunk", read_chunk)
+        with pytest.raises(AssertionError):
+            local_dataset.get_slice(axis="z", index=7, downsample_level=0)
+
+    # No chunks are cached with a cache size of 0
+    hoa_tools.storage.set_chunk_cache_bytes(0)
+    local_dataset.get_slice(axis="z", index=0, downsample_level=1)
+    with monkeypatch.context() as m:
+        m.setattr(LevelArray, "read_chunk", read_chunk)
+        with pytest.raises(AssertionError):
+            local_dataset.get_slice(axis="z", index=0, downsample_level=1)
+
+
+def test_get_slice_invalid(local_dataset: Dataset) -> None:
+    with pytest.raises(ValueError, match="axis must be"):
+        local_dataset.get_slice(axis="t", index=0, downsample_level=0)  # type: ignore[arg-type]
+    with pytest.raises(ValueError, match="Downsample level 5 is not available"):
+        local_dataset.get_slice(axis="z", index=0, downsample_level=5)
+    with pytest.raises(IndexError, match="index 24 is out of bounds for axis z"):
+        local_dataset.get_slice(axis="z", index=24, downsample_level=0)
+    with pytest.raises(IndexError, match="index -25 is out of bounds for axis z"):
+        local_dataset.get_slice(axis="z", index=-25, downsample_level=0)
+
+
 def test_invalid_level(dataset: Dataset) -> None:
     with pytest.raises(ValueError, match=re.escape("level must be >= 0")):
         dataset.data_array(downsample_level=-1)  # type: ignore[arg-type]
@@ -75,3 +220,28 @@ def test_update_datasets_error(tmp_path: Path) -> None:
         FileNotFoundError, match="Did not find any dataset metadata files at"
     ):
         change_metadata_directory(tmp_path)
+
+
+# Dependencies that should only be imported once remote data is accessed
+LAZY_IMPORTS = ["SimpleITK", "dask", "gcsfs", "networkx", "pandas", "xarray", "zarr"]
+IMPORT_TIME_BUDGET_S = 1.0
+
+
+def test_import_time() -> None:
+    code = (
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        "from hoa_tools.dataset import get_dataset\n"
+        "get_dataset('LADAF-2020-27_spleen_complete-organ_25.08um_bm05').name\n"
+        "print(time.perf_counter() - start)\n"
+        f"print(','.join(m for m in {LAZY_IMPORTS!r} if m in sys.modules))\n"
+    )
+    result = subprocess.run(  # noqa: S603
+        [sys.executable, "-W", "ignore", "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    import_time, loaded = result.stdout.splitlines()
+    assert loaded == ""
+    assert float(import_time) < IMPORT_TIME_BUDGET_S
@@ -0,0 +1,61 @@
+import json
+
+import numpy as np
+import pytest
+import zarr
+from fsspec.implementations.asyn_wrapper import AsyncFileSystemWrapper
+from fsspec.implementations.memory import MemoryFileSystem
+
+from hoa_tools._n5 import N5ChunkWrapper, N5FSStore
+
+
+@pytest.fixture
+def n5_group() -> zarr.Group:
+    fs = MemoryFileSystem()
+    fs.pipe(
+        "/bucket/data/attributes.json",
+        json.dumps({"n5": "2.0.0"}).encode(),
+    )
+    fs.pipe(
+        "/bucket/data/s0/attributes.json",
+        json.dumps(
+            {
+                "dimensions": [4, 3, 2],
+                "blockSize": [2, 2, 2],
+                "dataType": "uint16",
+                "compression": {"type": "gzip", "level": 1},
+            }
+        ).encode(),
+    )
+    store = N5FSStore(
+        fs=AsyncFileSystemWrapper(fs, asynchronous=True), path="/bucket", read_only=True
+    )
+    return zarr.open_group(store, mode="r", path="data", zarr_format=2)
+
+
+def test_open_array(n5_group: zarr.Group) -> None:
+    array = n5_group["s0"]
+    assert array.shape == (2, 3, 4)
+    assert array.chunks == (2, 2, 2)
+
+
+def test_missing_array(n5_group: zarr.Group) -> None:
+    with pytest.raises(KeyError):
+        n5_group["s1"]
+
+
+@pytest.mark.parametrize("compressor_config", [None, {"id": "gzip", "level": 1}])
+def test_decode_edge_chunk(compressor_config: dict[str, object] | None) -> None:
+    codec = N5ChunkWrapper(
+        "uint16", chunk_shape=(2, 2, 2), compressor_config=compressor_config
+    )
+    data = np.arange(4, dtype=np.uint16).reshape(1, 2, 2)
+    # Chunks at the edge of an array are stored without padding
+    decoded = codec.decode(codec.encode(data))
+    expected = np.zeros((2, 2, 2), dtype=np.uint16)
+    expected[:1] = data
+    np.testing.assert_equal(decoded, expected)
+    assert decoded.dtype == np.uint16
+
+    full = np.arange(8, dtype=np.uint16).reshape(2, 2, 2)
+    np.testing.assert_equal(codec.decode(codec.encode(full)).reshape(2, 2, 2), full)
@@ -1,9 +1,20 @@
+import pickle
+import re
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
 import pytest
+import SimpleITK as sitk
+import zarr
+from conftest import LOCAL_LEVELS, LOCAL_SHAPE
 
 import hoa_tools.dataset
 import hoa_tools.registration
 import hoa_tools.voi
-from hoa_tools.types import ArrayCoordinate
+from hoa_tools._transforms import transform_points
+from hoa_tools.types import ArrayCoordinate, PhysicalCoordinate
 
 
 def test_transform_voi() -> None:
@@ -117,3 +128,392 @@ def test_transform_zoom_to_zoom() -> None:
     )
 
     voi.transform_to(zoom2)
+
+
+def test_transform_vois() -> None:
+    overview = hoa_tools.dataset.get_dataset(
+        "S-20-29_brain_complete-organ_25.33um_bm05"
+    )
+    child = hoa_tools.dataset.get_dataset("S-20-29_brain_VOI-04_6.5um_bm05")
+    vois = [
+        hoa_tools.voi.VOI(
+            dataset=child,
+            downsample_level=level,
+            lower_corner=ArrayCoordinate(x=3434 // 2**level, y=2060, z=2656),
+            size=ArrayCoordinate(x=256, y=256, z=128),
+        )
+        for level in [0, 1, 2]
+    ]
+
+    overview_vois = hoa_tools.voi.transform_vois_to(vois, overview)
+    assert overview_vois[0].lower_corner == ArrayCoordinate(x=2975, y=1689, z=4316)
+    assert overview_vois[0].size == ArrayCoordinate(x=69, y=69, z=33)
+
+    # Compare with transforming each corner individually
+    transform = hoa_tools.registration.Inventory.get_registration(
+        source_dataset=child, target_dataset=overview
+    )
+    for voi, overview_voi in zip(vois, overview_vois, strict=True):
+        corners = [
+            c.to_physical_coordinate(voxel_size=child.data.voxel_size_um)
+            .transform(transform)
+            .to_array_coordinate(voxel_size=overview.data.voxel_size_um)
+            for c in voi.change_downsample_level(new_downsample_level=0).corners
+        ]
+        assert overview_voi.lower_corner == ArrayCoordinate(
+            x=min(c.x for c in corners),
+            y=min(c.y for c in corners),
+            z=min(c.z for c in corners),
+        )
+
+
+def test_transform_points_composite() -> None:
+    transform = sitk.CompositeTransform(3)
+    transform.AddTransform(sitk.TranslationTransform(3, (1, 2, 3)))
+    transform.AddTransform(
+        hoa_tools.registration.build_transform(
+            translation=PhysicalCoordinate(x=4, y=5, z=6), rotation_deg=30, scale=2
+        )
+    )
+    points = np.array([[0, 0, 0], [1, 2, 3], [-10.5, 20.25, 7]])
+    np.testing.assert_allclose(
+        transform_points(transform, points),
+        [transform.TransformPoint(p) for p in points.tolist()],
+    )
+
+
+def test_registration_cache() -> None:
+    d1 = hoa_tools.dataset.get_dataset("S-20-29_brain_VOI-04_6.5um_bm05")
+    d2 = hoa_tools.dataset.get_dataset("S-20-29_brain_complete-organ_25.33um_bm05")
+    d3 = hoa_tools.dataset.get_dataset("S-20-29_brain_VOI-05_6.5um_bm05")
+    inventory = hoa_tools.registration.RegistrationInventory()
+    inventory.add_registration(
+        source_dataset=d1,
+        target_dataset=d2,
+        transform=sitk.TranslationTransform(3, (1, 0, 0)),
+    )
+    inventory.add_registration(
+        source_dataset=d2,
+        target_dataset=d3,
+        transform=sitk.TranslationTransform(3, (0, 1, 0)),
+    )
+
+    transform = inventory.get_registration(source_dataset=d1, target_dataset=d3)
+    assert inventory.get_registration(source_dataset=d1, target_dataset=d3) is transform
+    inverse = inventory.get_inverse_registration(source_dataset=d1, target_dataset=d3)
+    assert (
+        inventory.get_inverse_registration(source_dataset=d1, target_dataset=d3)
+        is inverse
+    )
+    assert inverse.TransformPoint((0, 0, 0)) == (-1, -1, 0)
+
+    # Adding a registration invalidates the cache
+    inventory.add_registration(
+        source_dataset=d1,
+        target_dataset=d2,
+        transform=sitk.TranslationTransform(3, (0, 0, 1)),
+    )
+    transform = inventory.get_registration(source_dataset=d1, target_dataset=d3)
+    assert transform.TransformPoint((0, 0, 0)) == (0, 1, 1)
+    inverse = inventory.get_inverse_registration(source_dataset=d1, target_dataset=d3)
+    assert inverse.TransformPoint((0, 0, 0)) == (0, -1, -1)
+
+    inventory._clear()  # noqa: SLF001
+    with pytest.raises(ValueError, match="No registration path"):
+        inventory.get_registration(source_dataset=d1, target_dataset=d3)
+
+
+def test_flattened_registration() -> None:
+    zoom1 = hoa_tools.dataset.get_dataset("S-20-29_brain_VOI-04_6.5um_bm05")
+    overview = hoa_tools.dataset.get_dataset(
+        "S-20-29_brain_complete-organ_25.33um_bm05"
+    )
+    zoom2 = hoa_tools.dataset.get_dataset("S-20-29_brain_VOI-05_6.5um_bm05")
+    inventory = hoa_tools.registration.Inventory
+
+    point = (1000.0, 2000.0, 3000.0)
+    # Map the point one registration at a time
+    expected = inventory.get_registration(
+        source_dataset=overview, target_dataset=zoom2
+    ).TransformPoint(
+        inventory.get_registration(
+            source_dataset=zoom1, target_dataset=overview
+        ).TransformPoint(point)
+    )
+
+    transform = inventory.get_registration(source_dataset=zoom1, target_dataset=zoom2)
+    np.testing.assert_allclose(transform.TransformPoint(point), expected)
+
+    flat_transform = inventory.get_registration(
+        source_dataset=zoom1, target_dataset=zoom2, flatten=True
+    )
+    assert isinstance(flat_transform, sitk.AffineTransform)
+    np.testing.assert_allclose(flat_transform.TransformPoint(point), expected)
+
+    matrix = inventory.get_affine_matrix(source_dataset=zoom1, target_dataset=zoom2)
+    assert matrix.shape == (4, 4)
+    np.testing.assert_allclose((matrix @ [*point, 1])[:3], expected)
+
+    inverse = inventory.get_inverse_registration(
+        source_dataset=zoom1, target_dataset=zoom2, flatten=True
+    )
+    np.testing.assert_allclose(inverse.TransformPoint(expected), point)
+
+
+def test_transform_points() -> None:
+    zoom = hoa_tools.dataset.get_dataset("S-20-29_brain_VOI-04_6.5um_bm05")
+    overview = hoa_tools.dataset.get_dataset(
+        "S-20-29_brain_complete-organ_25.33um_bm05"
+    )
+    inventory = hoa_tools.registration.Inventory
+    transform = inventory.get_registration(source_dataset=zoom, target_dataset=overview)
+    rng = np.random.default_rng(seed=1)
+    points = rng.uniform(0, 20000, size=(100, 3))
+
+    transformed = inventory.transform_points(
+        points, source_dataset=zoom, target_dataset=overview
+    )
+    np.testing.assert_allclose(
+        transformed, [transform.TransformPoint(p) for p in points.tolist()]
+    )
+
+    out = np.zeros_like(points)
+    inventory.transform_points(
+        points / zoom.data.voxel_size_um,
+        source_dataset=zoom,
+        target_dataset=overview,
+        space="array",
+        chunk_size=7,
+        out=out,
+    )
+    np.testing.assert_allclose(out, transformed / overview.data.voxel_size_um)
+
+    with pytest.raises(ValueError, match=re.escape("points must have shape (N, 3)")):
+        inventory.transform_points(
+            points[:, :2], source_dataset=zoom, target_dataset=overview
+        )
+    with pytest.raises(ValueError, match="chunk_size must be >= 1, got -1"):
+        inventory.transform_points(
+            points, source_dataset=zoom, target_dataset=overview, chunk_size=-1
+        )
+    with pytest.raises(ValueError, match=re.escape("out must have shape (100, 3)")):
+        inventory.transform_points(
+            points, source_dataset=zoom, target_dataset=overview, out=out[:10]
+        )
+    with pytest.raises(ValueError, match="got shape .* and dtype float32"):
+        inventory.transform_points(
+            points,
+            source_dataset=zoom,
+            target_dataset=overview,
+            out=out.astype(np.float32),
+        )
+
+
+def test_registration_components() -> None:
+    d1, d2, d3, d4 = (
+        hoa_tools.dataset.get_dataset(name)
+        for name in [
+            "S-20-29_brain_VOI-04_6.5um_bm05",
+            "S-20-29_brain_complete-organ_25.33um_bm05",
+            "S-20-29_brain_VOI-05_6.5um_bm05",
+            "S-20-29_brain_VOI-03_6.5um_bm05",
+        ]
+    )
+    inventory = hoa_tools.registration.RegistrationInventory()
+    assert (d1, d1) not in inventory
+
+    inventory.add_registration(
+        source_dataset=d1, target_dataset=d2, transform=sitk.TranslationTransform(3)
+    )
+    inventory.add_registration(
+        source_dataset=d3, target_dataset=d4, transform=sitk.TranslationTransform(3)
+    )
+    assert (d1, d2) in inventory
+    assert (d2, d1) in inventory
+    assert (d1, d3) not in inventory
+    assert inventory._get_component(d1.name) == {d1.name, d2.name}  # noqa: SLF001
+
+    # Join the two components
+    inventory.add_registration(
+        source_dataset=d4, target_dataset=d2, transform=sitk.TranslationTransform(3)
+    )
+    assert (d1, d3) in inventory
+    assert inventory._get_component(d3.name) == {  # noqa: SLF001
+        d1.name,
+        d2.name,
+        d3.name,
+        d4.name,
+    }
+
+    inventory._clear()  # noqa: SLF001
+    assert (d1, d2) not in inventory
+
+
+def test_lazy_population() -> None:
+    zoom = hoa_tools.dataset.get_dataset("S-20-29_brain_VOI-04_6.5um_bm05")
+    overview = hoa_tools.dataset.get_dataset(
+        "S-20-29_brain_complete-organ_25.33um_bm05"
+    )
+    inventory = hoa_tools.registration.RegistrationInventory(from_metadata=True)
+    # Nothing is built until the inventory is first used
+    assert inventory._graph.number_of_nodes() == 0  # noqa: SLF001
+
+    assert (zoom, overview) in inventory
+    # Inverses are only built when an edge is traversed backwards
+    assert inventory._graph[overview.name][zoom.name]["transform"] is None  # noqa: SLF001
+    inventory.get_registration(source_dataset=overview, target_dataset=zoom)
+    assert inventory._graph[overview.name][zoom.name]["transform"] is not None  # noqa: SLF001
+
+    # Changing the available datasets re-populates the inventory
+    hoa_tools.dataset.change_metadata_directory(hoa_tools.dataset._META_DIR)  # noqa: SLF001
+    assert (zoom, overview) in inventory
+    assert inventory._graph[overview.name][zoom.name]["transform"] is None  # noqa: SLF001
+
+
+def test_concurrent_population(monkeypatch: pytest.MonkeyPatch) -> None:
+    zoom = hoa_tools.dataset.get_dataset("S-20-29_brain_VOI-04_6.5um_bm05")
+    overview = hoa_tools.dataset.get_dataset(
+        "S-20-29_brain_complete-organ_25.33um_bm05"
+    )
+    inventory = hoa_tools.registration.RegistrationInventory(from_metadata=True)
+    add_edges = inventory._add_edges  # noqa: SLF001
+
+    def slow_add_edges(*args: object) -> None:
+        # Make it likely that other threads query a partially populated inventory
+        time.sleep(0.001)
+        add_edges(*args)  # type: ignore[arg-type]
+
+    monkeypatch.setattr(inventory, "_add_edges", slow_add_edges)
+
+    found = []
+
+    def query() -> None:
+        found.append((zoom, overview) in inventory)
+
+    threads = [threading.Thread(target=query) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert found == [True] * len(threads)
+
+
+def test_inventory_serialization(tmp_path: Path) -> None:
+    inventory = hoa_tools.registration.Inventory
+    zoom = hoa_tools.dataset.get_dataset("S-20-29_brain_VOI-04_6.5um_bm05")
+    overview = hoa_tools.dataset.get_dataset(
+        "S-20-29_brain_complete-organ_25.33um_bm05"
+    )
+    point = (1000.0, 2000.0, 3000.0)
+    expected = inventory.get_registration(
+        source_dataset=zoom, target_dataset=overview
+    ).TransformPoint(point)
+    expected_inverse = inventory.get_registration(
+        source_dataset=overview, target_dataset=zoom
+    ).TransformPoint(point)
+
+    arrays = inventory.to_arrays()
+    assert len(arrays["source"]) == inventory._graph.number_of_edges() // 2  # noqa: SLF001
+
+    inventory.save(tmp_path / "registrations.npz")
+    pickled = pickle.dumps(inventory)
+    for loaded in [
+        hoa_tools.registration.RegistrationInventory.from_arrays(arrays),
+        hoa_tools.registration.RegistrationInventory.load(
+            tmp_path / "registrations.npz"
+        ),
+        pickle.loads(pickled),  # noqa: S301
+    ]:
+        assert (zoom, overview) in loaded
+        np.testing.assert_allclose(
+            loaded.get_registration(
+                source_dataset=zoom, target_dataset=overview
+            ).TransformPoint(point),
+            expected,
+        )
+        np.testing.assert_allclose(
+            loaded.get_registration(
+                source_dataset=overview, target_dataset=zoom
+            ).TransformPoint(point),
+            expected_inverse,
+        )
+
+
+def test_inventory_serialization_composite() -> None:
+    d1 = hoa_tools.dataset.get_dataset("S-20-29_brain_VOI-04_6.5um_bm05")
+    d2 = hoa_tools.dataset.get_dataset("S-20-29_brain_complete-organ_25.33um_bm05")
+    inventory = hoa_tools.registration.RegistrationInventory()
+    inventory.add_registration(
+        source_dataset=d1, target_dataset=d2, transform=sitk.CompositeTransform(3)
+    )
+    with pytest.raises(ValueError, match="Cannot export composite transform"):
+        inventory.to_arrays()
+
+
+def _write_smooth_data(dataset: hoa_tools.dataset.Dataset) -> None:
+    """
+    Replace the data in a local dataset with a few smooth blobs.
+    """
+    z, y, x = np.meshgrid(*[np.arange(s) for s in LOCAL_SHAPE], indexing="ij")
+    data = np.zeros(LOCAL_SHAPE)
+    for cz, cy, cx, width in [(8, 12, 14, 4), (15, 20, 25, 5), (12, 10, 28, 3)]:
+        data += np.exp(
+            -((z - cz) ** 2 + (y - cy) ** 2 + (x - cx) ** 2) / (2 * width**2)
+        )
+    data = (data / data.max() * 60000).astype(np.uint16)
+    group = zarr.open_group(
+        dataset._new_remote_store(),  # noqa: SLF001
+        mode="r+",
+        zarr_format=2,
+    )
+    for level in range(LOCAL_LEVELS):
+        array = group[dataset._level_key(level)]  # noqa: SLF001
+        level_data = data[:: 2**level, :: 2**level, :: 2**level]
+        if dataset._remote_fmt == "zarr":  # noqa: SLF001
+            level_data = level_data.T
+        array[:] = level_data
+
+
+def test_refine_registration(local_dataset: hoa_tools.dataset.Dataset) -> None:
+    _write_smooth_data(local_dataset)
+    voxel_size = local_dataset.data.voxel_size_um
+    source_voi = hoa_tools.voi.VOI(
+        dataset=local_dataset,
+        downsample_level=0,
+        lower_corner=ArrayCoordinate(x=8, y=8, z=4),
+        size=ArrayCoordinate(x=24, y=18, z=16),
+    )
+    target_voi = hoa_tools.voi.VOI(
+        dataset=local_dataset,
+        downsample_level=0,
+        lower_corner=ArrayCoordinate(x=0, y=0, z=0),
+        size=ArrayCoordinate(x=40, y=33, z=24),
+    )
+    # Start one voxel away from the correct (identity) transform
+    initial_transform = sitk.TranslationTransform(
+        3, (voxel_size, -voxel_size, voxel_size)
+    )
+    transform = hoa_tools.registration.refine_registration(
+        source_voi, target_voi, initial_transform=initial_transform
+    )
+    assert isinstance(transform, sitk.Similarity3DTransform)
+
+    points = np.array([[6, 12, 16], [12, 16, 20]]) * voxel_size
+    np.testing.assert_allclose(
+        transform_points(transform, points), points, atol=0.1 * voxel_size
+    )
+
+
+def test_refine_registration_too_small(
+    local_dataset: hoa_tools.dataset.Dataset,
+) -> None:
+    voi = hoa_tools.voi.VOI(
+        dataset=local_dataset,
+        downsample_level=0,
+        lower_corner=ArrayCoordinate(x=0, y=0, z=0),
+        size=ArrayCoordinate(x=4, y=4, z=4),
+    )
+    with pytest.raises(ValueError, match="VOIs are too small"):
+        hoa_tools.registration.refine_registration(
+            voi, voi, initial_transform=sitk.TranslationTransform(3)
+        )
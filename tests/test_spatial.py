@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+import hoa_tools.registration
+from hoa_tools.dataset import get_dataset
+from hoa_tools.spatial import SpatialIndex
+from hoa_tools.types import PhysicalCoordinate
+
+
+@pytest.fixture(scope="module")
+def index() -> SpatialIndex:
+    return SpatialIndex()
+
+
+def test_query_point(index: SpatialIndex) -> None:
+    overview = get_dataset("S-20-29_brain_complete-organ_25.33um_bm05")
+    zoom = get_dataset("S-20-29_brain_VOI-04_6.5um_bm05")
+
+    # Centre of the zoom dataset, in (z, y, x) order
+    y, x, z = zoom.data.shape
+    centre = np.array([[z, y, x]]) / 2 * zoom.data.voxel_size_um
+    centre = hoa_tools.registration.Inventory.transform_points(
+        centre, source_dataset=zoom, target_dataset=overview
+    )[0]
+    point = PhysicalCoordinate(z=centre[0], y=centre[1], x=centre[2])
+
+    datasets = index.query_point(point, dataset=overview)
+    assert zoom in datasets
+    assert overview in datasets
+    # Sorted from smallest to largest voxel size
+    assert datasets[-1] == overview
+    assert all(
+        d.data.voxel_size_um < overview.data.voxel_size_um for d in datasets[:-1]
+    )
+
+    # Query the same point from the zoom dataset
+    voxel_size = zoom.data.voxel_size_um
+    assert datasets == index.query_point(
+        PhysicalCoordinate(
+            x=x / 2 * voxel_size, y=y / 2 * voxel_size, z=z / 2 * voxel_size
+        ),
+        dataset=zoom,
+    )
+
+    assert index.query_point(PhysicalCoordinate(x=-1, y=0, z=0), dataset=overview) == []
+
+
+def test_query_box(index: SpatialIndex) -> None:
+    overview = get_dataset("S-20-29_brain_complete-organ_25.33um_bm05")
+    big = 1e9
+    datasets = index.query_box(
+        PhysicalCoordinate(x=-big, y=-big, z=-big),
+        PhysicalCoordinate(x=big, y=big, z=big),
+        dataset=overview,
+    )
+    assert set(datasets) == overview.get_registered()
+
+    assert (
+        index.query_box(
+            PhysicalCoordinate(x=-2, y=-2, z=-2),
+            PhysicalCoordinate(x=-1, y=-1, z=-1),
+            dataset=overview,
+        )
+        == []
+    )
+
+
+def test_not_indexed() -> None:
+    index = SpatialIndex([get_dataset("S-20-29_brain_complete-organ_25.33um_bm05")])
+    with pytest.raises(ValueError, match="is not in the spatial index"):
+        index.query_point(
+            PhysicalCoordinate(x=0, y=0, z=0),
+            dataset=get_dataset("S-20-29_brain_VOI-04_6.5um_bm05"),
+        )
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+from conftest import local_data
+
+from hoa_tools._chunks import LevelArray
+from hoa_tools.dataset import Dataset
+from hoa_tools.statistics import Statistics, get_statistics
+
+
+def test_get_statistics(
+    local_dataset: Dataset, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    stats = get_statistics(local_dataset, downsample_level=1, max_workers=2)
+    data = local_data(1)
+    assert stats.dataset == local_dataset.name
+    assert stats.downsample_level == 1
+    assert stats.count == data.size
+    assert (stats.min, stats.max) == (data.min(), data.max())
+    assert stats.mean == pytest.approx(data.mean())
+    assert stats.std == pytest.approx(data.std())
+    # One histogram bin per value
+    assert stats.histogram.bin_range == (0, 2**16)
+    np.testing.assert_equal(
+        stats.histogram.counts, np.bincount(data.ravel(), minlength=2**16)
+    )
+    for q in [0, 0.01, 0.5, 0.99, 1]:
+        assert stats.quantile(q) == pytest.approx(
+            np.quantile(data, q, method="inverted_cdf"), abs=1
+        )
+
+    # Statistics are cached, unless the histogram bins are different
+    def map_chunks(*args: object, **kwargs: object) -> None:
+        raise AssertionError
+
+    with monkeypatch.context() as m:
+        m.setattr(LevelArray, "map_chunks", map_chunks)
+        assert get_statistics(local_dataset, downsample_level=1) == stats
+        with pytest.raises(AssertionError):
+            get_statistics(local_dataset, downsample_level=1, recompute=True)
+
+    stats = get_statistics(
+        local_dataset, downsample_level=1, value_range=(0, 2**15), n_bins=8
+    )
+    # Bins don't include their upper edge
+    in_range = data[data < 2**15]
+    np.testing.assert_equal(
+        stats.histogram.counts, np.histogram(in_range, bins=8, range=(0, 2**15))[0]
+    )
+    assert stats.histogram.n_above == np.count_nonzero(data >= 2**15)
+    assert stats.quantile(1) == data.max()
+
+
+def test_merge() -> None:
+    rng = np.random.default_rng(seed=0)
+    data = rng.normal(size=1000)
+    data[:10] = np.nan
+
+    whole = Statistics.from_array(data, bin_range=(-1, 1), n_bins=10)
+    merged = Statistics.from_array(data[:300], bin_range=(-1, 1), n_bins=10).merge(
+        Statistics.from_array(data[300:], bin_range=(-1, 1), n_bins=10)
+    )
+    values = data[10:]
+    assert merged.count == whole.count == values.size
+    assert merged.min == whole.min == values.min()
+    assert merged.mean == pytest.approx(whole.mean)
+    assert merged.mean == pytest.approx(values.mean())
+    assert merged.variance == pytest.approx(values.var())
+    assert merged.histogram == whole.histogram
+    assert merged.histogram.n_below == np.count_nonzero(values < -1)
+    assert merged.quantile(0.5) == pytest.approx(np.median(values), abs=0.2)
+
+    empty = Statistics.from_array(np.array([]), bin_range=(-1, 1), n_bins=10)
+    assert empty.merge(whole) == whole
+    with pytest.raises(ValueError, match="no values"):
+        empty.quantile(0.5)
+    with pytest.raises(ValueError, match="different histogram bins"):
+        whole.merge(Statistics.from_array(data, bin_range=(-1, 1), n_bins=5))
@@ -0,0 +1,283 @@
+import asyncio
+import json
+import shutil
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import pytest
+import zarr
+import zarr.storage
+from conftest import clear_cached_properties
+from fsspec.asyn import AsyncFileSystem
+
+import hoa_tools.storage
+from hoa_tools.dataset import get_dataset
+from hoa_tools.storage import (
+    ManagedFileSystem,
+    RequestPolicy,
+    _cache_metadata,
+    add_mirror,
+    clear_metadata_cache,
+    clear_mirrors,
+    get_mirrors,
+    prefill_metadata_cache,
+    resolve_url,
+)
+
+
+class FakeFileSystem(AsyncFileSystem):  # type: ignore[misc]
+    """
+    In-memory async filesystem that can add latency and failures to requests.
+    """
+
+    cachable = False
+
+    def __init__(self, files: dict[str, bytes]) -> None:
+        """
+        Create a filesystem containing some files, keyed by path.
+        """
+        super().__init__(asynchronous=True)
+        self.files = files
+        # Number of times requests for each path fail before succeeding
+        self.failures: Counter[str] = Counter()
+        # Latency of each request for each path, in order
+        self.latencies: dict[str, list[float]] = {}
+        self.requests: Counter[str] = Counter()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def _cat_file(
+        self, path: str, start: int | None = None, end: int | None = None, **_: Any
+    ) -> bytes:
+        self.requests[path] += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            latencies = self.latencies.get(path, [])
+            await asyncio.sleep(latencies.pop(0) if latencies else 0.001)
+            if self.failures[path] > 0:
+                self.failures[path] -= 1
+                raise ConnectionError(path)
+            if path not in self.files:
+                raise FileNotFoundError(path)
+            return self.files[path][start:end]
+        finally:
+            self.in_flight -= 1
+
+    async def _info(self, path: str, **_: Any) -> dict[str, Any]:
+        if path not in self.files:
+            raise FileNotFoundError(path)
+        return {"name": path, "size": len(self.files[path]), "type": "file"}
+
+
+def _cat_files(fs: ManagedFileSystem, paths: list[str]) -> list[bytes]:
+    async def cat_files() -> list[bytes]:
+        return await asyncio.gather(*[fs._cat_file(path) for path in paths])  # noqa: SLF001
+
+    return asyncio.run(cat_files())
+
+
+def test_retries() -> None:
+    fake = FakeFileSystem({"a": b"data"})
+    fs = ManagedFileSystem(
+        fake, policy=RequestPolicy(max_attempts=3, backoff_initial_s=0.001)
+    )
+    fake.failures["a"] = 2
+    assert _cat_files(fs, ["a"]) == [b"data"]
+    assert fake.requests["a"] == 3
+
+    fake.failures["a"] = 3
+    with pytest.raises(ConnectionError):
+        _cat_files(fs, ["a"])
+    assert fake.requests["a"] == 6
+
+    # Missing files are not retried
+    with pytest.raises(FileNotFoundError):
+        _cat_files(fs, ["b"])
+    assert fake.requests["b"] == 1
+
+
+def test_max_concurrency() -> None:
+    files = {f"{i}": bytes([i]) for i in range(50)}
+    fake = FakeFileSystem(files)
+    fs = ManagedFileSystem(fake, policy=RequestPolicy(max_concurrency=4))
+    assert _cat_files(fs, list(files)) == list(files.values())
+    assert fake.max_in_flight == 4
+
+    # Filesystems with the same policy share the limit
+    other_fs = ManagedFileSystem(fake, policy=RequestPolicy(max_concurrency=4))
+
+    async def cat_files() -> None:
+        await asyncio.gather(
+            *[f._cat_file(path) for path in files for f in [fs, other_fs]]  # noqa: SLF001
+        )
+
+    fake.max_in_flight = 0
+    asyncio.run(cat_files())
+    assert fake.max_in_flight == 4
+
+
+def test_hedging() -> None:
+    files = {f"{i}": bytes([i]) for i in range(20)}
+    fake = FakeFileSystem({**files, "slow": b"slow"})
+    fs = ManagedFileSystem(
+        fake, policy=RequestPolicy(hedge_quantile=0.9, hedge_min_samples=10)
+    )
+    fake.latencies["slow"] = [10, 0.001]
+
+    async def cat_files() -> bytes:
+        # Requests that are quick, to learn the typical latency
+        await asyncio.gather(*[fs._cat_file(path) for path in files])  # noqa: SLF001
+        return await fs._cat_file("slow")  # noqa: SLF001
+
+    start = time.perf_counter()
+    assert asyncio.run(cat_files()) == b"slow"
+    assert time.perf_counter() - start < 1
+    # The slow request was duplicated, and the duplicate returned first
+    assert fake.requests["slow"] == 2
+    assert all(fake.requests[path] == 1 for path in files)
+
+
+def test_zarr_store() -> None:
+    data = np.arange(1000, dtype=np.uint16).reshape(10, 10, 10)
+    memory_store = zarr.storage.MemoryStore()
+    zarr.create_array(memory_store, data=data, chunks=(4, 4, 4), zarr_format=2)
+    files = {
+        f"/array/{key}": value.to_bytes()
+        for key, value in memory_store._store_dict.items()  # noqa: SLF001
+    }
+
+    fake = FakeFileSystem(files)
+    for path in files:
+        fake.failures[path] = 1
+    fs = ManagedFileSystem(fake, policy=RequestPolicy(backoff_initial_s=0.001))
+    store = zarr.storage.FsspecStore(fs=fs, path="/array", read_only=True)
+    np.testing.assert_equal(zarr.open_array(store, mode="r", zarr_format=2)[:], data)
+
+
+def test_mirrors(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(hoa_tools.storage, "_MIRRORS", [])
+    dataset = get_dataset("A186_lung_right_complete-organ_24.132um_bm18")
+    url = dataset.data.gcs_url.removeprefix("zarr://")
+    assert resolve_url(url) == (
+        url,
+        {"project": "ucl-hip-ct", "token": "anon", "access": "read_only"},
+    )
+
+    # Local copy of the dataset, stored in (x, y, z) order
+    data = np.arange(24, dtype=np.uint16).reshape(2, 3, 4)
+    local_url = url.replace("gs://", f"{tmp_path}/")
+    group = zarr.open_group(local_url, mode="w", zarr_format=2)
+    group.create_array("0", data=data.T)
+
+    # Mirrors that don't contain a copy are skipped
+    add_mirror("gs://", "memory://empty/")
+    add_mirror("gs://", f"{tmp_path}/")
+    assert [m.root for m in get_mirrors()] == ["memory://empty/", f"{tmp_path}/"]
+    assert resolve_url(url) == (local_url, {})
+
+    clear_cached_properties(dataset)
+    try:
+        assert dataset.downsample_levels == [0]
+        np.testing.assert_equal(dataset.data_array(downsample_level=0).values, data)
+    finally:
+        clear_cached_properties(dataset)
+
+
+class CountingStore(zarr.storage.WrapperStore[zarr.storage.MemoryStore]):
+    """
+    Store that records the keys read from another store.
+    """
+
+    def __init__(self, store: zarr.storage.MemoryStore) -> None:
+        """
+        Wrap a store, which must be read-only so zarr doesn't re-wrap it.
+        """
+        super().__init__(store)
+        self.keys: list[str] = []
+
+    async def get(self, key: str, *args: Any, **kwargs: Any) -> Any:
+        """
+        Get a value, recording its key.
+        """
+        self.keys.append(key)
+        return await super().get(key, *args, **kwargs)
+
+
+def test_metadata_cache(metadata_cache_dir: Path) -> None:
+    data = np.arange(1000, dtype=np.uint16).reshape(10, 10, 10)
+    memory_store = zarr.storage.MemoryStore()
+    group = zarr.open_group(memory_store, mode="w", zarr_format=2)
+    group.create_array("0", data=data, chunks=(10, 10, 10))
+
+    def open_array(url: str) -> tuple[list[str], np.ndarray]:
+        store = CountingStore(memory_store.with_read_only(read_only=True))
+        group = zarr.open_group(
+            _cache_metadata(store, name="dataset", url=url), mode="r", zarr_format=2
+        )
+        with pytest.raises(KeyError):
+            group["1"]
+        return store.keys, group["0"][:]
+
+    keys, values = open_array("url")
+    np.testing.assert_equal(values, data)
+    assert ".zgroup" in keys
+    assert "1/.zarray" in keys
+    # Nothing is written until the cache is flushed
+    cache_path = metadata_cache_dir / "dataset.json"
+    assert not cache_path.exists()
+    hoa_tools.storage._flush_metadata_caches()  # noqa: SLF001
+    saved = json.loads(cache_path.read_text())
+    assert saved["url"] == "url"
+    assert saved["documents"]["1/.zarray"] is None
+
+    # Only chunks are read once the metadata is cached, even in a new process
+    hoa_tools.storage._METADATA_CACHES.clear()  # noqa: SLF001
+    keys, values = open_array("url")
+    np.testing.assert_equal(values, data)
+    assert keys == ["0/0.0.0"]
+
+    # Metadata cached from a different URL is not used
+    assert len(open_array("other_url")[0]) > 1
+
+    hoa_tools.storage._flush_metadata_caches()  # noqa: SLF001
+    clear_metadata_cache()
+    assert not list(metadata_cache_dir.iterdir())
+    assert len(open_array("other_url")[0]) > 1
+
+
+def test_prefill_metadata_cache(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, metadata_cache_dir: Path
+) -> None:
+    monkeypatch.setattr(hoa_tools.storage, "_MIRRORS", [])
+    dataset = get_dataset("A186_lung_right_complete-organ_24.132um_bm18")
+    url = dataset.data.gcs_url.removeprefix("zarr://")
+    local_url = url.replace("gs://", f"{tmp_path}/")
+    group = zarr.open_group(local_url, mode="w", zarr_format=2)
+    group.create_array("0", shape=(4, 3, 2), dtype=np.uint16)
+    add_mirror("gs://", f"{tmp_path}/")
+
+    clear_cached_properties(dataset)
+    try:
+        prefill_metadata_cache([dataset])
+        assert (metadata_cache_dir / f"{dataset.name}.json").exists()
+
+        # Metadata can be read without the local copy or the remote store
+        clear_cached_properties(dataset)
+        clear_mirrors()
+        shutil.rmtree(tmp_path / "ucl-hip-ct-35a68e99feaae8932b1d44da0358940b")
+        assert dataset.downsample_levels == [0]
+        assert dataset.data_array(downsample_level=0).shape == (2, 3, 4)
+    finally:
+        clear_cached_properties(dataset)
+
+
+def test_chunk_cache_bytes() -> None:
+    assert hoa_tools.storage.get_chunk_cache_bytes() == 2**26
+    hoa_tools.storage.set_chunk_cache_bytes(1000)
+    assert hoa_tools.storage.get_chunk_cache_bytes() == 1000
+    with pytest.raises(ValueError, match="max_bytes must be >= 0"):
+        hoa_tools.storage.set_chunk_cache_bytes(-1)
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+import SimpleITK as sitk
+
+from hoa_tools.types import (
+    ArrayCoordinate,
+    ArrayCoordinates,
+    PhysicalCoordinate,
+    PhysicalCoordinates,
+    _construct,
+)
+
+
+def test_physical_coordinates() -> None:
+    coords = [
+        PhysicalCoordinate(x=1.5, y=-2.5, z=10),
+        PhysicalCoordinate(x=100, y=7, z=0.25),
+    ]
+    collection = PhysicalCoordinates.from_coordinates(coords)
+    assert len(collection) == 2
+    np.testing.assert_equal(collection.zyx, [[10, -2.5, 1.5], [0.25, 7, 100]])
+    assert collection[1] == coords[1]
+    assert list(collection) == coords
+
+    array_coords = collection.to_array_coordinates(voxel_size=2)
+    assert list(array_coords) == [c.to_array_coordinate(voxel_size=2) for c in coords]
+
+    transform = sitk.Similarity3DTransform(2, (1, 0, 0), 0.5, (1, 2, 3), (4, 5, 6))
+    np.testing.assert_allclose(
+        collection.transform(transform).zyx,
+        [[c.z, c.y, c.x] for c in (c.transform(transform) for c in coords)],
+    )
+
+
+def test_array_coordinates() -> None:
+    coords = [ArrayCoordinate(x=1, y=2, z=3), ArrayCoordinate(x=-4, y=5, z=6)]
+    collection = ArrayCoordinates.from_coordinates(coords)
+    assert collection.zyx.dtype == np.int64
+    assert list(collection) == coords
+    assert list(collection.to_physical_coordinates(voxel_size=2.5)) == [
+        c.to_physical_coordinate(voxel_size=2.5) for c in coords
+    ]
+
+
+def test_coordinates_shape() -> None:
+    assert len(PhysicalCoordinates.from_coordinates([])) == 0
+    with pytest.raises(ValueError, match=r"must have shape \(N, 3\)"):
+        PhysicalCoordinates(np.zeros((3, 2)))
+
+
+@pytest.mark.parametrize(
+    ("cls", "values"),
+    [
+        (ArrayCoordinate, {"x": 1, "y": -2, "z": 3}),
+        (PhysicalCoordinate, {"x": 1.5, "y": -2.5, "z": 3.0}),
+    ],
+)
+def test_construct(
+    cls: type[ArrayCoordinate | PhysicalCoordinate], values: dict[str, float]
+) -> None:
+    constructed = _construct(cls, **values)
+    validated = cls(**values)
+    assert constructed == validated
+    assert constructed.model_dump() == validated.model_dump()
+    assert constructed.model_fields_set == validated.model_fields_set
+    assert repr(constructed) == repr(validated)
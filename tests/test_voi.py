@@ -1,5 +1,22 @@
-from hoa_tools.dataset import get_dataset
-from hoa_tools.voi import VOI
+import asyncio
+import itertools
+import time
+from typing import Any
+
+import numpy as np
+import pytest
+import xarray as xr
+from conftest import LOCAL_CHUNKS, LOCAL_SHAPE, local_data
+
+from hoa_tools._chunks import LevelArray
+from hoa_tools.dataset import Dataset, get_dataset
+from hoa_tools.types import ArrayCoordinate, PhysicalCoordinate, _construct
+from hoa_tools.voi import (
+    VOI,
+    get_data_arrays,
+    iter_data_arrays,
+    select_downsample_level,
+)
 
 
 def test_voi_properties() -> None:
@@ -12,3 +29,286 @@ def test_voi_properties() -> None:
     )
 
     assert voi.voxel_size_um == 100.32
+    assert voi.upper_corner == ArrayCoordinate(x=31, y=22, z=13)
+    assert voi.corners[0] == voi.lower_corner
+    assert voi.corners[-1] == voi.upper_corner
+    assert len({(c.x, c.y, c.z) for c in voi.corners}) == 8
+
+    # VOIs created internally without validation are the same as validated VOIs
+    new_voi = voi.change_downsample_level(new_downsample_level=0)
+    assert new_voi == VOI.model_validate(new_voi.model_dump())
+    assert new_voi.model_dump() == {
+        "dataset": dataset.model_dump(),
+        "downsample_level": 0,
+        "lower_corner": {"x": 4, "y": 8, "z": 12},
+        "size": {"x": 120, "y": 80, "z": 40},
+    }
+
+
+def test_construct() -> None:
+    values = {
+        "dataset": get_dataset("LADAF-2020-27_spleen_complete-organ_25.08um_bm05"),
+        "downsample_level": 1,
+        "lower_corner": _construct(ArrayCoordinate, x=1, y=2, z=3),
+        "size": _construct(ArrayCoordinate, x=30, y=20, z=10),
+    }
+    constructed = _construct(VOI, **values)
+    validated = VOI(**values)
+    assert constructed == validated
+    assert constructed.model_dump() == validated.model_dump()
+    assert constructed.model_fields_set == validated.model_fields_set
+    assert constructed.upper_corner == validated.upper_corner
+    assert constructed.corners == validated.corners
+
+
+def test_from_physical_region() -> None:
+    dataset = get_dataset("LADAF-2020-27_spleen_complete-organ_25.08um_bm05")
+    voi = VOI.from_physical_region(
+        dataset,
+        lower_corner=PhysicalCoordinate(x=100, y=200, z=300),
+        upper_corner=PhysicalCoordinate(x=1000, y=2000, z=3000),
+        downsample_level=1,
+    )
+    assert voi.downsample_level == 1
+    assert voi.lower_corner == ArrayCoordinate(x=1, y=3, z=5)
+    assert voi.size == ArrayCoordinate(x=19, y=37, z=55)
+
+
+def test_get_data_arrays(local_dataset: Dataset) -> None:
+    vois = [
+        VOI(
+            dataset=local_dataset,
+            downsample_level=0,
+            lower_corner={"x": x, "y": 3, "z": 5},
+            size={"x": 20, "y": 10, "z": 12},
+        )
+        for x in [0, 5, 30]
+    ]
+    data_arrays = get_data_arrays(vois, max_workers=2)
+    assert len(data_arrays) == len(vois)
+    for voi, data_array in zip(vois, data_arrays, strict=True):
+        xr.testing.assert_identical(data_array, voi.get_data_array().compute())
+    np.testing.assert_equal(data_arrays[0].values, local_data(0)[5:17, 3:13, 0:20])
+
+
+def test_iter_data_arrays_bounded(
+    local_dataset: Dataset, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    # One single voxel VOI in each storage chunk
+    vois = [
+        VOI(
+            dataset=local_dataset,
+            downsample_level=0,
+            lower_corner={"x": x, "y": y, "z": z},
+            size={"x": 1, "y": 1, "z": 1},
+        )
+        for z, y, x in itertools.product(
+            *[range(0, s, c) for s, c in zip(LOCAL_SHAPE, LOCAL_CHUNKS, strict=True)]
+        )
+    ]
+    read_chunk = LevelArray.read_chunk
+    n_reads = 0
+
+    def counting_read_chunk(self: LevelArray, index: Any) -> Any:
+        nonlocal n_reads
+        n_reads += 1
+        return read_chunk(self, index)
+
+    monkeypatch.setattr(LevelArray, "read_chunk", counting_read_chunk)
+    items = iter_data_arrays(vois, max_workers=2)
+    next(items)
+    # No more chunks are fetched while the first VOI is being used
+    time.sleep(0.1)
+    assert n_reads <= 4 < len(vois)
+    assert len(list(items)) == len(vois) - 1
+    assert n_reads == len(vois)
+
+
+def test_get_data_array_chunks(local_dataset: Dataset) -> None:
+    voi = VOI(
+        dataset=local_dataset,
+        downsample_level=0,
+        lower_corner={"x": 5, "y": 3, "z": 5},
+        size={"x": 20, "y": 10, "z": 12},
+    )
+    data_array = voi.get_data_array()
+    # Task boundaries line up with storage chunk boundaries
+    assert data_array.chunks == ((3, 8, 1), (5, 5), (11, 9))
+    # The graph only contains tasks for chunks that intersect the VOI
+    assert len(data_array.data.__dask_graph__()) <= data_array.data.npartitions + 1
+    np.testing.assert_equal(data_array.values, local_data(0)[5:17, 3:13, 5:25])
+    np.testing.assert_equal(
+        data_array.coords["x"].values,
+        np.arange(5, 25) * voi.voxel_size_um,
+    )
+
+    data_array = voi.get_data_array(storage_chunks_per_task=2)
+    assert data_array.chunks == ((11, 1), (10,), (20,))
+    np.testing.assert_equal(data_array.values, local_data(0)[5:17, 3:13, 5:25])
+
+
+def test_get_data_array_async(local_dataset: Dataset) -> None:
+    vois = [
+        VOI(
+            dataset=local_dataset,
+            downsample_level=level,
+            lower_corner={"x": 5, "y": 3, "z": 5},
+            size={"x": 20, "y": 10, "z": 12},
+        )
+        for level in [0, 1]
+    ]
+
+    async def get_data_arrays() -> list[xr.DataArray]:
+        return await asyncio.gather(*[voi.get_data_array_async() for voi in vois])
+
+    # Each call runs in a new event loop, with a new connection to the store
+    for _ in range(2):
+        data_arrays = asyncio.run(get_data_arrays())
+        for voi, data_array in zip(vois, data_arrays, strict=True):
+            assert isinstance(data_array.data, np.ndarray)
+            xr.testing.assert_identical(data_array, voi.get_data_array().compute())
+
+
+def test_iter_chunks_async(local_dataset: Dataset) -> None:
+    voi = VOI(
+        dataset=local_dataset,
+        downsample_level=0,
+        lower_corner={"x": 5, "y": 3, "z": 5},
+        size={"x": 20, "y": 10, "z": 12},
+    )
+
+    async def get_chunks() -> list[xr.DataArray]:
+        return [chunk async for chunk in voi.iter_chunks_async(max_concurrency=2)]
+
+    chunks = asyncio.run(get_chunks())
+    # One item per storage chunk intersecting the VOI
+    assert len(chunks) == len(voi.chunk_footprint(n_samples=0).chunk_indices)
+    xr.testing.assert_identical(
+        xr.combine_by_coords(chunks)[local_dataset.name],
+        voi.get_data_array().compute(),
+    )
+
+    async def get_first_chunk() -> xr.DataArray:
+        async for chunk in voi.iter_chunks_async():
+            return chunk
+        raise AssertionError
+
+    assert asyncio.run(get_first_chunk()).size > 0
+
+
+def test_iter_progressive(local_dataset: Dataset) -> None:
+    voi = VOI(
+        dataset=local_dataset,
+        downsample_level=0,
+        lower_corner={"x": 5, "y": 3, "z": 5},
+        size={"x": 20, "y": 10, "z": 12},
+    )
+
+    def check(items: list[tuple[VOI, xr.DataArray]], levels: list[int]) -> None:
+        assert [v.downsample_level for v, _ in items] == levels
+        for v, data_array in items:
+            assert v == voi.change_downsample_level(
+                new_downsample_level=v.downsample_level
+            )
+            xr.testing.assert_identical(data_array, v.get_data_array().compute())
+
+    check(list(voi.iter_progressive()), [2, 1, 0])
+    check(list(voi.iter_progressive(coarsest_level=1)), [1, 0])
+
+    async def iter_progressive(**kwargs: Any) -> list[tuple[VOI, xr.DataArray]]:
+        return [item async for item in voi.iter_progressive_async(**kwargs)]
+
+    check(asyncio.run(iter_progressive()), [2, 1, 0])
+    check(asyncio.run(iter_progressive(coarsest_level=0)), [0])
+
+    async def get_first() -> tuple[VOI, xr.DataArray]:
+        async for item in voi.iter_progressive_async():
+            return item
+        raise AssertionError
+
+    assert asyncio.run(get_first())[0].downsample_level == 2
+
+    items = voi.iter_progressive()
+    assert next(items)[0].downsample_level == 2
+    items.close()
+
+    with pytest.raises(ValueError, match="Downsample level 5 is not available"):
+        next(voi.change_downsample_level(new_downsample_level=5).iter_progressive())
+
+
+def test_iter_data_arrays_mixed_vois(local_dataset: Dataset) -> None:
+    vois = [
+        VOI(
+            dataset=local_dataset,
+            downsample_level=level,
+            lower_corner={"x": 0, "y": 0, "z": 0},
+            size={"x": 1, "y": 1, "z": 1},
+        )
+        for level in [0, 1]
+    ]
+    with pytest.raises(ValueError, match="All VOIs must be in the same dataset"):
+        list(iter_data_arrays(vois))
+
+
+def test_chunk_footprint(local_dataset: Dataset) -> None:
+    voi = VOI(
+        dataset=local_dataset,
+        downsample_level=0,
+        lower_corner={"x": 5, "y": 3, "z": 5},
+        size={"x": 20, "y": 10, "z": 12},
+    )
+    footprint = voi.chunk_footprint()
+    assert footprint.chunk_shape == (8, 8, 16)
+    assert footprint.n_requests == 12
+    assert footprint.chunk_indices[0] == (0, 0, 0)
+    assert footprint.chunk_indices[-1] == (2, 1, 1)
+    assert footprint.decompressed_bytes == 12 * 8 * 8 * 16 * 2
+    assert footprint.compressed_bytes is not None
+    assert footprint.compressed_bytes > 0
+    assert footprint.fraction_used == (12 * 10 * 20) / (12 * 8 * 8 * 16)
+
+    assert voi.chunk_footprint(n_samples=0).compressed_bytes is None
+
+
+def test_snap_to_chunks(local_dataset: Dataset) -> None:
+    voi = VOI(
+        dataset=local_dataset,
+        downsample_level=0,
+        lower_corner={"x": 10, "y": 4, "z": 6},
+        size={"x": 30, "y": 29, "z": 18},
+    )
+    outward = voi.snap_to_chunks()
+    assert outward.lower_corner == ArrayCoordinate(x=0, y=0, z=0)
+    assert outward.size == ArrayCoordinate(x=40, y=33, z=24)
+
+    inward = voi.snap_to_chunks(direction="inward")
+    assert inward.lower_corner == ArrayCoordinate(x=16, y=8, z=8)
+    assert inward.size == ArrayCoordinate(x=24, y=25, z=16)
+
+    small_voi = voi.model_copy(update={"size": ArrayCoordinate(x=2, y=2, z=2)})
+    with pytest.raises(ValueError, match="VOI does not contain any whole chunks"):
+        small_voi.snap_to_chunks(direction="inward")
+
+
+def test_select_downsample_level(local_dataset: Dataset) -> None:
+    voi = VOI(
+        dataset=local_dataset,
+        downsample_level=0,
+        lower_corner={"x": 0, "y": 0, "z": 0},
+        size={"x": 40, "y": 33, "z": 24},
+    )
+    assert select_downsample_level(voi) == voi
+
+    new_voi = select_downsample_level(voi, max_voxels=5000)
+    assert new_voi == voi.change_downsample_level(new_downsample_level=1)
+
+    new_voi = select_downsample_level(voi, max_bytes=20 * 10 * 6 * 2)
+    assert new_voi.downsample_level == 2
+
+    new_voi = select_downsample_level(
+        voi, min_voxel_size_um=3 * local_dataset.data.voxel_size_um
+    )
+    assert new_voi.downsample_level == 2
+
+    with pytest.raises(ValueError, match="VOI does not fit within the budget"):
+        select_downsample_level(voi, max_voxels=10)